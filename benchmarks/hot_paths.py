@@ -0,0 +1,154 @@
+"""
+Timings of the app's hot paths on synthetic snapshots, written as json so runs of
+different commits can be compared. Runs offline in a temporary data directory.
+
+    python benchmarks/hot_paths.py --rows 10000 1000000 -o bench.json
+    python benchmarks/hot_paths.py --rows 10000 --compare bench.json 2> /dev/null
+"""
+
+import argparse
+import atexit
+import datetime
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import warnings
+
+# get_data, the feather cache and the model all resolve their paths at import or call
+# time, so point them at a scratch directory before fivestar is imported
+WORKDIR = tempfile.mkdtemp(prefix='fivestar-bench-')
+atexit.register(shutil.rmtree, WORKDIR, ignore_errors=True)
+os.environ['FIVESTAR_DATA_PATH'] = f'{WORKDIR}/'
+os.environ['FIVESTAR_CACHE_PATH'] = f'{WORKDIR}/cache'
+os.environ['FIVESTAR_MODEL_REGISTRY'] = f'{WORKDIR}/models'
+# the checkout's fivestar, installed or not
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from fivestar.clusters import get_cluster_ranking, get_cluster_coords, listing_to_cluster, top_rated
+from fivestar.clusters import load_cluster_index, property_cat, str_to_price
+from fivestar.data import clear_datasets, get_data
+from fivestar.get_wordcloud import build_wordclouds, get_wordcloud, get_wordcloud_png
+from fivestar.lib import FiveStar
+from fivestar.synthetic import write_snapshot
+from fivestar.trainer import Trainer
+
+
+def timings(function, calls=1):
+    '''Wall time of every call of function(i) for i in range(calls)'''
+    times = []
+    for i in range(calls):
+        tic = time.perf_counter()
+        function(i)
+        times.append(time.perf_counter() - tic)
+    return times
+
+
+def result(rows, case, times):
+    return dict(rows=rows, case=case, calls=len(times),
+                best_ms=round(1000 * min(times), 3),
+                median_ms=round(1000 * statistics.median(times), 3))
+
+
+def bench_snapshot(rows, boroughs=None, calls=20, seed=0):
+    '''Times every hot path on one synthetic snapshot of the given size'''
+    write_snapshot(WORKDIR, rows, seed, boroughs)
+    clear_datasets()
+    results = []
+
+    def record(case, function, n=calls):
+        results.append(result(rows, case, timings(function, n)))
+        print(f'{rows:>9} {case:<28} {results[-1]["median_ms"]:>12.3f} ms')
+
+    record('get_data_csv', lambda i: get_data(cache=False), 3)
+    get_data()
+    record('get_data_cached', lambda i: get_data(), 3)
+    listings = get_data()
+
+    y = listings['review_scores_rating']
+    X = listings.drop(columns='review_scores_rating')
+    trainer = Trainer(X=X, y=y)
+    record('trainer_train', lambda i: trainer.train(), 1)
+    trainer.save_model()
+
+    features = trainer.pipeline.named_steps['features']
+    for name, transformer, columns in features.transformers_:
+        if transformer != 'drop':
+            record(f'encoder_{name}', lambda i: transformer.transform(X[columns]), 3)
+
+    record('fivestar_init', lambda i: FiveStar(), 1)
+    fs = FiveStar()
+    ids = listings['id'].sample(calls, random_state=seed).tolist()
+    record('get_listing', lambda i: fs.get_listing(ids[i]))
+    record('build_X', lambda i: fs.build_X(ids[i], {'price': 80}))
+    record('predict_on_new_values', lambda i: fs.predict_on_new_values(ids[i], {'price': 80 + i}))
+
+    load_cluster_index()
+    listing = [fs.get_listing(listing_id) for listing_id in ids]
+
+    def cluster_args(i):
+        return (listing[i]['neighbourhood_cleansed'], str_to_price(listing[i]['price']),
+                listing[i]['room_type'], listing[i]['bedrooms'])
+
+    record('get_cluster_ranking', lambda i: get_cluster_ranking(*cluster_args(i), ids[i]))
+    record('get_cluster_coords', lambda i: get_cluster_coords(*cluster_args(i)))
+    record('listing_to_cluster', lambda i: listing_to_cluster(ids[i]))
+    clusters = load_cluster_index()
+    record('top_rated', lambda i: top_rated(*cluster_args(i)[:2], property_cat(*cluster_args(i)[2:]), clusters))
+    record('get_wordcloud', lambda i: get_wordcloud(listing_to_cluster(ids[i])), min(calls, 3))
+    build_wordclouds()
+    record('get_wordcloud_png', lambda i: get_wordcloud_png(listing_to_cluster(ids[i])))
+    return results
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def compare(results, baseline_path):
+    '''Prints the median time of every case relative to a previous run'''
+    with open(baseline_path) as f:
+        baseline = {(r['rows'], r['case']): r['median_ms'] for r in json.load(f)['results']}
+    for r in results:
+        before = baseline.get((r['rows'], r['case']))
+        if before:
+            print(f"{r['rows']:>9} {r['case']:<28} {before:>12.3f} -> {r['median_ms']:>12.3f} ms"
+                  f" ({r['median_ms'] / before:.2f}x)")
+
+
+if __name__ == '__main__':
+    warnings.simplefilter('ignore')
+    parser = argparse.ArgumentParser(description='Time the hot paths on synthetic snapshots')
+    parser.add_argument('--rows', type=int, nargs='+', default=[10000])
+    parser.add_argument('--boroughs', type=int, default=None, help='limit the boroughs, hence the clusters')
+    parser.add_argument('--calls', type=int, default=20, help='calls per lookup case')
+    parser.add_argument('-o', '--output', default=None, help='json file to write the results to')
+    parser.add_argument('--compare', default=None, help='json results of a previous run')
+    args = parser.parse_args()
+    output = os.path.abspath(args.output) if args.output else None
+    baseline = os.path.abspath(args.compare) if args.compare else None
+
+    os.chdir(WORKDIR)
+    results = []
+    for rows in args.rows:
+        results += bench_snapshot(rows, args.boroughs, args.calls)
+
+    report = dict(commit=git_commit(), date=datetime.datetime.now().isoformat(timespec='seconds'),
+                  python=platform.python_version(), machine=platform.machine(), cpus=os.cpu_count(),
+                  results=results)
+    if output:
+        with open(output, 'w') as f:
+            json.dump(report, f, indent=1)
+        print(f'==> {output} MADE')
+    if baseline:
+        compare(results, baseline)
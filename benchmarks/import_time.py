@@ -0,0 +1,67 @@
+"""
+Cold-start import time of the fivestar modules (python -X importtime), checked against
+a budget. Exits with status 1 when a module is over budget or pulls in a heavy
+optional dependency it should only load on demand.
+
+    python benchmarks/import_time.py [-o imports.json]
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+# Cumulative import time budgets in ms, about twice what they take on a laptop
+BUDGETS_MS = {
+    'fivestar.records': 300,
+    'fivestar.scorer': 300,
+    'fivestar.clusters': 800,
+    'fivestar.data': 800,
+    'fivestar.lib': 1000,
+    'fivestar.get_wordcloud': 1000,
+    'fivestar.batch': 1200,
+    'fivestar.encoders': 2500,
+    'fivestar.trainer': 2500,
+}
+
+# Dependencies only the code paths using them should import
+LAZY_MODULES = ['streamlit', 'mlflow', 'gcsfs', 'google.cloud', 'category_encoders', 'wordcloud',
+                'matplotlib']
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def import_time_ms(module, runs=5):
+    '''Best cumulative import time of module over fresh interpreters, and the lazy
+    modules it loaded'''
+    check = f"import json, sys; print(json.dumps([m for m in {LAZY_MODULES!r} if m in sys.modules]))"
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [ROOT, os.getenv('PYTHONPATH')])))
+    best, loaded = None, None
+    for _ in range(runs):
+        run = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}; {check}'],
+                             capture_output=True, text=True, env=env, check=True)
+        # "import time: self [us] | cumulative | imported package", the module itself is the last line
+        line = [line for line in run.stderr.splitlines() if line.endswith(f'| {module}')][-1]
+        ms = int(line.split('|')[1]) / 1000
+        best = ms if best is None else min(best, ms)
+        loaded = json.loads(run.stdout.strip().splitlines()[-1])
+    return best, loaded
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Check the import time budget of the fivestar modules')
+    parser.add_argument('-o', '--output', default=None, help='json file to write the results to')
+    args = parser.parse_args()
+
+    results, failed = {}, False
+    for module, budget in BUDGETS_MS.items():
+        ms, loaded = import_time_ms(module)
+        over = ms > budget or bool(loaded)
+        failed |= over
+        results[module] = dict(import_ms=round(ms, 1), budget_ms=budget, lazy_modules_loaded=loaded)
+        print(f"{module:<24}{ms:>9.1f} ms / {budget} ms  {'OVER ' if over else ''}{' '.join(loaded)}")
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=1)
+    sys.exit(1 if failed else 0)
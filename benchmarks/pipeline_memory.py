@@ -0,0 +1,50 @@
+"""
+Peak memory allocated by the feature pipeline's transform on synthetic listings,
+in total and for each feature block
+
+    python benchmarks/pipeline_memory.py [n_rows]
+"""
+
+import sys
+import tracemalloc
+import warnings
+
+from fivestar.encoders import *
+from fivestar.synthetic import make_listings
+from fivestar.trainer import Trainer
+
+
+def peak_mb(function, *args):
+    tracemalloc.start()
+    function(*args)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return round(peak / 1e6, 2)
+
+
+def transform_peaks(n=50000):
+    listings = make_listings(n)
+    y = listings.pop('review_scores_rating')
+    trainer = Trainer(X=listings.copy(), y=y)
+    trainer.train()
+    features = trainer.pipeline.named_steps['features']
+
+    before = listings.copy()
+    report = dict(rows=n, input_mb=round(listings.memory_usage(deep=True).sum() / 1e6, 1),
+                  transform_peak_mb=peak_mb(features.transform, listings))
+    for name, transformer, columns in features.transformers_:
+        if transformer != 'drop':
+            report[f'{name}_peak_mb'] = peak_mb(transformer.transform, listings[columns])
+    # encoders handed a whole listings frame (as FiveStar would) must leave it untouched
+    for encoder in [AmenitiesEncoder(), AmenitiesCounter(), CancellationEncoder(), RoomTypeEncoder(),
+                    PriceRatioEncoder(), AccomodatesToRoomsRatioEncoder(), HostResponseRateEncoder(),
+                    ScoreDeltaEncoder()]:
+        encoder.transform(listings)
+    report['input_mutated'] = not listings.equals(before)
+    return report
+
+
+if __name__ == '__main__':
+    warnings.simplefilter('ignore')
+    for key, value in transform_peaks(int(sys.argv[1]) if len(sys.argv) > 1 else 50000).items():
+        print(f'{key:>24} {value}')
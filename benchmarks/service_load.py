@@ -0,0 +1,110 @@
+"""
+Local load test of the prediction service (fivestar.service) on a synthetic snapshot:
+concurrent clients post what-if predictions, with and without micro-batching, and the
+p50/p99 latency and throughput of every concurrency level are reported.
+
+    python benchmarks/service_load.py [--rows 10000] [--concurrency 1 8 64]
+                                      [--requests 2000] [-o load.json]
+"""
+
+import argparse
+import asyncio
+import atexit
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+import warnings
+
+# the snapshot, caches and model registry resolve their paths at import or call time,
+# so point them at a scratch directory before fivestar is imported
+WORKDIR = tempfile.mkdtemp(prefix='fivestar-load-')
+atexit.register(shutil.rmtree, WORKDIR, ignore_errors=True)
+os.environ['FIVESTAR_DATA_PATH'] = f'{WORKDIR}/'
+os.environ['FIVESTAR_CACHE_PATH'] = f'{WORKDIR}/cache'
+os.environ['FIVESTAR_MODEL_REGISTRY'] = f'{WORKDIR}/models'
+# the checkout's fivestar, installed or not
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+from aiohttp import ClientSession, web
+
+from fivestar.data import get_data
+from fivestar.lib import FiveStar, predictions
+from fivestar.service import MAX_BATCH, PredictionService
+from fivestar.synthetic import write_snapshot
+from fivestar.trainer import Trainer
+
+
+async def load(fivestar, listing_ids, concurrency, requests, max_batch):
+    '''Latencies in seconds of requests predictions posted by concurrency clients, the
+    wall time, and the number of model calls that served them'''
+    # every run scores its predictions afresh
+    predictions.clear()
+    service = PredictionService(fivestar, max_batch=max_batch, watch=False)
+    runner = web.AppRunner(service.app(), access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, '127.0.0.1', 0)
+    await site.start()
+    url = f'http://127.0.0.1:{runner.addresses[0][1]}/predict'
+    latencies = []
+
+    async def client(session, worker):
+        for i in range(worker, requests, concurrency):
+            body = dict(listing_id=listing_ids[i % len(listing_ids)], values={'price': 40 + i % 200})
+            tic = time.perf_counter()
+            async with session.post(url, json=body) as response:
+                await response.json()
+                assert response.status == 200
+            latencies.append(time.perf_counter() - tic)
+
+    try:
+        async with ClientSession() as session:
+            tic = time.perf_counter()
+            await asyncio.gather(*(client(session, worker) for worker in range(concurrency)))
+            wall = time.perf_counter() - tic
+    finally:
+        await runner.cleanup()
+    return latencies, wall, service.batcher.batches
+
+
+def result(case, concurrency, latencies, wall, batches):
+    return dict(case=case, concurrency=concurrency, requests=len(latencies),
+                p50_ms=round(1000 * np.percentile(latencies, 50), 3),
+                p99_ms=round(1000 * np.percentile(latencies, 99), 3),
+                throughput=round(len(latencies) / wall, 1),
+                mean_batch=round(len(latencies) / batches, 1))
+
+
+if __name__ == '__main__':
+    warnings.simplefilter('ignore')
+    parser = argparse.ArgumentParser(description='Load test the prediction service locally')
+    parser.add_argument('--rows', type=int, default=10000, help='listings in the synthetic snapshot')
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 8, 64])
+    parser.add_argument('--requests', type=int, default=2000, help='predictions per run')
+    parser.add_argument('-o', '--output', default=None, help='json file to write the results to')
+    args = parser.parse_args()
+
+    write_snapshot(WORKDIR, args.rows)
+    listings = get_data()
+    trainer = Trainer(X=listings.drop(columns='review_scores_rating'), y=listings['review_scores_rating'])
+    trainer.train()
+    trainer.save_model()
+    fivestar = FiveStar()
+    listing_ids = listings['id'].sample(min(1000, len(listings)), random_state=0).tolist()
+
+    results = []
+    print(f"{'case':<10} {'clients':>8} {'p50 ms':>10} {'p99 ms':>10} {'req/s':>10} {'batch':>7}")
+    for case, max_batch in [('unbatched', 1), ('batched', MAX_BATCH)]:
+        for concurrency in args.concurrency:
+            run = asyncio.run(load(fivestar, listing_ids, concurrency, args.requests, max_batch))
+            results.append(result(case, concurrency, *run))
+            r = results[-1]
+            print(f"{case:<10} {concurrency:>8} {r['p50_ms']:>10.2f} {r['p99_ms']:>10.2f} "
+                  f"{r['throughput']:>10.1f} {r['mean_batch']:>7.1f}")
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(dict(rows=args.rows, cpus=os.cpu_count(), results=results), f, indent=1)
+        print(f'==> {args.output} MADE')
@@ -0,0 +1,88 @@
+"""
+Chunked, multi-process scoring of a whole listings snapshot
+"""
+
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import joblib
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from fivestar.params import LISTINGS_COLUMNS
+from fivestar.registry import ModelRegistry
+
+_pipeline = None
+
+
+def read_chunks(path, chunksize=20000):
+    '''Yields a listings file chunk by chunk: csv, parquet, or feather (e.g. a get_data cache file)'''
+    if path.endswith('.parquet'):
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=chunksize):
+            yield batch.to_pandas()
+    elif path.endswith('.feather'):
+        with pa.memory_map(path) as source:
+            reader = pa.ipc.open_file(source)
+            for index in range(reader.num_record_batches):
+                yield reader.get_batch(index).to_pandas()
+    else:
+        yield from pd.read_csv(path, chunksize=chunksize, low_memory=False,
+                               usecols=lambda column: column in LISTINGS_COLUMNS)
+
+
+def load_pipeline(model_path):
+    global _pipeline
+    # memory-mapped: the workers share the pages of the model's arrays
+    _pipeline = joblib.load(model_path, mmap_mode='r')
+
+
+def score_chunk(chunk):
+    '''Listing ids and predicted review scores of one chunk, with the pipeline loaded in this process'''
+    return pd.DataFrame({'id': chunk['id'].to_numpy(), 'prediction': _pipeline.predict(chunk)})
+
+
+def score_file(input_path, output_path, model_path=None, chunksize=20000, n_jobs=None):
+    '''Scores every listing in input_path and writes ids and predictions to a parquet file,
+    with the model at model_path or else the latest registered one.
+
+    At most two chunks per worker are in flight at any time, so memory stays bounded
+    whatever the input size. Returns the number of listings scored.
+    '''
+    n_jobs = n_jobs or os.cpu_count()
+    if model_path is None:
+        registry = ModelRegistry()
+        version = registry.resolve()
+        if not registry.verify(version):
+            raise ValueError(f"{registry.artifact(version)} does not match its registered checksum")
+        model_path = registry.artifact(version)
+    writer = None
+    scored = 0
+
+    def write(predictions):
+        nonlocal writer, scored
+        table = pa.Table.from_pandas(predictions, preserve_index=False)
+        if writer is None:
+            writer = pq.ParquetWriter(output_path, table.schema)
+        writer.write_table(table)
+        scored += len(predictions)
+
+    try:
+        if n_jobs == 1:
+            load_pipeline(model_path)
+            for chunk in read_chunks(input_path, chunksize):
+                write(score_chunk(chunk))
+        else:
+            with ProcessPoolExecutor(n_jobs, initializer=load_pipeline, initargs=(model_path,)) as pool:
+                pending = deque()
+                for chunk in read_chunks(input_path, chunksize):
+                    pending.append(pool.submit(score_chunk, chunk))
+                    if len(pending) >= 2 * n_jobs:
+                        write(pending.popleft().result())
+                while pending:
+                    write(pending.popleft().result())
+    finally:
+        if writer is not None:
+            writer.close()
+    return scored
@@ -2,10 +2,12 @@
 Functions for handling clustering
 """
 
+import json
 import numpy as np
 import pandas as pd
-from fivestar.params import CLUSTER_PERCENTILES
-from fivestar.data import get_data
+from fivestar.data import load_cluster_percentiles, load_dataset, load_id_index, load_derived
+from fivestar.utils import ranking_in_sorted, parse_prices
+from fivestar.timing import timed
 
 def str_to_price(strn):
     '''The function converts a price entry from string to float and removes the $ character'''
@@ -34,121 +36,196 @@ def property_cat(ptype, psize):
     return 'large'
 
 
-def clustering(data, percentiles=CLUSTER_PERCENTILES):
-    '''Returns a dataframe containing the relevant clustering variables and a second dataframe
-    with clustering labels
-    '''
+def neighbourhood_percentiles(location, percentiles=None):
+    '''Price percentiles of a neighbourhood, from the clusters' percentiles by default'''
+    percentiles = load_cluster_percentiles() if percentiles is None else percentiles
+    if location not in percentiles:
+        raise ValueError(f"No price percentiles for {location!r}")
+    return percentiles[location]
+
+
+PRICE_CATEGORIES = np.array(['very_cheap', 'cheap', 'average', 'expensive', 'very_expensive'], dtype=object)
+
+
+def borough_percentiles(data):
+    '''Returns the 10th to 90th price percentiles of every neighbourhood in a listings dataframe'''
+    prices = parse_prices(data['price'])
+    deciles = prices.groupby(data['neighbourhood_cleansed'], observed=True).quantile(np.arange(1, 10) / 10).unstack()
+    return {neigh: row.tolist() for neigh, row in deciles.iterrows()}
+
+
+def price_categories(prices, neighbourhoods, percentiles):
+    '''Vectorized price_cat: the price category of every listing given its neighbourhood's
+    percentiles, None for the listings of a neighbourhood missing from them'''
+    table = pd.DataFrame.from_dict(percentiles, orient='index')
+    bounds = table.reindex(neighbourhoods).to_numpy(dtype=float)[:, [1, 3, 5, 7]]
+    prices = prices.to_numpy(dtype=float)
+    codes = (prices[:, None] >= bounds).sum(axis=1)
+    codes[np.isnan(prices)] = len(PRICE_CATEGORIES) - 1
+    categories = PRICE_CATEGORIES[codes]
+    categories[np.isnan(bounds).all(axis=1)] = None
+    return categories
+
 
-    columns=['location', 'price-boroughwise', 'property_type', 'review_scores_rating']
-    cluster_df = pd.DataFrame(columns=columns)
-
-    #percentiles=dict()
-    neighbourhoods = listings['neighbourhood_cleansed'].unique()
-    for neigh in neighbourhoods:
-        neigh_listings = listings[listings['neighbourhood_cleansed'] == neigh]
-        indices= neigh_listings.index.values.tolist()
-        #pctl=[]
-        #for p in range(1,10):
-        #    pctl.append(np.nanpercentile(neigh_listings['price'], 10*p))
-        #neigh_listings['price'].apply(lambda x:price_cat(x,pctl))
-        percentiles[neigh] = pctl
-        for index in indices:
-            cluster_df.loc[index,'price-boroughwise']=price_cat(neigh_listings.loc[index,'price'],pctl)
-
-
-    bedroom_convert = {0.0: 'small',
-                  1.0: 'small',
-                  2.0: 'large',
-                  3.0: 'large', 4.0: 'large',5.0: 'large',6.0: 'large',7.0: 'large',
-                   8.0: 'large',9.0: 'large',10.0: 'large',11.0: 'large',
-                   16.0: 'large',22.0: 'large'}
-    cluster_df['property_type'] =  data['bedrooms'].map(bedroom_convert)
-    cluster_df['room/apt']=data[['room_type']].applymap(lambda x: 'apartment' if x == 'Entire home/apt' else 'room')# if x == 'Private room' else 'Other'))
-
-    cluster_df['location']=data['neighbourhood_cleansed']
-
-    cluster_df['review_scores_rating']=data['review_scores_rating']
-
-    cluster_df['property_type'] = cluster_df.apply(lambda x: 'room' if x['room/apt']== 'room' else x['property_type'], axis=1)
+@timed('clusters.clustering')
+def clustering(data, percentiles=None):
+    '''Returns a dataframe containing the relevant clustering variables and the clustering label
+    of every listing. Price categories use the given borough percentiles, or the price deciles of
+    data's own neighbourhoods when percentiles is None (see borough_percentiles)
+    '''
+    if percentiles is None:
+        percentiles = borough_percentiles(data)
+
+    cluster_df = pd.DataFrame(index=data.index)
+    cluster_df['location'] = data['neighbourhood_cleansed'].astype(object)
+    cluster_df['price-boroughwise'] = price_categories(parse_prices(data['price']),
+                                                       data['neighbourhood_cleansed'], percentiles)
+    bedrooms = data['bedrooms'].to_numpy(dtype=float)
+    cluster_df['property_type'] = np.select(
+        [data['room_type'].to_numpy() != 'Entire home/apt', bedrooms < 2, bedrooms >= 2],
+        ['room', 'small', 'large'], default=None)
+    cluster_df['review_scores_rating'] = data['review_scores_rating']
     cluster_df['listing_id'] = data['id']
     cluster_df['lat'] = data['latitude']
     cluster_df['lon'] = data['longitude']
-    cluster_df=cluster_df.drop(columns='room/apt')
     cluster_df['cluster'] = "L:" + cluster_df['location'] + "_P:" + cluster_df['price-boroughwise'] + "_S:" + cluster_df['property_type']
     return cluster_df
 
 
-def user_ranking(location, price, ptype, psize, listing_id, clusters, percentiles=CLUSTER_PERCENTILES):
-    '''Takes as input a neighborhood, a price, a listing property type, the listing id and the clusters dataframe
+def save_percentiles(percentiles, path):
+    with open(path, 'w') as f:
+        json.dump(percentiles, f, indent=1)
+
+
+def load_percentiles(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def build_clusters(listings, path):
+    '''Regenerates clusters.csv and the borough percentiles it was built with (cluster_percentiles.json)
+    in the directory path, from a listings dataframe'''
+    percentiles = borough_percentiles(listings)
+    clustering(listings, percentiles).to_csv(f'{path}clusters.csv', index=False)
+    save_percentiles(percentiles, f'{path}cluster_percentiles.json')
+    return percentiles
+
+
+class ClusterIndex():
+    '''Review scores of every (location, price-boroughwise, property_type) cluster,
+    sorted once so rank, percentile and top-N queries are binary searches
+    '''
+
+    KEY = ['location', 'price-boroughwise', 'property_type']
+
+    def __init__(self, clusters):
+        scored = clusters[clusters['review_scores_rating'].notna()]
+        self.scores = {}
+        self.listing_ids = {}
+        self.averages = {}
+        for key, group in scored.groupby(self.KEY):
+            scores = group['review_scores_rating'].to_numpy(dtype=float)
+            order = np.argsort(scores, kind='stable')
+            self.scores[key] = scores[order]
+            self.listing_ids[key] = group['listing_id'].to_numpy()[order]
+            self.averages[key] = scores.mean()
+        self.listing_scores = dict(zip(scored['listing_id'], scored['review_scores_rating']))
+        self.listing_clusters = dict(zip(scored['listing_id'], zip(*(scored[column] for column in self.KEY))))
+
+    def cluster_scores(self, key):
+        '''Review scores of a cluster in ascending order'''
+        return self.scores.get(key, np.empty(0))
+
+    def average(self, key):
+        return self.averages.get(key, np.nan)
+
+    def rank(self, key, listing_id):
+        '''Percentile rank (highest score first, ties share the best rank) of a listing in a cluster,
+        NaN if the listing is not scored in that cluster (see rank_with for any score)'''
+        scores = self.cluster_scores(key)
+        if self.listing_clusters.get(listing_id) != key:
+            return np.nan
+        score = self.listing_scores[listing_id]
+        higher = len(scores) - np.searchsorted(scores, score, side='right')
+        return (higher + 1) / len(scores)
+
+    def rank_with(self, key, score):
+        '''Percentile rank a hypothetical score would get if it joined the cluster'''
+        return ranking_in_sorted(self.cluster_scores(key), score)
+
+    def top(self, key, top=10):
+        '''Ids of the best rated 1/top of the listings in a cluster, best first'''
+        listing_ids = self.listing_ids.get(key, np.empty(0, dtype=np.int64))
+        nrows = round(len(listing_ids) / top)
+        return pd.Series(listing_ids[::-1][:nrows], name='listing_id')
+
+
+def load_cluster_index():
+    '''Process-wide ClusterIndex of the clusters dataset, built once per load'''
+    return load_derived('clusters', 'cluster_index', ClusterIndex)
+
+
+@timed('clusters.user_ranking')
+def user_ranking(location, price, ptype, psize, listing_id, clusters, percentiles=None):
+    '''Takes as input a neighborhood, a price, a listing property type, the listing id and the clusters
+    dataframe (or a ClusterIndex built from it)
     returns:
     - the listing's ranking within its cluster
     - the cluster's average rating
-    - the cluster size
+    - the cluster's review scores, sorted in ascending order
     '''
+    if not isinstance(clusters, ClusterIndex):
+        clusters = ClusterIndex(clusters)
 
-    price_c=price_cat(price,percentiles[location])
-    size_c = property_cat(ptype, psize)
-
-    cluster = clusters[(clusters['location'] == location ) &  (clusters['price-boroughwise'] == price_c ) &\
-              (clusters['property_type'] == size_c )\
-            ].reset_index()
-    cluster['ranking'] = cluster['review_scores_rating'].rank(method='min',ascending=False,pct=True)
-    cluster_average = cluster['review_scores_rating'].mean()
-
-    user_rank =float(cluster[cluster['listing_id']== listing_id]['ranking'])
-    return user_rank, cluster_average, cluster['review_scores_rating']
+    key = (location, price_cat(price, neighbourhood_percentiles(location, percentiles)), property_cat(ptype, psize))
+    return clusters.rank(key, listing_id), clusters.average(key), clusters.cluster_scores(key)
 
 
+@timed('clusters.get_cluster_ranking')
 def get_cluster_ranking(location, price, ptype, psize, listing_id):
 
     # get clusters,listings etc
-    clusters = get_data('clusters')
+    clusters = load_cluster_index()
     #listings = get_data('listings')
     cl_rank, cl_average, cl_scores = user_ranking(location, price, ptype, psize, listing_id, clusters)
 
     return cl_rank, cl_average, cl_scores
 
 
-def top_rated(location, price, size, clusters, top=10, percentiles=CLUSTER_PERCENTILES):
+@timed('clusters.top_rated')
+def top_rated(location, price, size, clusters, top=10, percentiles=None):
     '''Takes as input a neighborhood, a price, a listing property type,  and the clusters dataframe
+    (or a ClusterIndex built from it)
     returns:
     - a list with the ids of the top-rated listings in the cluster
     '''
+    if not isinstance(clusters, ClusterIndex):
+        clusters = ClusterIndex(clusters)
 
-    price_c=price_cat(price,percentiles[location])
-
-    cluster = clusters[(clusters['location'] == location ) &  (clusters['price-boroughwise'] == price_c ) &\
-              (clusters['property_type'] == size )\
-            ].copy()
-    cluster['ranking'] = cluster['review_scores_rating'].rank(method='min',ascending=False)
-
-    sorted_cluster = cluster.sort_values(by='ranking')
-
-    nrows= round(cluster.shape[0]/ top)
-
-    return sorted_cluster.iloc[:nrows].listing_id
+    return clusters.top((location, price_cat(price, neighbourhood_percentiles(location, percentiles)), size), top)
 
 
 
-def cluster_selection(location, price, size, clusters, percentiles=CLUSTER_PERCENTILES):
+@timed('clusters.cluster_selection')
+def cluster_selection(location, price, size, clusters, percentiles=None):
     '''Takes as input a neighborhood, a price, a listing property type,  and the clusters dataframe
     returns:
     - the cluster to which the listings belongs
     '''
-    price_c=price_cat(price,percentiles[location])
+    price_c=price_cat(price, neighbourhood_percentiles(location, percentiles))
     cluster = clusters[(clusters['location'] == location ) &  (clusters['price-boroughwise'] == price_c ) &\
               (clusters['property_type'] == size )\
             ].copy()
     return cluster
 
 
-def cluster_coordinates(location, price, ptype, psize, clusters, percentiles=CLUSTER_PERCENTILES):
+def cluster_coordinates(location, price, ptype, psize, clusters, percentiles=None):
     '''Takes as input a neighborhood, a price, a listing property type, the clusters dataframe and the raw dataframe
     returns:
     - the geographical coordinates of all listings in the same cluster
     '''
     size_c = property_cat(ptype, psize)
-    price_c=price_cat(price,percentiles[location])
+    price_c=price_cat(price, neighbourhood_percentiles(location, percentiles))
     cluster = clusters[(clusters['location'] == location ) &  (clusters['price-boroughwise'] == price_c ) &\
               (clusters['property_type'] == size_c )\
             ].copy()
@@ -157,10 +234,11 @@ def cluster_coordinates(location, price, ptype, psize, clusters, percentiles=CLU
     coordinates = cluster[['lat','lon']]
     return coordinates
 
+@timed('clusters.get_cluster_coords')
 def get_cluster_coords(location, price, ptype, psize):
 
     # get clusters,listings etc
-    clusters = get_data('clusters')
+    clusters = load_dataset('clusters')
     #listings = get_data('listings')
     coordinates = cluster_coordinates(location, price, ptype, psize, clusters)
 
@@ -169,9 +247,10 @@ def get_cluster_coords(location, price, ptype, psize):
 
 
 
+@timed('clusters.listing_to_cluster')
 def listing_to_cluster(listing_id):
-    clusters = get_data('clusters')
-    cluster_id = clusters[clusters['listing_id']==listing_id].iloc[0]['cluster']
+    clusters = load_dataset('clusters')
+    cluster_id = clusters['cluster'].iat[load_id_index('clusters', 'listing_id')[listing_id]]
 
     return cluster_id
 
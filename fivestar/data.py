@@ -4,24 +4,100 @@ Functions for handling data stuff
 
 import numpy as np
 import pandas as pd
-from fivestar.params import BUCKET_NAME, BUCKET_TRAIN_DATA_PATH, PROJECT_NAME
-from fivestar.params import LISTINGS_COLUMNS
-from google.cloud import storage
-import gcsfs
+from fivestar.params import BUCKET_URL
+from fivestar.params import LISTINGS_COLUMNS, TEXT_COLUMNS, CACHE_PATH, DATA_PATH, CLUSTER_PERCENTILES
+from fivestar.fetch import fetch
+from fivestar.schema import parse_listings, downcast, memory_mb
+from fivestar.textstore import TextStore
+import hashlib
+import json
+import os
+import threading
+from glob import glob
 from os.path import dirname, isfile
 from pathlib import Path
 import fivestar
+from fivestar.timing import timed
 
 
-def get_data(file='listings', nrows=None, local=True, optimize=False, path=None, **kwargs):
-    """method to get the training data (or a portion of it) from google cloud bucket"""
+def cache_key(path, csv_params):
+    """Fingerprint of a csv file and the parameters it is parsed with"""
+    stat = os.stat(path)
+    fingerprint = dict(path=os.path.abspath(path), size=stat.st_size,
+                       mtime=stat.st_mtime_ns, csv_params=csv_params)
+    return hashlib.sha1(json.dumps(fingerprint, sort_keys=True, default=str).encode()).hexdigest()[:16]
+
+
+def read_csv_cached(path, csv_params, cache_path=None):
+    """Read a local csv through a feather copy of its parsed contents.
+
+    The feather file is keyed on the csv's path, size, mtime and csv_params, so
+    it is rebuilt (and stale copies of the same csv and csv_params removed) whenever
+    any of them change.
+    """
+    cache_path = cache_path or CACHE_PATH
+    # named per csv file and parse variant, then per version of them
+    stem = Path(path).stem
+    source = hashlib.sha1(os.path.abspath(path).encode()).hexdigest()[:8]
+    variant = hashlib.sha1(json.dumps(csv_params, sort_keys=True, default=str).encode()).hexdigest()[:8]
+    prefix = f"{cache_path}/{stem}-{source}-{variant}"
+    cached = f"{prefix}-{cache_key(path, csv_params)}.feather"
+    try:
+        df = pd.read_feather(cached)
+    except OSError:
+        # not cached yet, replaced by another process meanwhile, or no readable cache
+        pass
+    else:
+        # feather gives None for missing strings where the csv parser gives NaN
+        text = df.select_dtypes('object').columns
+        df[text] = df[text].where(df[text].notna(), np.nan)
+        return df
+
+    df = pd.read_csv(path, **csv_params)
+    tmp = f"{cached}.{os.getpid()}.tmp"
+    try:
+        os.makedirs(cache_path, exist_ok=True)
+        df.reset_index(drop=True).to_feather(tmp)
+        for stale in glob(f"{prefix}-*.feather"):
+            try:
+                os.remove(stale)
+            except FileNotFoundError:
+                pass
+        os.replace(tmp, cached)
+    except (ImportError, ValueError, TypeError, OSError):
+        # no pyarrow, columns feather can't store, or a read-only or full cache: keep
+        # parsing the csv
+        if isfile(tmp):
+            os.remove(tmp)
+    return df
+
+
+def data_file(filename, path=None):
+    """Local path of a dataset file, in path or DATA_PATH"""
+    if path:
+        return path + filename
+    return f"{DATA_PATH}{filename}"
+
+
+@timed('data.get_data')
+def get_data(file='listings', nrows=None, local=True, optimize=False, path=None, cache=True, parse=False,
+             text=True, refresh=False, **kwargs):
+    """method to get the training data (or a portion of it) from google cloud bucket
+
+    parse=True types the listings through fivestar.schema (prices and rates as
+    float32, t/f flags as booleans, repetitive strings and amenities as categories);
+    optimize=True parses them and downcasts every numeric column too.
+    text=False leaves out the listings' free-text columns (see load_text_store).
+    A file missing locally (or any file if local=False) is read from BUCKET_URL through
+    a cached download; refresh=True checks the bucket for a newer version.
+    """
     if file == 'listings':
         csv_params = dict(
             # index_col='id',
             parse_dates = ['host_since', 'first_review', 'last_review'],
             low_memory = False,
             nrows=nrows,
-            usecols=LISTINGS_COLUMNS,
+            usecols=LISTINGS_COLUMNS if text else [c for c in LISTINGS_COLUMNS if c not in TEXT_COLUMNS],
             )
         filename = 'listings.csv'
     elif file == 'clusters':
@@ -34,25 +110,133 @@ def get_data(file='listings', nrows=None, local=True, optimize=False, path=None,
         return None
 
 
-    if path:
-        path = path + filename
+    path = data_file(filename, path)
+    if not (local and isfile(path)):
+        # a local copy of the bucket's file, downloaded once (see fivestar.fetch)
+        path = fetch(f'{BUCKET_URL}/{filename}', refresh=refresh)
+    if cache:
+        df = read_csv_cached(path, csv_params)
     else:
-        path = f"{str(Path.home())}/code/OrthoLoess/fivestar/data/jan/{filename}"
-
-    if local and isfile(path):
-        df = pd.read_csv(path, **csv_params )
-    else:
-        # fs = gcsfs.GCSFileSystem(project='PROJECT_NAME', token='/Users/ed/code/fivestar/star-project-key.json')
-        # with fs.open(f'{BUCKET_NAME}/{BUCKET_TRAIN_DATA_PATH}/{filename}') as f:
-        #     df = pd.read_csv(f, **csv_params)
-        # file_url = f'https://data.elandamore.net/fivestar/{BUCKET_TRAIN_DATA_PATH}/{filename}'
-        path = f'gs://{BUCKET_NAME}/{BUCKET_TRAIN_DATA_PATH}/{filename}'
         df = pd.read_csv(path, **csv_params )
     if file == 'listings':
         df = df[(df['review_scores_rating'].notna()) & (df['number_of_reviews']>2)]
+    if optimize or (parse and file == 'listings'):
+        raw_mb = memory_mb(df)
+        if file == 'listings':
+            df = parse_listings(df)
+        if optimize:
+            df = downcast(df)
+        print(f"{file}: {raw_mb:.1f} MB -> {memory_mb(df):.1f} MB")
     return df
 
 
+_datasets = {}
+_derived = {}
+_text_stores = {}
+_percentiles = {}
+_datasets_lock = threading.RLock()
+_generation = 0
+
+
+def load_dataset(file='listings', **kwargs):
+    """Process-wide, load-once access to a dataset.
+
+    The first call for a (file, kwargs) pair loads it through get_data, later
+    calls reuse it. Callers get a shallow copy sharing the stored data, so adding
+    or replacing columns never leaks back into the shared frame.
+    """
+    key = (file, tuple(sorted(kwargs.items())))
+    with _datasets_lock:
+        if key not in _datasets:
+            _datasets[key] = get_data(file, **kwargs)
+    return _datasets[key].copy(deep=False)
+
+
+def load_derived(file, name, build, **kwargs):
+    """Process-wide, build-once structure derived from a dataset, e.g. an index.
+    It is dropped together with the datasets by clear_datasets."""
+    key = (file, name, tuple(sorted(kwargs.items())))
+    with _datasets_lock:
+        if key not in _derived:
+            _derived[key] = build(load_dataset(file, **kwargs))
+    return _derived[key]
+
+
+def load_id_index(file='listings', column='id', **kwargs):
+    """Process-wide hash index from the ids in a dataset column to their row
+    positions (the first row wins for duplicated ids)"""
+    def build(df):
+        ids = df[column].tolist()
+        return dict(zip(reversed(ids), range(len(ids) - 1, -1, -1)))
+    return load_derived(file, f'{column}_index', build, **kwargs)
+
+
+def load_cluster_percentiles(path=None):
+    """Process-wide borough price percentiles the clusters were built with, from the
+    cluster_percentiles.json written next to clusters.csv (see clusters.build_clusters).
+    A snapshot without one gets the London percentiles of params.CLUSTER_PERCENTILES."""
+    json_path = data_file('cluster_percentiles.json', path)
+    with _datasets_lock:
+        if json_path not in _percentiles:
+            if isfile(json_path):
+                with open(json_path) as f:
+                    _percentiles[json_path] = json.load(f)
+            else:
+                _percentiles[json_path] = CLUSTER_PERCENTILES
+    return _percentiles[json_path]
+
+
+def load_text_store(path=None, cache_path=None):
+    """Process-wide TextStore of the free-text columns of listings.csv.
+
+    It is built once per version of the csv (streamed in chunks, under
+    CACHE_PATH/text) and memory-mapped, so a process only holds its index.
+    Building it removes the older versions of the same csv only.
+    """
+    csv_path = data_file('listings.csv', path)
+    if not isfile(csv_path):
+        csv_path = fetch(f'{BUCKET_URL}/listings.csv')
+    with _datasets_lock:
+        if csv_path not in _text_stores:
+            text_path = f"{cache_path or CACHE_PATH}/text"
+            # stores are named per csv file, then per version of it
+            source = hashlib.sha1(os.path.abspath(csv_path).encode()).hexdigest()[:8]
+            store = f"{text_path}/listings-{source}-{cache_key(csv_path, TEXT_COLUMNS)}"
+            if not TextStore.exists(store):
+                os.makedirs(text_path, exist_ok=True)
+                in_use = {texts.path for texts in _text_stores.values()}
+                for stale in glob(f"{text_path}/listings-{source}-*"):
+                    if '.tmp' not in stale and os.path.splitext(stale)[0] not in in_use:
+                        os.remove(stale)
+                chunks = pd.read_csv(csv_path, usecols=['id'] + TEXT_COLUMNS, chunksize=50000)
+                TextStore.build(chunks, store)
+            _text_stores[csv_path] = TextStore(store)
+    return _text_stores[csv_path]
+
+
+def clear_datasets():
+    """Drop every loaded dataset, index and text store, the next load reads them again"""
+    global _generation
+    with _datasets_lock:
+        _datasets.clear()
+        _derived.clear()
+        _text_stores.clear()
+        _percentiles.clear()
+        _generation += 1
+
+
+def datasets_generation():
+    """Number of times the datasets were dropped: what was computed from datasets loaded
+    under another generation may not hold for the current ones"""
+    return _generation
+
+
+def warm_cache(files=('listings', 'clusters', 'wordcount'), path=None):
+    """Parse every local dataset once so later loads hit the feather cache"""
+    for file in files:
+        df = get_data(file, path=path)
+        print(f"{file}: {df.shape} cached")
+
 
 if __name__ == "__main__":
     params = dict(local=True)
@@ -1,34 +1,47 @@
 import pandas as pd
 import numpy as np
+from scipy import sparse
 from sklearn.base import BaseEstimator, TransformerMixin
 
 import fivestar
-from fivestar.utils import decode_amenities, price_tonumerical, house_prices
-from fivestar.params import KEY_AMENITIES
+from fivestar.utils import house_prices, parse_prices, parse_rates
+from fivestar.utils import amenity_tokens, amenity_column_name
+from fivestar.params import KEY_AMENITIES, STRICT_POLICIES
+from fivestar.timing import timed
 
 class AmenitiesEncoder(BaseEstimator, TransformerMixin):
 
     def __init__(self, key_amenities=KEY_AMENITIES):
         self.key_amenities = key_amenities
 
+    @timed('encoders.AmenitiesEncoder')
     def transform(self, X, y=None):
-        data = decode_amenities(X)
-        filterables = self.key_amenities
-        for item in filterables:
-            if isinstance(item, list):
-                data[''.join([i for i in item[0] if i.isalpha()])] = 0
-            else:
-                data[''.join([i for i in item if i.isalpha()])] = 0
-        encoding = data.drop(columns='amenities').copy()
-        for index,column in enumerate(encoding.columns):
-            if isinstance(filterables[index], list):
-                for item in filterables[index]:
-                    data[column] =  data[['amenities',column]].apply(
-                        lambda x: 1 if item.casefold() in x['amenities'] else 1 if x[column] == 1 else 0,
-                        axis=1)
-            else:
-                data[column] =  data[['amenities']].apply(lambda x: 1 if filterables[index].casefold() in x['amenities'] else 0, axis=1)
-        return data.drop(columns='amenities')
+        columns = [amenity_column_name(item) for item in self.key_amenities]
+        # Every alias gets one slot in the vocabulary, mapped onto the column of its key amenity
+        vocabulary = []
+        alias_rows, alias_cols = [], []
+        for index, item in enumerate(self.key_amenities):
+            for alias in (item if isinstance(item, list) else [item]):
+                alias = alias.casefold()
+                if alias not in vocabulary:
+                    vocabulary.append(alias)
+                alias_rows.append(vocabulary.index(alias))
+                alias_cols.append(index)
+        alias_to_column = sparse.csr_matrix(
+            (np.ones(len(alias_rows), dtype=np.int64), (alias_rows, alias_cols)),
+            shape=(len(vocabulary), len(columns)))
+
+        # Tokenize the column once and mark every (listing, alias) hit in a sparse matrix
+        tokens = amenity_tokens(X['amenities'])
+        codes = pd.Categorical(tokens, categories=vocabulary).codes
+        hits = codes >= 0
+        listing_to_alias = sparse.csr_matrix(
+            (np.ones(hits.sum(), dtype=np.int64), (tokens.index[hits], codes[hits])),
+            shape=(X.shape[0], len(vocabulary)))
+
+        encoded = np.zeros((X.shape[0], len(columns)), dtype=np.int64)
+        encoded[(listing_to_alias @ alias_to_column).nonzero()] = 1
+        return pd.DataFrame(encoded, index=X.index, columns=columns)
 
 
     def fit(self, X, y=None):
@@ -39,11 +52,11 @@ class AmenitiesCounter(BaseEstimator, TransformerMixin):
     def __init__(self):
         pass
 
+    @timed('encoders.AmenitiesCounter')
     def transform(self, X, y=None):
-        data = X
-        amenities = decode_amenities(data)
-        data['amenities_count'] = amenities.applymap(lambda x: len(x))
-        return data[['amenities_count']]
+        # '{a,b,c}' lists one more amenity than it has commas ('{}' counts as one, as it always has)
+        counts = X['amenities'].str.count(',') + 1
+        return pd.DataFrame({'amenities_count': counts}, index=X.index)
 
     def fit(self, X, y=None):
         return self
@@ -53,18 +66,10 @@ class CancellationEncoder(BaseEstimator, TransformerMixin):
     def __init__(self):
         pass
 
+    @timed('encoders.CancellationEncoder')
     def transform(self, X, y=None):
-        data = X
-        def recode_cancel(n):
-            if n in ('strict_14_with_grace_period','super_strict_30', 'super_strict_60', 'strict'):
-                recode = 1
-            # elif n in ('moderate','flexible'):
-            #     recode = n
-            else:
-                recode = 0
-            return recode
-        data['cancellation_strict'] = data['cancellation_policy'].map(recode_cancel)
-        return data[['cancellation_strict']]
+        strict = X['cancellation_policy'].isin(STRICT_POLICIES).astype(np.int64)
+        return pd.DataFrame({'cancellation_strict': strict}, index=X.index)
 
     def fit(self, X, y=None):
         return self
@@ -74,17 +79,10 @@ class RoomTypeEncoder(BaseEstimator, TransformerMixin):
     def __init__(self):
         pass
 
+    @timed('encoders.RoomTypeEncoder')
     def transform(self, X, y=None):
-        data = X
-
-        def recode_room(n):
-            if n == 'Entire home/apt':
-                recode = 1
-            else:
-                recode = 0
-            return recode
-        data['room_entire'] = data['room_type'].map(recode_room)
-        return data[['room_entire']]
+        entire = (X['room_type'] == 'Entire home/apt').astype(np.int64)
+        return pd.DataFrame({'room_entire': entire}, index=X.index)
 
     def fit(self, X, y=None):
         return self
@@ -94,16 +92,24 @@ class PriceRatioEncoder(BaseEstimator, TransformerMixin):
     def __init__(self):
         pass
 
+    @staticmethod
+    def ratios(X):
+        prices = parse_prices(X['price'])
+        mean_house_prices = house_prices(X)['mean_house_prices']
+        return prices / (mean_house_prices / 1e5)**2
+
+    @timed('encoders.PriceRatioEncoder')
     def transform(self, X, y=None):
-        data = X[['price']].join(house_prices(X))
-        data['price'] = price_tonumerical(X, ['price'])
-        data['price_ratio'] = (data['price'] / (data['mean_house_prices'] / 1e5)**2)
-        median = data['price_ratio'].median()
-        data['price_ratio'] = data['price_ratio'].map(lambda x: x if x > 0 else median)
-        data['price_ratio'] = np.log(data['price_ratio'])
-        return data[['price_ratio']]
+        price_ratio = self.ratios(X)
+        # ratios that can't be logged get the training median, whatever else is transformed
+        # with them (pipelines fitted before median_ existed fall back to the rows' median)
+        median = getattr(self, 'median_', None)
+        price_ratio = price_ratio.where(price_ratio > 0, price_ratio.median() if median is None else median)
+        return pd.DataFrame({'price_ratio': np.log(price_ratio)}, index=X.index)
 
     def fit(self, X, y=None):
+        price_ratio = self.ratios(X)
+        self.median_ = float(price_ratio[price_ratio > 0].median())
         return self
 
 class AccomodatesToRoomsRatioEncoder(BaseEstimator, TransformerMixin):
@@ -111,10 +117,10 @@ class AccomodatesToRoomsRatioEncoder(BaseEstimator, TransformerMixin):
     def __init__(self):
         pass
 
+    @timed('encoders.AccomodatesToRoomsRatioEncoder')
     def transform(self, X, y=None):
-        data = X
-        data['accommodates_to_rooms_ratio'] = data['accommodates'] / data['bedrooms'].map(lambda x: 1 if x == 0 else x)
-        return data[['accommodates_to_rooms_ratio']]
+        bedrooms = X['bedrooms'].where(X['bedrooms'] != 0, 1)
+        return pd.DataFrame({'accommodates_to_rooms_ratio': X['accommodates'] / bedrooms}, index=X.index)
 
     def fit(self, X, y=None):
         return self
@@ -124,17 +130,10 @@ class HostResponseRateEncoder(BaseEstimator, TransformerMixin):
     def __init__(self):
         pass
 
+    @timed('encoders.HostResponseRateEncoder')
     def transform(self, X, y=None):
-        '''This function takes as input a dataframe ...'''
-        df = X
-        def str_to_time(strn):
-            '''The function converts a price entry from string to float and removes the $ character'''
-            if type(strn)== str:
-                return float(strn.strip('%'))
-            return strn
-        for column in ['host_response_rate']:
-            df[[column]] = df[[column]].applymap(str_to_time)
-        return df[['host_response_rate']]
+        '''Converts host_response_rate from a percentage string ("95%") to a float'''
+        return pd.DataFrame({'host_response_rate': parse_rates(X['host_response_rate'])}, index=X.index)
 
     def fit(self, X, y=None):
         return self
@@ -144,9 +143,14 @@ class CategoricalColumnEncoder(BaseEstimator, TransformerMixin):
     def __init__(self):
         pass
 
+    @timed('encoders.CategoricalColumnEncoder')
     def transform(self, X, y=None):
-        X = X.applymap(lambda x: 1 if x =='t' else (0 if (x == 'f') or np.isnan(x) else x))
-        return X
+        encoded = {}
+        for column in X.columns:
+            # t/f strings, or booleans once parsed by fivestar.schema
+            values = X[column].astype(object)
+            encoded[column] = values.mask(values.isin(['t', True]), 1).mask(values.isin(['f', False]) | values.isna(), 0)
+        return pd.DataFrame(encoded, index=X.index).infer_objects()
 
     def fit(self, X, y=None):
         return self
@@ -156,21 +160,17 @@ class ScoreDeltaEncoder(BaseEstimator, TransformerMixin):
     def __init__(self):
         pass
 
+    @timed('encoders.ScoreDeltaEncoder')
     def transform(self, X, y=None, score_column='review_scores_cleanliness'):
-        data = X
-        length = data.shape[1]
         col_name = score_column[14:] + '_score_delta'
-        data[col_name] = data[score_column]\
-                                    - data[['review_scores_checkin',
-                                                'review_scores_accuracy',
-                                                'review_scores_cleanliness',
-                                                'review_scores_communication',
-                                                'review_scores_location',
-                                                'review_scores_value'
-                                               ]].mean(axis=1)
-        data[col_name] = data[[col_name]].applymap(lambda x: 0.0 if np.isnan(x) else x)
-        return data[[col_name]]
+        delta = X[score_column] - X[['review_scores_checkin',
+                                     'review_scores_accuracy',
+                                     'review_scores_cleanliness',
+                                     'review_scores_communication',
+                                     'review_scores_location',
+                                     'review_scores_value'
+                                    ]].mean(axis=1)
+        return pd.DataFrame({col_name: delta.fillna(0.0)}, index=X.index)
 
     def fit(self, X, y=None):
         return self
-
@@ -0,0 +1,96 @@
+"""
+Compiles a fitted FiveStar pipeline into a json artifact scored by fivestar.scorer
+"""
+
+import json
+import sys
+import numpy as np
+from sklearn.impute import SimpleImputer
+from sklearn.pipeline import Pipeline
+from sklearn.preprocessing import StandardScaler
+
+from fivestar.encoders import *
+from fivestar.params import BOROUGHS, PRICES
+from fivestar.registry import ModelRegistry
+from fivestar.utils import amenity_column_name
+
+
+def encoder_spec(encoder):
+    '''Scorer encoder name and parameters of a fitted feature encoder'''
+    if isinstance(encoder, AmenitiesEncoder):
+        aliases = [[alias.casefold() for alias in (item if isinstance(item, list) else [item])]
+                   for item in encoder.key_amenities]
+        return 'amenities', dict(aliases=aliases,
+                                 names=[amenity_column_name(item) for item in encoder.key_amenities])
+    if isinstance(encoder, AmenitiesCounter):
+        return 'amenity_count', {}
+    if isinstance(encoder, CategoricalColumnEncoder):
+        return 'categoricals', {}
+    if isinstance(encoder, PriceRatioEncoder):
+        return 'price_ratio', dict(house_prices=dict(zip(BOROUGHS, PRICES)),
+                                   median=getattr(encoder, 'median_', None))
+    if isinstance(encoder, CancellationEncoder):
+        return 'cancellation', {}
+    if isinstance(encoder, HostResponseRateEncoder):
+        return 'response_rate', {}
+    if isinstance(encoder, AccomodatesToRoomsRatioEncoder):
+        return 'room_ratio', {}
+    if isinstance(encoder, ScoreDeltaEncoder):
+        return 'score_delta', dict(score_column='review_scores_cleanliness',
+                                   review_columns=['review_scores_checkin', 'review_scores_accuracy',
+                                                   'review_scores_cleanliness',
+                                                   'review_scores_communication',
+                                                   'review_scores_location', 'review_scores_value'])
+    if isinstance(encoder, RoomTypeEncoder):
+        return 'room_type', {}
+    raise ValueError(f"Cannot export encoder {encoder.__class__.__name__}")
+
+
+def step_spec(step):
+    '''Scorer step of a fitted imputer or scaler'''
+    if isinstance(step, SimpleImputer):
+        return dict(step='impute', fill_values=step.statistics_.tolist())
+    if isinstance(step, StandardScaler):
+        mean = step.mean_ if step.with_mean else np.zeros(step.n_features_in_)
+        scale = step.scale_ if step.with_std else np.ones(step.n_features_in_)
+        return dict(step='scale', mean=mean.tolist(), scale=scale.tolist())
+    raise ValueError(f"Cannot export step {step.__class__.__name__}")
+
+
+def block_spec(name, transformer, columns):
+    '''Scorer block of one fitted ColumnTransformer entry'''
+    if transformer == 'passthrough':
+        return dict(name=name, columns=columns, encoder='passthrough', params={}, steps=[])
+    steps = [step for _, step in transformer.steps] if isinstance(transformer, Pipeline) else [transformer]
+    if isinstance(steps[0], (SimpleImputer, StandardScaler)):
+        encoder, params = 'passthrough', {}
+    else:
+        (encoder, params), steps = encoder_spec(steps[0]), steps[1:]
+    return dict(name=name, columns=columns, encoder=encoder, params=params,
+                steps=[step_spec(step) for step in steps])
+
+
+def export_pipeline(pipeline, path=None):
+    '''Compiles a fitted features + linear estimator pipeline into a json spec,
+    written to path when given'''
+    features, estimator = pipeline.steps[0][1], pipeline.steps[-1][1]
+    spec = dict(
+        blocks=[block_spec(name, transformer, list(columns))
+                for name, transformer, columns in features.transformers_
+                if transformer != 'drop' and len(columns)],
+        coef=np.ravel(estimator.coef_).tolist(),
+        intercept=float(np.ravel(estimator.intercept_)[0]),
+    )
+    if path:
+        with open(path, 'w') as f:
+            json.dump(spec, f)
+    return spec
+
+
+if __name__ == '__main__':
+    # a registered version, the latest by default
+    registry = ModelRegistry()
+    version = registry.resolve(sys.argv[1] if len(sys.argv) > 1 else None)
+    export_path = sys.argv[2] if len(sys.argv) > 2 else 'model.json'
+    export_pipeline(registry.load(version), export_path)
+    print(f"{version} exported to {export_path}")
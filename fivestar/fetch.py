@@ -0,0 +1,100 @@
+"""
+Local copies of remote dataset files (gs://, s3://, or any fsspec url), downloaded once
+
+    {CACHE_PATH}/remote/
+        objects/{sha256}/listings.csv   a file's content, stored under its checksum
+        refs/{sha1 of the url}.json     url -> sha256, size and the remote's version key
+
+Files are written aside and renamed into place, so processes share the cache safely.
+"""
+
+import datetime
+import hashlib
+import json
+import os
+
+from fivestar.params import CACHE_PATH
+
+# Objects checked against their checksum by this process
+_verified = set()
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def url_to_fs(url, fs=None):
+    '''Filesystem and path of a url, or url as a path of the given fsspec filesystem'''
+    if fs is not None:
+        return fs, url
+    # fsspec (and gcsfs for gs:// urls) is only needed when a file is not local
+    import fsspec
+    return fsspec.core.url_to_fs(url)
+
+
+def ref_path(url, cache_path=None):
+    return f"{cache_path or CACHE_PATH}/remote/refs/{hashlib.sha1(url.encode()).hexdigest()}.json"
+
+
+def object_path(sha256, filename, cache_path=None):
+    return f"{cache_path or CACHE_PATH}/remote/objects/{sha256}/{filename}"
+
+
+def cached(url, cache_path=None):
+    '''Local copy of url if one was fetched and matches its checksum, else None'''
+    try:
+        with open(ref_path(url, cache_path)) as f:
+            ref = json.load(f)
+    except FileNotFoundError:
+        return None
+    path = object_path(ref['sha256'], os.path.basename(url), cache_path)
+    if not os.path.isfile(path):
+        return None
+    if path not in _verified:
+        if file_sha256(path) != ref['sha256']:
+            return None
+        _verified.add(path)
+    return path
+
+
+def fetch(url, cache_path=None, fs=None, refresh=False):
+    """Local path of a remote file, downloaded on the first call only.
+
+    Later calls, from any process, reuse the copy without contacting the remote once
+    its checksum is verified. refresh=True asks the remote for the file's version and
+    downloads it again if it changed. fs is any fsspec filesystem, url a path in it
+    (by default the filesystem is found from the url's protocol).
+    """
+    local = cached(url, cache_path)
+    if local and not refresh:
+        return local
+    fs, remote = url_to_fs(url, fs)
+    ukey = fs.ukey(remote)
+    if local:
+        with open(ref_path(url, cache_path)) as f:
+            if json.load(f)['ukey'] == ukey:
+                return local
+
+    tmp = f"{ref_path(url, cache_path)}.{os.getpid()}.tmp"
+    os.makedirs(os.path.dirname(tmp), exist_ok=True)
+    try:
+        fs.get_file(remote, tmp)
+        sha256 = file_sha256(tmp)
+        local = object_path(sha256, os.path.basename(url), cache_path)
+        os.makedirs(os.path.dirname(local), exist_ok=True)
+        os.replace(tmp, local)
+    finally:
+        if os.path.isfile(tmp):
+            os.remove(tmp)
+    _verified.add(local)
+
+    ref = dict(url=url, sha256=sha256, size=os.path.getsize(local), ukey=ukey,
+               fetched=datetime.datetime.now().isoformat(timespec='seconds'))
+    with open(tmp, 'w') as f:
+        json.dump(ref, f, indent=1)
+    os.replace(tmp, ref_path(url, cache_path))
+    return local
@@ -1,29 +1,42 @@
+import time
 import streamlit as st
 import numpy as np
 import pandas as pd
-import matplotlib.pyplot as plt
-from wordcloud import WordCloud
 
 from fivestar.clusters import get_cluster_coords, get_cluster_ranking, listing_to_cluster, price_cat
-from fivestar.lib import FiveStar
-from fivestar.utils import str_to_price, cancel_policy, get_ranking
-from fivestar.get_wordcloud import get_wordcloud
-from fivestar.params import BOROUGHS, CLUSTER_PERCENTILES
+from fivestar.lib import FiveStar, predictions
+from fivestar.utils import str_to_price, cancel_policy, ranking_in_sorted, is_instant_bookable
+from fivestar.get_wordcloud import get_wordcloud_png
+from fivestar.data import load_cluster_percentiles
+from fivestar.timing import timings
+
+rerun_start = time.perf_counter()
 
 #st.beta_set_page_config(layout="wide")
 # lists for select boxes (to be replaced by imported lists/params)
-borough_list = sorted(BOROUGHS)
+# boroughs and price percentiles of the snapshot the clusters were built from
+percentiles = load_cluster_percentiles()
+borough_list = sorted(percentiles)
 ptype_list = ['Full property', 'Room']
 bedrooms_list = ['studio', '1', '2', '3+']
 price_list = ['£79 or less', '£80 - £99', '£100 - £119', '£120 - £139', '£140 or above' ]
 amenities_example = ['wifi', 'toaster', 'hangers', 'parking', 'sauna', 'swimming pool']
 
-@st.cache(allow_output_mutation=True, persist=True)
+# one FiveStar per server process: predictions are memoized by fivestar.lib itself, so
+# nothing is hashed or persisted here
+@st.cache(allow_output_mutation=True)
 def init_fivestar():
     fs = FiveStar()
     return fs
 
-fs = init_fivestar()
+try:
+    fs = init_fivestar()
+except FileNotFoundError as error:
+    # an empty model registry: say how to fill it rather than show a traceback
+    st.error(str(error))
+    st.stop()
+# a newly registered model version is served from the next rerun, without a restart
+fs.model.refresh()
 
 # title
 #st.title('Airbnb: 5 star predictor')
@@ -76,9 +89,9 @@ with map_col_left:
     map_one = get_cluster_coords(sel1, price, sel2cat, sel3cat)
 
     # plug values in below based on returned cluster
-    'Price cat: ','"', price_cat(price, CLUSTER_PERCENTILES[sel1]).replace('_', ' '), '"'
+    'Price cat: ','"', price_cat(price, percentiles[sel1]).replace('_', ' '), '"'
     map_one.shape[0], 'listings'
-    '£',int(CLUSTER_PERCENTILES[sel1][4]), '(borough avg)'
+    '£',int(percentiles[sel1][4]), '(borough avg)'
 
 # hyperlink test
 #st.markdown("""<a href="https://www.google.com/">Google</a>""", unsafe_allow_html=True,)
@@ -126,7 +139,7 @@ st.markdown(f"Your property is listed as: ** _{listing_data['name']}_ **")
 
 cluster_id = listing_to_cluster(listing_id)
 #wordcount = pd.read_csv('data/jan/word_counts2.csv')
-cloud = get_wordcloud(cluster_id)
+cloud = get_wordcloud_png(cluster_id)
 
 
 cl_rank, cl_average, cl_scores = get_cluster_ranking(listing_data['neighbourhood_cleansed'],str_to_price(listing_data['price']), \
@@ -171,10 +184,7 @@ st.markdown(f"<h2 style='text-align: left; color: rgb(255, 90, 95);'> What the t
     unsafe_allow_html=True)
 st.write('')
 
-fig, ax = plt.subplots()
-ax.imshow(cloud, interpolation="bilinear")
-ax.axis("off")
-st.pyplot(fig)
+st.image(cloud, use_column_width=True)
 
     # st.text_area('What makes visitors give great reviews', value='''
     #     It was the best of times, it was the worst of times, it was
@@ -198,11 +208,7 @@ avg_guests_accom = 55
 # sliders for model
 slide_col_left, dummy_col1, slide_col_mid, dummy_col2, slide_col_right = st.beta_columns([2.,0.1,3.,0.15,2.])
 
-@st.cache(show_spinner=False, persist=True)
-def get_cluster_averages(fs, cluster_id):
-    return fs.get_cluster_averages(cluster_id)
-
-cluster_averages = get_cluster_averages(fs, cluster_id)
+cluster_averages = fs.get_cluster_averages(cluster_id)
 left_col_spacing = '<br>'
 with slide_col_left:
     st.subheader('Averages for similar properties')
@@ -233,6 +239,14 @@ with slide_col_left:
     st.write('')
 
     st.write(f"{cluster_averages['Wifi']:1.0f}% of listings have wifi available")
+    st.markdown(left_col_spacing,
+        unsafe_allow_html=True)
+    st.write('')
+
+    amenity_options = st.multiselect('Amenities offered by similar properties',
+        fs.amenity_vocabulary, default=[a for a in amenities_example if a in fs.amenity_index])
+    for amenity, rate in fs.get_amenity_rates(cluster_id, amenity_options).items():
+        st.write(f"{rate:1.0f}% of listings offer {amenity}")
 
 
 
@@ -260,7 +274,7 @@ with slide_col_mid:
     #st.write('Strict cancellation policy:', can_strict)
 
     inst_book = st.select_slider(
-        'Instantly bookable',options=['No', 'Yes'], value='Yes' if listing_data['instant_bookable'] == 't' else 'No')
+        'Instantly bookable',options=['No', 'Yes'], value='Yes' if is_instant_bookable(listing_data['instant_bookable']) else 'No')
     st.write('')
     #st.write('Instantly bookable:', inst_book)
 
@@ -285,12 +299,11 @@ values = {
     'instant_bookable': inst_book,
     }
 
-old_score = fs.predict_on_new_values(listing_id)
-new_score = fs.predict_on_new_values(listing_id, values)
+old_score, new_score = fs.predict_on_many_values(listing_id, [{}, values])
 average_score = listing_data['review_scores_rating']
 score_delta = new_score - old_score
-old_ranking =(get_ranking(cl_scores, old_score)*100)
-new_ranking =(get_ranking(cl_scores, new_score)*100)
+old_ranking =(ranking_in_sorted(cl_scores, old_score)*100)
+new_ranking =(ranking_in_sorted(cl_scores, new_score)*100)
 ranking_delta= int(round(old_ranking - new_ranking))
 
 calculated_new = average_score + score_delta
@@ -312,6 +325,13 @@ with slide_col_right:
         st.markdown(f"Your ranking in the group of similar listings has changed by **{ranking_delta} % ** :confused: ")
     else:
         st.markdown(f"Your ranking in the group of similar listings has changed by **{ranking_delta} % ** :smiley: ")
+    st.write('')
+
+    price_values = {k: v for k, v in values.items() if k != 'price'}
+    price_curve = fs.predict_on_grid(listing_id, price=range(10, 251, 10),
+        **{k: [v] for k, v in price_values.items()})
+    price_curve['stars'] = (average_score + price_curve['score'] - old_score) / 20
+    st.line_chart(price_curve.set_index('price')['stars'])
 
 
     #st.write('New ranking:', new_ranking, '%')
@@ -323,7 +343,7 @@ with slide_col_right:
 #          columns=['a', 'b', 'c'])
 #     st.line_chart(chart_data)
 
-
-
-
-
+timings.record('app.rerun', time.perf_counter() - rerun_start)
+if st.sidebar.checkbox('Show timings'):
+    st.sidebar.text(timings.report())
+    st.sidebar.text(f"predictions memo: {predictions.info()}")
@@ -1,48 +1,130 @@
+import hashlib
+import io
+import os
+import shutil
+from functools import lru_cache
+from glob import glob
+from urllib.parse import quote
+
 import pandas as pd
-from wordcloud import WordCloud
-from fivestar.data import get_data
+from fivestar.data import load_dataset, load_derived
+from fivestar.params import CACHE_PATH
+from fivestar.timing import timed
+
+# Rendered word clouds kept in memory (PNG bytes, a few tens of kB each)
+WORDCLOUD_CACHE_SIZE = 128
+
+
+def wordcount_labels(wordcounts_df):
+    '''Cluster labels that have their own word counts'''
+    return frozenset(wordcounts_df['cluster'].dropna())
 
 
+def wordcloud_label(cluster_id):
+    '''cluster_id if word counts were calculated for it, else All: the wordcloud will then be
+    based on the word associations calculated across all clusters'''
+    if cluster_id in load_derived('wordcount', 'labels', wordcount_labels):
+        return cluster_id
+    return 'All'
+
+
+def render_wordcloud(word_counts):
+    '''WordCloud of a cluster's bigram counts (rows of the wordcount dataset)'''
+    # wordcloud pulls in matplotlib: only import it when a cloud has to be rendered
+    from wordcloud import WordCloud
+    # Turn into right format for wordcloud and create wordcloud
+    word_counts = pd.Series(word_counts['count'].to_list(), index = word_counts['quotes'].to_list())
+    return WordCloud(background_color="white",collocation_threshold=5).generate_from_frequencies(word_counts)
+
+
+@timed('wordcloud.get_wordcloud')
 def get_wordcloud(cluster_id):
 
     # the dataframe wordcounts_df contains the most common 2 words associations
-    # and associated counts for the clusters in label_list as well as
-    # across all clusters (if the cluster label for listing_id is not in this
-    # list, the wordcloud will be based on the word counts calculated across
-    # all clusters)
-    label_list = ['L:Westminster_P:very_cheap_S:room',\
-                'L:Tower Hamlets_P:very_cheap_S:room',\
-                'L:Tower Hamlets_P:cheap_S:room',\
-                'L:Camden_P:very_cheap_S:room',\
-                'L:Lambeth_P:cheap_S:room',\
-                'L:Camden_P:cheap_S:room',\
-                'L:Southwark_P:cheap_S:room',\
-                'L:Hammersmith and Fulham_P:very_cheap_S:room',\
-                'L:Southwark_P:very_cheap_S:room',\
-                'L:Lambeth_P:very_cheap_S:room',\
-                'L:Westminster_P:cheap_S:small',\
-                'L:Hackney_P:cheap_S:room',\
-                'L:Islington_P:very_cheap_S:room',\
-                'L:Kensington and Chelsea_P:very_cheap_S:room',\
-                'L:Westminster_P:cheap_S:room',\
-                'L:Islington_P:cheap_S:room',\
-                'L:Westminster_P:very_expensive_S:large',\
-                'L:Hackney_P:very_cheap_S:room',\
-                'L:Westminster_P:expensive_S:large',\
-                'L:Westminster_P:average_S:small',\
-                'L:Wandsworth_P:cheap_S:room']
-
-    wordcounts_df = get_data('wordcount')
-    # If cluster_id not in above list, set to 'All'. The wordcloud will be based
-    # on the word associations calculated across all clusters
-    if cluster_id not in label_list:
-        cluster_id = 'All'
+    # and associated counts for some clusters as well as across all clusters
+    # (if the cluster label for listing_id has no counts, the wordcloud will be
+    # based on the word counts calculated across all clusters)
+    wordcounts_df = load_dataset('wordcount')
+    cluster_id = wordcloud_label(cluster_id)
 
     # Extract word_counts from wordcl_df for cluster_id
     word_counts = wordcounts_df.loc[wordcounts_df['cluster'] == cluster_id]
+    return render_wordcloud(word_counts)
+
+
+def to_png(wordcloud):
+    buffer = io.BytesIO()
+    wordcloud.to_image().save(buffer, format='PNG', optimize=True)
+    return buffer.getvalue()
+
+
+def wordcount_fingerprint(wordcounts_df):
+    '''Hash of the word counts: rendered images are stored per version of the counts'''
+    hashes = pd.util.hash_pandas_object(wordcounts_df, index=False).to_numpy()
+    return hashlib.sha1(hashes.tobytes()).hexdigest()[:16]
+
+
+def wordcloud_dir(cache_path=None):
+    '''Directory of the PNGs rendered from the current word counts'''
+    fingerprint = load_derived('wordcount', 'fingerprint', wordcount_fingerprint)
+    return f"{cache_path or CACHE_PATH}/wordclouds/{fingerprint}"
+
+
+def make_wordcloud_dir(directory):
+    '''Creates a directory of PNGs, removing those of older word counts when it is new'''
+    if os.path.isdir(directory):
+        return
+    for stale in glob(f"{os.path.dirname(directory)}/*"):
+        shutil.rmtree(stale, ignore_errors=True)
+    os.makedirs(directory, exist_ok=True)
+
+
+def png_path(directory, label):
+    # quoted, so distinct labels never share a file
+    return f"{directory}/{quote(label, safe='')}.png"
+
+
+def write_png(path, png):
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, 'wb') as f:
+        f.write(png)
+    os.replace(tmp, path)
+
+
+@lru_cache(maxsize=WORDCLOUD_CACHE_SIZE)
+def load_wordcloud_png(directory, label):
+    '''PNG of a label's word cloud: pre-rendered on disk, or rendered (and stored) on a miss'''
+    path = png_path(directory, label)
+    if os.path.isfile(path):
+        with open(path, 'rb') as f:
+            return f.read()
+    wordcounts_df = load_dataset('wordcount')
+    png = to_png(render_wordcloud(wordcounts_df.loc[wordcounts_df['cluster'] == label]))
+    make_wordcloud_dir(directory)
+    write_png(path, png)
+    return png
+
+
+@timed('wordcloud.get_wordcloud_png')
+def get_wordcloud_png(cluster_id, cache_path=None):
+    '''Word cloud of a cluster as PNG bytes, from a bounded in-memory LRU backed by the
+    pre-rendered images (see build_wordclouds)'''
+    return load_wordcloud_png(wordcloud_dir(cache_path), wordcloud_label(cluster_id))
+
+
+def build_wordclouds(cache_path=None):
+    '''Pre-renders the word cloud of every cluster with word counts, plus All'''
+    directory = wordcloud_dir(cache_path)
+    make_wordcloud_dir(directory)
+    wordcounts_df = load_dataset('wordcount')
+    labels = wordcounts_df['cluster'].dropna().unique()
+    for label, word_counts in wordcounts_df.groupby('cluster'):
+        path = png_path(directory, label)
+        if not os.path.isfile(path):
+            write_png(path, to_png(render_wordcloud(word_counts)))
+    print(f"{len(labels)} word clouds in {directory}")
+    return directory
 
-    # Turn into right format for wordcloud and create wordcloud
-    word_counts = pd.Series(word_counts['count'].to_list(), index = word_counts['quotes'].to_list())
-    wordcloud = WordCloud(background_color="white",collocation_threshold=5).generate_from_frequencies(word_counts)
 
-    return wordcloud
+if __name__ == '__main__':
+    build_wordclouds()
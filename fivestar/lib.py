@@ -2,35 +2,57 @@
 # Copyright (C) 2018 Jean Bizot <jean@styckr.io>
 """ Main lib for FiveStar Project
 """
-import streamlit as st
 from os.path import split
 import pandas as pd
 import numpy as np
 import datetime
-from fivestar.data import get_data
+from itertools import product
+from fivestar.data import datasets_generation, load_dataset, load_id_index, load_text_store
+from fivestar.memo import MemoCache, freeze
+from fivestar.records import ListingStore
 from fivestar.params import COLUMNS
 from fivestar.model import Model
-from fivestar.utils import str_to_price, has_wifi, has_breakfast, cancel_policy_is_strict, is_instant_bookable
+from fivestar.timing import timed
+from fivestar.utils import str_to_price, cancel_policy_is_strict, is_instant_bookable, amenity_index
 
 pd.set_option('display.width', 200)
 
+# What-if scores, shared by the FiveStar instances of the process (see FiveStar.memoized_scores)
+PREDICTION_CACHE_SIZE = 10000
+predictions = MemoCache(PREDICTION_CACHE_SIZE)
+
 class FiveStar():
 
-    def __init__(self):
-        self.listings = get_data()
-        self.clusters = get_data('clusters')
-        self.model = Model().load_model()
+    @timed('fivestar.init')
+    def __init__(self, registry=None):
+        # free text stays on disk, see get_listing_text
+        self.snapshot = datasets_generation()
+        self.listings = load_dataset('listings', text=False)
+        self.clusters = load_dataset('clusters')
+        self.records = ListingStore(self.listings, load_id_index('listings', 'id', text=False))
+        self.cluster_index = load_id_index('clusters', 'listing_id')
+        self.model = Model(registry).load_model()
+        self.build_amenity_index()
         self.build_cluster_info()
 
-    @st.cache(show_spinner=False, persist=True)
+    def build_amenity_index(self):
+        """Index every amenity once so amenity questions become set intersections"""
+        self.amenity_index = amenity_index(self.listings['amenities'])
+        self.amenity_vocabulary = sorted(self.amenity_index)
+        positions = pd.Index(self.listings['id']).get_indexer(self.clusters['listing_id'])
+        clusters = self.clusters[['cluster']].assign(position=positions)[positions >= 0]
+        self.cluster_rows = {cluster: np.unique(rows) for cluster, rows in
+                             clusters.groupby('cluster')['position']}
+
+    @timed('fivestar.build_cluster_info')
     def build_cluster_info(self):
         clusters = self.clusters.set_index('listing_id').join(
             self.listings.set_index('id')[['price','review_scores_cleanliness',
-                                            'amenities','instant_bookable',
-                                            'cancellation_policy']])
+                                            'instant_bookable','cancellation_policy']])
         clusters['price'] = clusters['price'].map(str_to_price)
-        clusters['Wifi'] = clusters['amenities'].map(has_wifi)
-        clusters['Breakfast'] = clusters['amenities'].map(has_breakfast)
+        positions = pd.Index(self.listings['id']).get_indexer(clusters.index)
+        clusters['Wifi'] = np.isin(positions, self.listings_with_amenity('Wifi')).astype(int)
+        clusters['Breakfast'] = np.isin(positions, self.listings_with_amenity('Breakfast')).astype(int)
         clusters['instant_bookable'] = clusters['instant_bookable'].map(is_instant_bookable)
         clusters['cancellation_policy'] = clusters['cancellation_policy'].map(cancel_policy_is_strict)
 
@@ -39,66 +61,150 @@ class FiveStar():
         rates_per_cluster = np.round(100 * cluster_groups.sum() / cluster_groups.count())
         self.cluster_info = avgs_per_cluster.join(rates_per_cluster)
 
+    def listings_with_amenity(self, amenity):
+        """Row positions in self.listings of the listings offering an amenity"""
+        return self.amenity_index.get(amenity.casefold(), np.empty(0, dtype=np.int64))
+
+    @timed('fivestar.get_amenity_rates')
+    def get_amenity_rates(self, cluster_id, amenities):
+        """Percentage of the listings in a cluster offering each of the given amenities"""
+        cluster_rows = self.cluster_rows.get(cluster_id, np.empty(0, dtype=np.int64))
+        rates = {}
+        for amenity in amenities:
+            offering = np.intersect1d(cluster_rows, self.listings_with_amenity(amenity), assume_unique=True)
+            rates[amenity] = 100 * len(offering) / len(cluster_rows) if len(cluster_rows) else np.nan
+        return rates
+
+    @timed('fivestar.get_cluster_id')
     def get_cluster_id(self, listing_id):
-        return self.clusters[self.clusters['listing_id'] == listing_id]['cluster'].values[0]
+        return self.clusters['cluster'].iat[self.cluster_index[listing_id]]
 
+    @timed('fivestar.get_cluster_averages')
     def get_cluster_averages(self, cluster_id):
         return self.cluster_info.loc[cluster_id].to_dict()
 
-    def get_listing(self, listing_id):
-        """Look up full info for an id and return it as a dict"""
-        # print(self.listings.shape)
-        listings = self.listings
-        columns_to_keep = ['review_scores_accuracy',
-             'review_scores_cleanliness',
-             'review_scores_checkin',
-             'review_scores_communication',
-             'review_scores_location',
-             'review_scores_value',
-             'instant_bookable', 'host_identity_verified',
-             'amenities', 'price', 'neighbourhood_cleansed',
-             'host_listings_count', 'cancellation_policy',
-             'host_response_rate', 'accommodates', 'bedrooms', 'room_type',
-             ]
+    @timed('fivestar.get_listing_text')
+    def get_listing_text(self, listing_id):
+        """Free-text fields of a listing (summary, description, house rules...), read on demand"""
+        return load_text_store().get(int(listing_id))
 
+    @timed('fivestar.get_listing')
+    def get_listing(self, listing_id):
+        """Look up the model and display fields for an id and return them as a dict"""
         if listing_id:
             self.current_listing = listing_id
-            data = listings[listings['id'] == int(listing_id)].to_dict('records')
-            return data[0]
+            return self.records[int(listing_id)].to_dict()
 
     def get_coef_dict(self):
         coefs = self.model.pipeline.named_steps['rgs'].coef_
         coefs_dict = {k:v for k,v in zip(COLUMNS,coefs)}
         return coefs_dict
 
-    @st.cache(show_spinner=False, persist=True)
+    @timed('fivestar.predict_on_new_values')
     def predict_on_new_values(self, listing_id, values={}):
-        X_new = self.build_X(listing_id, values)
-        return self.model.predict(X_new)[0]
-
-    def build_X(self, listing_id, values):
-        listing_attributes = self.get_listing(listing_id)
-
-        for key, value in values.items():
-            if key == 'cancellation_policy':
-                listing_attributes[key] = 'strict' if value == 'Yes' else 'Other'
-            elif key == 'instant_bookable':
-                listing_attributes[key] = 't' if value == 'Yes' else 'f'
-            elif key == 'Wifi' or key == 'Breakfast':
-                if value == 'Yes' and key not in listing_attributes['amenities']:
-                    listing_attributes['amenities'] = listing_attributes['amenities'][:-1] + f',{key}' + '}'
-                elif value == 'No':
-                    listing_attributes['amenities'] = listing_attributes['amenities'].replace(f',{key}', '')
+        return self.predict_on_many_values(listing_id, [values])[0]
+
+    @timed('fivestar.predict_on_many_values')
+    def predict_on_many_values(self, listing_id, values_list):
+        """Score one listing under many sets of new values. Scores not memoized yet go
+        through the linear fast path when the model allows it, a single model call otherwise"""
+        def score(loaded, positions):
+            missing = [values_list[i] for i in positions]
+            fast_path = self.get_fast_path(listing_id, loaded)
+            if fast_path is not None:
+                listing = self.get_listing(listing_id)
+                return [fast_path.predict(apply_new_values(listing, values)) for values in missing]
+            return loaded[1].predict(self.build_X_batch(listing_id, missing))
+        return self.memoized_scores([(listing_id, values) for values in values_list], score)[1]
+
+    @timed('fivestar.predict_batch')
+    def predict_batch(self, requests):
+        """Score (listing_id, values) pairs of any listings, those not memoized yet with a
+        single model call. Returns the model version used and the scores"""
+        def score(loaded, positions):
+            rows = [apply_new_values(self.records[int(requests[i][0])].to_dict(), requests[i][1])
+                    for i in positions]
+            return loaded[1].predict(pd.DataFrame(rows))
+        return self.memoized_scores(requests, score)
+
+    def memoized_scores(self, requests, score):
+        """Model version and scores of (listing_id, values) pairs, from the prediction memo.
+        score((version, pipeline), positions) computes the requests at the positions missed.
+
+        Memoized scores are keyed by the data snapshot and model version they were computed
+        with, then listing and frozen values. FiveStar instances serving other snapshots or
+        versions share the memo without evicting each other's scores; those of a replaced
+        version are no longer looked up and age out of the LRU.
+        """
+        loaded = self.model.loaded
+        generation = (self.snapshot, self.model.registry.path, loaded[0])
+        keys = [(generation, int(listing_id), freeze(values)) for listing_id, values in requests]
+        scores = np.empty(len(keys))
+        missing = []
+        for i, key in enumerate(keys):
+            found, result = predictions.lookup(key)
+            if found:
+                scores[i] = result
             else:
-                listing_attributes[key] = value
-
-        listing_for_df = {k:[v] for k,v in listing_attributes.items()}
-
-        return pd.DataFrame.from_dict(listing_for_df)
-
-
-
+                missing.append(i)
+        if missing:
+            scores[missing] = score(loaded, missing)
+            for i in missing:
+                predictions.store(keys[i], scores[i])
+        return loaded[0], scores
+
+    def get_fast_path(self, listing_id, loaded=None):
+        """LinearFastPath of the listing being explored (None for non-linear models),
+        rebuilt when the listing or the model version changes"""
+        version, pipeline = loaded or self.model.loaded
+        current = getattr(self, 'fast_path', None)
+        if current is None or current[:2] != (listing_id, version):
+            current = (listing_id, version, self.model.fast_path(self.get_listing(listing_id), pipeline))
+            self.fast_path = current
+        return current[2]
+
+    @timed('fivestar.predict_on_grid')
+    def predict_on_grid(self, listing_id, **grid):
+        """Score one listing on every combination of the given values, e.g.
+        predict_on_grid(listing_id, price=range(10, 251, 10), Wifi=['No', 'Yes'])
+        Returns the grid as a dataframe with a 'score' column"""
+        values_list = value_grid(**grid)
+        scores = pd.DataFrame(values_list)
+        scores['score'] = self.predict_on_many_values(listing_id, values_list)
+        return scores
 
+    def build_X(self, listing_id, values):
+        return self.build_X_batch(listing_id, [values])
+
+    @timed('fivestar.build_X_batch')
+    def build_X_batch(self, listing_id, values_list):
+        listing = self.get_listing(listing_id)
+        rows = [apply_new_values(listing, values) for values in values_list]
+        return pd.DataFrame(rows)
+
+
+def apply_new_values(listing_attributes, values):
+    """Copy of a listing's attributes with the app's new values applied"""
+    listing_attributes = dict(listing_attributes)
+    for key, value in values.items():
+        if key == 'cancellation_policy':
+            listing_attributes[key] = 'strict' if value == 'Yes' else 'Other'
+        elif key == 'instant_bookable':
+            listing_attributes[key] = 't' if value == 'Yes' else 'f'
+        elif key == 'Wifi' or key == 'Breakfast':
+            if value == 'Yes' and key not in listing_attributes['amenities']:
+                listing_attributes['amenities'] = listing_attributes['amenities'][:-1] + f',{key}' + '}'
+            elif value == 'No':
+                listing_attributes['amenities'] = listing_attributes['amenities'].replace(f',{key}', '')
+        else:
+            listing_attributes[key] = value
+    return listing_attributes
+
+
+def value_grid(**grid):
+    """Every combination of the given values, as a list of values dicts"""
+    keys = list(grid)
+    return [dict(zip(keys, combination)) for combination in product(*grid.values())]
 
 
 
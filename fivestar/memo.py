@@ -0,0 +1,84 @@
+"""
+Bounded memo cache of computed results, the same inside and outside Streamlit
+"""
+
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+
+def freeze(value):
+    '''Hashable, order-independent version of a values dict (lists and dicts nested in it too)'''
+    if isinstance(value, dict):
+        return tuple(sorted((key, freeze(item)) for key, item in value.items()))
+    if isinstance(value, (list, tuple, set, np.ndarray)):
+        return tuple(freeze(item) for item in value)
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
+
+
+class MemoCache():
+    """Least recently used results, at most maxsize of them, with hit, miss and eviction
+    counters. Entries belong to a generation (e.g. the data snapshot and model version
+    they were computed from): moving to another generation drops them all.
+
+        scores = MemoCache(10000)
+        scores.get(key, lambda: compute(...), generation=(snapshot, model_version))
+    """
+
+    def __init__(self, maxsize=1024):
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        self.generation = None
+        self.lock = threading.Lock()
+        self.hits = self.misses = self.evictions = self.invalidations = 0
+
+    def lookup(self, key, generation=None):
+        '''(True, result) for a cached key, else (False, None)'''
+        with self.lock:
+            if generation != self.generation:
+                self.invalidate(generation)
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return True, self.entries[key]
+            self.misses += 1
+            return False, None
+
+    def store(self, key, result, generation=None):
+        with self.lock:
+            if generation != self.generation:
+                # computed from a generation that has been replaced meanwhile
+                return
+            self.entries[key] = result
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    def get(self, key, compute, generation=None):
+        found, result = self.lookup(key, generation)
+        if not found:
+            result = compute()
+            self.store(key, result, generation)
+        return result
+
+    def invalidate(self, generation=None):
+        '''Drops every entry, and moves to generation. Call with the lock held'''
+        if self.entries:
+            self.invalidations += 1
+        self.entries.clear()
+        self.generation = generation
+
+    def clear(self):
+        with self.lock:
+            self.invalidate(self.generation)
+
+    def info(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return dict(hits=self.hits, misses=self.misses, hit_rate=self.hits / lookups if lookups else None,
+                        size=len(self.entries), maxsize=self.maxsize, evictions=self.evictions,
+                        invalidations=self.invalidations)
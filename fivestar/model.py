@@ -1,14 +1,117 @@
-import joblib
+import threading
+import warnings
+
+import numpy as np
+import pandas as pd
+from fivestar.registry import ModelRegistry
+
+# Seconds between two checks of the registry by Model.watch
+MODEL_POLL_SECONDS = 10
 
 
 class Model():
+    """The registered pipeline the app serves. `loaded` holds the (version, pipeline) pair
+    and is replaced in one assignment, so a prediction that started on a version finishes
+    on it while refresh swaps in a new one.
+    """
+
+    def __init__(self, registry=None):
+        self.registry = registry or ModelRegistry()
+        self.loaded = (None, None)
+
+    @property
+    def version(self):
+        return self.loaded[0]
 
+    @property
+    def pipeline(self):
+        return self.loaded[1]
 
     def predict(self, X_new):
         y_pred = self.pipeline.predict(X_new)
         return y_pred
 
 
-    def load_model(self):
-        self.pipeline = joblib.load('model.joblib')
+    def load_model(self, version=None):
+        version = self.registry.resolve(version)
+        self.loaded = (version, self.registry.load(version))
         return self
+
+    def refresh(self):
+        """Swaps to the registry's latest version if it changed. True if it did"""
+        latest = self.registry.latest()
+        if latest is None or latest == self.version:
+            return False
+        self.load_model(latest)
+        return True
+
+    def watch(self, interval=MODEL_POLL_SECONDS):
+        """Refreshes in a daemon thread every interval seconds. A version failing to load
+        is reported and the current one kept."""
+        def poll():
+            while not stop.wait(interval):
+                try:
+                    self.refresh()
+                except Exception as error:
+                    warnings.warn(f"Keeping model {self.version}: {error}")
+        stop = threading.Event()
+        threading.Thread(target=poll, name='model-watch', daemon=True).start()
+        return stop
+
+    def fast_path(self, listing_attributes, pipeline=None):
+        """LinearFastPath for one listing, or None if the pipeline is not a linear model"""
+        pipeline = pipeline or self.pipeline
+        if LinearFastPath.supports(pipeline):
+            return LinearFastPath(pipeline, listing_attributes)
+        return None
+
+
+class LinearFastPath():
+    """Scores new values for one listing under a `features` ColumnTransformer followed by a
+    linear estimator.
+
+    The listing's feature vector is transformed once. A new set of values only re-transforms
+    the feature blocks whose input columns changed (memoized per block and input values), and
+    the score is the estimator's intercept plus its coefficients dotted with the features.
+    """
+
+    def __init__(self, pipeline, listing_attributes):
+        features, estimator = pipeline.steps[0][1], pipeline.steps[-1][1]
+        self.coef = np.ravel(estimator.coef_)
+        self.intercept = float(np.ravel(estimator.intercept_)[0])
+        self.blocks = [(name, transformer, list(columns)) for name, transformer, columns
+                       in features.transformers_ if transformer != 'drop' and len(columns)]
+        self.memo = {}
+        self.base_score = self.predict(listing_attributes)
+
+    @staticmethod
+    def supports(pipeline):
+        steps = getattr(pipeline, 'steps', [])
+        # a fitted ColumnTransformer (duck-typed so importing this module does not load sklearn)
+        return len(steps) == 2 and hasattr(steps[0][1], 'transformers_') \
+            and hasattr(steps[-1][1], 'coef_')
+
+    @staticmethod
+    def block_key(attributes, columns):
+        # NaN never equals itself, so missing values get one shared key
+        return tuple(None if pd.isna(attributes[column]) else attributes[column] for column in columns)
+
+    @staticmethod
+    def transform_block(transformer, columns, key):
+        X = pd.DataFrame([[np.nan if value is None else value for value in key]], columns=columns)
+        if transformer == 'passthrough':
+            return X.to_numpy(dtype=float)[0]
+        return np.asarray(transformer.transform(X), dtype=float)[0]
+
+    def features(self, attributes):
+        """Feature vector of a listing's attributes, as the ColumnTransformer would build it"""
+        parts = []
+        for name, transformer, columns in self.blocks:
+            key = self.block_key(attributes, columns)
+            if (name, key) not in self.memo:
+                self.memo[(name, key)] = self.transform_block(transformer, columns, key)
+            parts.append(self.memo[(name, key)])
+        return np.concatenate(parts)
+
+    def predict(self, attributes):
+        return self.intercept + self.coef @ self.features(attributes)
@@ -1,4 +1,6 @@
 
+import os
+from pathlib import Path
 
 ### GCP Storage - - - - - - - - - - - - - - - - - - - - - -
 
@@ -6,6 +8,19 @@ PROJECT_NAME = 'star-project-296512'
 BUCKET_NAME = 'data-475'
 # os.getenv('MAPBOX_API_KEY')
 BUCKET_TRAIN_DATA_PATH = 'data/jan'
+# Where get_data reads the dataset files missing locally: any fsspec url
+BUCKET_URL = os.getenv('FIVESTAR_BUCKET_URL', f"gs://{BUCKET_NAME}/{BUCKET_TRAIN_DATA_PATH}")
+
+### Local cache - - - - - - - - - - - - - - - - - - - - - -
+
+CACHE_PATH = os.getenv('FIVESTAR_CACHE_PATH', f"{str(Path.home())}/.cache/fivestar")
+
+# Directory of listings.csv, clusters.csv and word_counts2.csv
+DATA_PATH = os.getenv('FIVESTAR_DATA_PATH', f"{str(Path.home())}/code/OrthoLoess/fivestar/data/jan/")
+
+# Versioned model artifacts (see fivestar.registry), relative to the working directory by default
+MODEL_REGISTRY_PATH = os.getenv('FIVESTAR_MODEL_REGISTRY', 'models')
+
 LISTINGS_COLUMNS = ['id',
              'name',
              'summary',
@@ -72,6 +87,25 @@ LISTINGS_COLUMNS = ['id',
              'require_guest_phone_verification',
              'reviews_per_month']
 
+# Free-text fields of a listing, kept out of the app's listings (see fivestar.textstore)
+TEXT_COLUMNS = ['summary', 'space', 'description', 'neighborhood_overview', 'notes', 'transit',
+                'access', 'interaction', 'house_rules', 'host_about']
+
+# Fields of a listing used by the model or shown in the app
+RECORD_COLUMNS = ['id', 'name',
+             'review_scores_rating',
+             'review_scores_accuracy',
+             'review_scores_cleanliness',
+             'review_scores_checkin',
+             'review_scores_communication',
+             'review_scores_location',
+             'review_scores_value',
+             'instant_bookable', 'host_identity_verified',
+             'amenities', 'price', 'neighbourhood_cleansed',
+             'host_listings_count', 'cancellation_policy',
+             'host_response_rate', 'accommodates', 'bedrooms', 'room_type',
+             ]
+
 KEY_AMENITIES = [['Free parking on premises', 'free street parking',
                   'paid parking on premises' ,'paid parking off premises'],
                 'Wifi', 'Breakfast'
@@ -80,6 +114,8 @@ KEY_AMENITIES = [['Free parking on premises', 'free street parking',
                 # ['Smoke alarm','Smoke detector']
                 ]
 
+STRICT_POLICIES = ('strict_14_with_grace_period', 'super_strict_30', 'super_strict_60', 'strict')
+
 PRICES = [950760, 301518,667593,357779,578705,502623,1099876,399645,
          578110,463806,462820,614955,972231,683987,527206,387535,
          452272,507876,778290,2092485,573938,616126,475142,638519,
@@ -0,0 +1,48 @@
+"""
+Compact per-listing records, looked up by listing id
+"""
+
+import numpy as np
+from fivestar.params import RECORD_COLUMNS
+
+
+class ListingRecord():
+    """Model and display fields of a single listing"""
+
+    __slots__ = RECORD_COLUMNS
+
+    def __init__(self, **fields):
+        for key, value in fields.items():
+            setattr(self, key, value)
+
+    def __getitem__(self, key):
+        return getattr(self, key)
+
+    def get(self, key, default=None):
+        return getattr(self, key, default)
+
+    def to_dict(self):
+        return {key: getattr(self, key) for key in self.__slots__}
+
+
+class ListingStore():
+    """Record fields of every listing kept as one array per column, with a hash
+    index from listing id to row position"""
+
+    def __init__(self, listings, index):
+        self.index = index
+        self.columns = {column: listings[column].to_numpy() for column in RECORD_COLUMNS}
+
+    def __len__(self):
+        return len(self.index)
+
+    def __contains__(self, listing_id):
+        return listing_id in self.index
+
+    def __getitem__(self, listing_id):
+        position = self.index[listing_id]
+        fields = {}
+        for column, values in self.columns.items():
+            value = values[position]
+            fields[column] = value.item() if isinstance(value, np.generic) else value
+        return ListingRecord(**fields)
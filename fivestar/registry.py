@@ -0,0 +1,180 @@
+"""
+Local registry of the trained models: versioned artifacts with their checksum and metadata
+
+    models/
+        LATEST                  version served by the app
+        v0001/model.joblib
+        v0001/metadata.json     version, sha256, size, created, scikit-learn version, and
+                                what the trainer recorded (estimator, params, metrics)
+
+    python -m fivestar.registry                    lists the versions
+    python -m fivestar.registry add model.joblib   registers an artifact
+    python -m fivestar.registry activate v0001     serves a version (e.g. a rollback)
+"""
+
+import datetime
+import hashlib
+import json
+import os
+import re
+import shutil
+import sys
+import tempfile
+from functools import lru_cache
+
+import joblib
+import numpy as np
+from fivestar.params import MODEL_REGISTRY_PATH
+
+# Pipelines kept loaded in the process (an old and a new version while the app swaps)
+MODEL_CACHE_SIZE = 4
+
+VERSION = re.compile(r"v\d{4,}")
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def json_default(value):
+    # numpy arrays and scalars (metrics, params such as alphas) as python ones, anything else as its repr
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, np.generic):
+        return value.item()
+    return str(value)
+
+
+@lru_cache(maxsize=MODEL_CACHE_SIZE)
+def load_pipeline(artifact, sha256):
+    '''Pipeline of a registered artifact, checked against its checksum. Its numpy arrays are
+    memory-mapped read-only, so processes serving the same version share their pages.'''
+    if file_sha256(artifact) != sha256:
+        raise ValueError(f"{artifact} does not match its registered checksum")
+    return joblib.load(artifact, mmap_mode='r')
+
+
+class ModelRegistry():
+    """Versions of the model in a directory (FIVESTAR_MODEL_REGISTRY, models/ by default).
+    A version is written aside and renamed into place, then never modified: swapping the
+    model served means pointing LATEST at another version.
+    """
+
+    def __init__(self, path=None):
+        self.path = os.path.abspath(path or MODEL_REGISTRY_PATH)
+
+    def versions(self):
+        if not os.path.isdir(self.path):
+            return []
+        return sorted(name for name in os.listdir(self.path)
+                      if VERSION.fullmatch(name) and os.path.isfile(f"{self.path}/{name}/metadata.json"))
+
+    def latest(self):
+        '''Version LATEST points at, else the newest one, None for an empty registry'''
+        try:
+            with open(f"{self.path}/LATEST") as f:
+                version = f.read().strip()
+            if os.path.isfile(f"{self.path}/{version}/metadata.json"):
+                return version
+        except FileNotFoundError:
+            pass
+        versions = self.versions()
+        return versions[-1] if versions else None
+
+    def resolve(self, version=None):
+        version = version or self.latest()
+        if version is None:
+            raise FileNotFoundError(f"No model registered in {self.path}: train one with "
+                                    f"`python -m fivestar.trainer` or register an artifact with "
+                                    f"`python -m fivestar.registry add model.joblib`")
+        return version
+
+    def artifact(self, version=None):
+        return f"{self.path}/{self.resolve(version)}/model.joblib"
+
+    def metadata(self, version=None):
+        with open(f"{self.path}/{self.resolve(version)}/metadata.json") as f:
+            return json.load(f)
+
+    def verify(self, version=None):
+        '''True if the artifact of a version still matches its checksum'''
+        return file_sha256(self.artifact(version)) == self.metadata(version)['sha256']
+
+    def load(self, version=None):
+        '''Pipeline of a version (LATEST by default), from the in-process cache'''
+        version = self.resolve(version)
+        return load_pipeline(self.artifact(version), self.metadata(version)['sha256'])
+
+    def register(self, pipeline, metadata=None, activate=True):
+        '''Stores a fitted pipeline as a new version, and serves it if activate. Returns the version'''
+        os.makedirs(self.path, exist_ok=True)
+        tmp = tempfile.mkdtemp(prefix='.tmp-', dir=self.path)
+        try:
+            # not compressed, so its arrays can be memory-mapped at load
+            joblib.dump(pipeline, f"{tmp}/model.joblib")
+            return self.add(tmp, metadata, activate)
+        except BaseException:
+            shutil.rmtree(tmp, ignore_errors=True)
+            raise
+
+    def register_file(self, path, metadata=None, activate=True):
+        '''Stores a model.joblib as a new version, and serves it if activate. Returns the version'''
+        os.makedirs(self.path, exist_ok=True)
+        tmp = tempfile.mkdtemp(prefix='.tmp-', dir=self.path)
+        try:
+            shutil.copyfile(path, f"{tmp}/model.joblib")
+            return self.add(tmp, dict(metadata or {}, source=os.path.abspath(path)), activate)
+        except BaseException:
+            shutil.rmtree(tmp, ignore_errors=True)
+            raise
+
+    def add(self, tmp, metadata, activate):
+        import sklearn
+        artifact = f"{tmp}/model.joblib"
+        metadata = dict(metadata or {}, sha256=file_sha256(artifact), size=os.path.getsize(artifact),
+                        created=datetime.datetime.now().isoformat(timespec='seconds'),
+                        sklearn=sklearn.__version__)
+        # the rename claims the version number: concurrent registrations get distinct ones
+        while True:
+            versions = self.versions()
+            number = int(versions[-1][1:]) + 1 if versions else 1
+            version = f"v{number:04d}"
+            with open(f"{tmp}/metadata.json", 'w') as f:
+                json.dump(dict(metadata, version=version), f, indent=1, default=json_default)
+            try:
+                os.rename(tmp, f"{self.path}/{version}")
+                break
+            except OSError:
+                if not os.path.isdir(f"{self.path}/{version}"):
+                    raise
+        if activate:
+            self.activate(version)
+        return version
+
+    def activate(self, version):
+        '''Points LATEST at a version: running apps swap to it (see Model.refresh)'''
+        if version not in self.versions():
+            raise ValueError(f"{version} is not registered in {self.path}")
+        tmp = f"{self.path}/LATEST.{os.getpid()}.tmp"
+        with open(tmp, 'w') as f:
+            f.write(version)
+        os.replace(tmp, f"{self.path}/LATEST")
+
+
+if __name__ == '__main__':
+    registry = ModelRegistry()
+    if len(sys.argv) > 2 and sys.argv[1] == 'add':
+        print(f"{sys.argv[2]} registered as {registry.register_file(sys.argv[2])}")
+    elif len(sys.argv) > 2 and sys.argv[1] == 'activate':
+        registry.activate(sys.argv[2])
+        print(f"{sys.argv[2]} activated")
+    else:
+        latest = registry.latest()
+        for version in registry.versions():
+            metadata = registry.metadata(version)
+            print(f"{'*' if version == latest else ' '} {version}  {metadata['created']}  "
+                  f"{metadata.get('estimator', '')}  {metadata['sha256'][:12]}")
@@ -0,0 +1,100 @@
+"""
+Streaming, multi-process count of review bigrams per cluster, producing the word
+counts the word clouds are drawn from (word_counts2.csv)
+
+    python -m fivestar.reviews reviews.csv.gz word_counts2.csv
+"""
+
+import os
+import re
+import sys
+from collections import Counter, deque
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+from sklearn.feature_extraction.text import ENGLISH_STOP_WORDS
+
+from fivestar.data import load_dataset
+
+WORD = re.compile(r"[a-z]+")
+STOP_WORDS = ENGLISH_STOP_WORDS | {'br', 'airbnb', 'stay', 'stayed', 'place', 'london'}
+
+_cluster_of = None
+
+
+def review_bigrams(text):
+    '''Pairs of consecutive words of a review, stop words left out'''
+    words = [word for word in WORD.findall(text.lower()) if len(word) > 1 and word not in STOP_WORDS]
+    return [f'{first} {second}' for first, second in zip(words, words[1:])]
+
+
+def set_clusters(cluster_of):
+    global _cluster_of
+    _cluster_of = cluster_of
+
+
+def count_chunk(chunk):
+    '''Bigram counts of a chunk of reviews by cluster of the reviewed listing, plus All'''
+    counts = {'All': Counter()}
+    clusters = chunk['listing_id'].map(_cluster_of)
+    for cluster, text in zip(clusters, chunk['comments']):
+        if not isinstance(text, str):
+            continue
+        bigrams = review_bigrams(text)
+        counts['All'].update(bigrams)
+        if isinstance(cluster, str):
+            counts.setdefault(cluster, Counter()).update(bigrams)
+    return counts
+
+
+def merge_counts(totals, counts, capacity):
+    '''Adds a chunk's counts to the running totals. A cluster's counter that outgrows
+    capacity is cut back to its capacity // 2 most common bigrams, bounding memory: the
+    frequent bigrams that make a top-K survive, rare ones may be undercounted.'''
+    for cluster, counter in counts.items():
+        total = totals.setdefault(cluster, Counter())
+        total.update(counter)
+        if len(total) > capacity:
+            totals[cluster] = Counter(dict(total.most_common(capacity // 2)))
+
+
+def top_bigrams(totals, top=100):
+    '''Top bigrams of every cluster, shaped like word_counts2.csv'''
+    rows = [(cluster, bigram, count) for cluster, counter in sorted(totals.items())
+            for bigram, count in counter.most_common(top)]
+    return pd.DataFrame(rows, columns=['cluster', 'quotes', 'count'])
+
+
+def count_reviews(reviews_path, clusters=None, top=100, chunksize=50000, n_jobs=None, capacity=200000):
+    '''Streams a reviews file (listing_id and comments columns, e.g. Inside Airbnb's
+    reviews.csv.gz) in chunks and counts review bigrams per cluster across a process pool.
+    At most two chunks per worker are in flight. Returns the top bigrams of every cluster.'''
+    if clusters is None:
+        clusters = load_dataset('clusters')
+    cluster_of = dict(zip(clusters['listing_id'], clusters['cluster']))
+    n_jobs = n_jobs or os.cpu_count()
+    chunks = pd.read_csv(reviews_path, usecols=['listing_id', 'comments'], chunksize=chunksize)
+    totals = {}
+
+    if n_jobs == 1:
+        set_clusters(cluster_of)
+        for chunk in chunks:
+            merge_counts(totals, count_chunk(chunk), capacity)
+    else:
+        with ProcessPoolExecutor(n_jobs, initializer=set_clusters, initargs=(cluster_of,)) as pool:
+            pending = deque()
+            for chunk in chunks:
+                pending.append(pool.submit(count_chunk, chunk))
+                if len(pending) >= 2 * n_jobs:
+                    merge_counts(totals, pending.popleft().result(), capacity)
+            while pending:
+                merge_counts(totals, pending.popleft().result(), capacity)
+    return top_bigrams(totals, top)
+
+
+if __name__ == '__main__':
+    reviews_path = sys.argv[1] if len(sys.argv) > 1 else 'reviews.csv.gz'
+    output_path = sys.argv[2] if len(sys.argv) > 2 else 'word_counts2.csv'
+    word_counts = count_reviews(reviews_path)
+    word_counts.to_csv(output_path, index=False)
+    print(f"{word_counts['cluster'].nunique()} clusters counted to {output_path}")
@@ -0,0 +1,72 @@
+"""
+Typed ingestion schema of the listings snapshot: raw strings are parsed once at load
+"""
+
+import numpy as np
+import pandas as pd
+from fivestar.utils import parse_prices, parse_rates
+
+PRICE_COLUMNS = ['price', 'weekly_price', 'monthly_price', 'security_deposit', 'cleaning_fee', 'extra_people']
+
+RATE_COLUMNS = ['host_response_rate']
+
+FLAG_COLUMNS = ['host_identity_verified', 'is_location_exact', 'instant_bookable',
+                'require_guest_profile_picture', 'require_guest_phone_verification']
+
+CATEGORY_COLUMNS = ['experiences_offered', 'host_location', 'host_response_time', 'host_neighbourhood',
+                    'host_verifications', 'street', 'neighbourhood_cleansed', 'zipcode', 'property_type',
+                    'room_type', 'bed_type', 'cancellation_policy',
+                    # integer codes into the distinct amenities strings
+                    'amenities']
+
+
+def parse_flags(flags):
+    '''t/f strings to a nullable boolean column'''
+    return flags.map({'t': True, 'f': False}).astype('boolean')
+
+
+def parse_listings(df):
+    '''Listings with prices and rates as float32, t/f flags as booleans and the
+    repetitive text columns (amenities included) as categories'''
+    parsed = {}
+    for column in df.columns:
+        values = df[column]
+        if column in PRICE_COLUMNS:
+            parsed[column] = parse_prices(values).astype(np.float32)
+        elif column in RATE_COLUMNS:
+            parsed[column] = parse_rates(values).astype(np.float32)
+        elif column in FLAG_COLUMNS:
+            parsed[column] = parse_flags(values)
+        elif column in CATEGORY_COLUMNS:
+            parsed[column] = values.astype('category')
+        else:
+            parsed[column] = values
+    return pd.DataFrame(parsed, index=df.index)
+
+
+def downcast(df):
+    '''Smallest integer type for integer columns, float32 for float columns'''
+    downcasted = {}
+    for column in df.columns:
+        values = df[column]
+        if pd.api.types.is_integer_dtype(values) and not pd.api.types.is_extension_array_dtype(values):
+            downcasted[column] = pd.to_numeric(values, downcast='integer')
+        elif pd.api.types.is_float_dtype(values):
+            downcasted[column] = values.astype(np.float32)
+        else:
+            downcasted[column] = values
+    return pd.DataFrame(downcasted, index=df.index)
+
+
+def memory_mb(df):
+    return df.memory_usage(deep=True).sum() / 1e6
+
+
+def memory_report(before, after):
+    '''Memory footprint in MB of every column before and after parsing, largest savings first'''
+    report = pd.DataFrame({'dtype_before': before.dtypes.astype(str),
+                           'mb_before': before.memory_usage(deep=True, index=False) / 1e6,
+                           'dtype_after': after.dtypes.astype(str),
+                           'mb_after': after.memory_usage(deep=True, index=False) / 1e6})
+    report['saved_mb'] = report['mb_before'] - report['mb_after']
+    return report.sort_values('saved_mb', ascending=False).round(3)
@@ -0,0 +1,146 @@
+"""
+Pure NumPy scoring of raw listing records with a pipeline exported by fivestar.export
+"""
+
+import json
+import numpy as np
+from fivestar.params import STRICT_POLICIES
+
+
+def column(records, name, dtype=object):
+    '''One column of a batch of records, given as a list of dicts or a mapping of columns'''
+    if isinstance(records, list):
+        values = [record.get(name, np.nan) for record in records]
+    else:
+        values = records[name]
+    return np.asarray(values, dtype=dtype)
+
+
+def to_float(values, strip=''):
+    '''Floats from raw values, stripping the given characters and thousand separators off strings'''
+    return np.array([float(value.strip(strip).replace(',', '')) if isinstance(value, str) else value
+                     for value in values], dtype=float)
+
+
+def is_missing(value):
+    return value is None or (isinstance(value, float) and np.isnan(value))
+
+
+def amenity_lists(values):
+    return [value[1:-1].split(',') if isinstance(value, str) else [] for value in values]
+
+
+def encode_amenities(records, columns, params):
+    lookup = {}
+    for index, names in enumerate(params['aliases']):
+        for name in names:
+            lookup.setdefault(name, []).append(index)
+    values = column(records, columns[0])
+    flags = np.zeros((len(values), len(params['aliases'])))
+    for row, items in enumerate(amenity_lists(values)):
+        for item in items:
+            for index in lookup.get(item.strip('"').casefold(), ()):
+                flags[row, index] = 1
+    return flags
+
+
+def count_amenities(records, columns, params):
+    values = column(records, columns[0])
+    counts = np.fromiter((value.count(',') + 1 if isinstance(value, str) else 0 for value in values),
+                         dtype=float, count=len(values))
+    return counts[:, None]
+
+
+def encode_categoricals(records, columns, params):
+    encoded = []
+    for name in columns:
+        values = column(records, name)
+        encoded.append([1.0 if value == 't' else 0.0 if value == 'f' or is_missing(value) else float(value)
+                        for value in values])
+    return np.array(encoded, dtype=float).T
+
+
+def encode_price_ratio(records, columns, params):
+    prices = to_float(column(records, 'price'), strip='$')
+    house_prices = np.array([params['house_prices'].get(neigh, np.nan)
+                             for neigh in column(records, 'neighbourhood_cleansed')], dtype=float)
+    ratio = prices / (house_prices / 1e5)**2
+    median = params.get('median')
+    if median is None:
+        # artifacts exported before the encoder learnt its median
+        median = np.nan if np.isnan(ratio).all() else np.nanmedian(ratio)
+    ratio = np.where(ratio > 0, ratio, median)
+    return np.log(ratio)[:, None]
+
+
+def encode_cancellation(records, columns, params):
+    return np.isin(column(records, 'cancellation_policy'), STRICT_POLICIES).astype(float)[:, None]
+
+
+def encode_response_rate(records, columns, params):
+    return to_float(column(records, 'host_response_rate'), strip='%')[:, None]
+
+
+def encode_room_ratio(records, columns, params):
+    bedrooms = column(records, 'bedrooms', float)
+    return (column(records, 'accommodates', float) / np.where(bedrooms == 0, 1, bedrooms))[:, None]
+
+
+def encode_score_delta(records, columns, params):
+    scores = np.array([column(records, name, float) for name in params['review_columns']]).T
+    counts = (~np.isnan(scores)).sum(axis=1)
+    means = np.where(counts > 0, np.nansum(scores, axis=1) / np.maximum(counts, 1), np.nan)
+    delta = column(records, params['score_column'], float) - means
+    return np.where(np.isnan(delta), 0.0, delta)[:, None]
+
+
+def encode_room_type(records, columns, params):
+    return (column(records, 'room_type') == 'Entire home/apt').astype(float)[:, None]
+
+
+def passthrough(records, columns, params):
+    return np.array([to_float(column(records, name)) for name in columns]).T
+
+
+ENCODERS = {
+    'amenities': encode_amenities,
+    'amenity_count': count_amenities,
+    'categoricals': encode_categoricals,
+    'price_ratio': encode_price_ratio,
+    'cancellation': encode_cancellation,
+    'response_rate': encode_response_rate,
+    'room_ratio': encode_room_ratio,
+    'score_delta': encode_score_delta,
+    'room_type': encode_room_type,
+    'passthrough': passthrough,
+}
+
+
+class NumpyScorer():
+    """Scores batches of raw listing records from an exported pipeline, without
+    pandas or sklearn"""
+
+    def __init__(self, spec):
+        self.spec = spec
+        self.coef = np.array(spec['coef'], dtype=float)
+        self.intercept = float(spec['intercept'])
+
+    @classmethod
+    def load(cls, path):
+        with open(path) as f:
+            return cls(json.load(f))
+
+    def transform(self, records):
+        blocks = []
+        for block in self.spec['blocks']:
+            values = ENCODERS[block['encoder']](records, block['columns'], block['params'])
+            for step in block['steps']:
+                if step['step'] == 'impute':
+                    values = np.where(np.isnan(values), np.array(step['fill_values']), values)
+                elif step['step'] == 'scale':
+                    values = (values - np.array(step['mean'])) / np.array(step['scale'])
+            blocks.append(values)
+        return np.hstack(blocks)
+
+    def predict(self, records):
+        return self.transform(records) @ self.coef + self.intercept
@@ -0,0 +1,223 @@
+"""
+Asynchronous JSON service around FiveStar, for the systems that can't go through the app
+
+    python -m fivestar.service [--host 0.0.0.0] [--port 8080]
+
+    GET  /health                                model version served
+    GET  /listings/{listing_id}                 the listing's fields and cluster
+    GET  /listings/{listing_id}/ranking         rank in its cluster (location, price, ptype and
+                                                psize query parameters override the listing's)
+    GET  /clusters/{cluster_id}/averages        price, cleanliness and amenity rates of a cluster
+    POST /predict                               {"listing_id": 1, "values": {"price": 80}} -> score
+"""
+
+import argparse
+import asyncio
+import datetime
+import json
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+from aiohttp import web
+
+from fivestar.clusters import get_cluster_ranking
+from fivestar.lib import FiveStar, predictions
+from fivestar.utils import str_to_price
+
+# Predictions requested while a batch is scoring wait at most MAX_DELAY seconds to be scored together
+MAX_DELAY = 0.005
+MAX_BATCH = 256
+
+
+def jsonable(value):
+    '''value with numpy types as python ones and NaN/NA as None'''
+    if isinstance(value, dict):
+        return {str(key): jsonable(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple, np.ndarray, pd.Series)):
+        return [jsonable(item) for item in value]
+    if isinstance(value, np.generic):
+        value = value.item()
+    if isinstance(value, float) and not np.isfinite(value):
+        return None
+    if value is pd.NA or value is pd.NaT:
+        return None
+    if isinstance(value, (datetime.date, pd.Timestamp)):
+        return value.isoformat()
+    return value
+
+
+def json_response(data, status=200):
+    return web.json_response(jsonable(data), status=status)
+
+
+class PredictionBatcher():
+    """Coalesces concurrent predictions (at most max_batch of them) into one
+    FiveStar.predict_batch call. A prediction requested while nothing is scoring is scored
+    at once; the ones requested while a batch is scoring wait for it to finish, or for
+    max_delay seconds, and are scored together. Batches are scored one at a time in a
+    worker thread, so the event loop keeps accepting requests meanwhile. A batch that
+    fails is scored again request by request, so a bad request only fails itself.
+    """
+
+    def __init__(self, fivestar, max_delay=MAX_DELAY, max_batch=MAX_BATCH):
+        self.fivestar = fivestar
+        self.max_delay = max_delay
+        self.max_batch = max_batch
+        self.executor = ThreadPoolExecutor(1, thread_name_prefix='predict')
+        self.pending = []
+        self.timer = None
+        self.tasks = set()
+        self.scoring = 0  # batches flushed and not scored yet
+        self.batches = 0
+        self.predictions = 0
+
+    async def predict(self, listing_id, values):
+        '''Score of a listing under new values, and the model version that gave it'''
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self.pending.append((listing_id, values, future))
+        if len(self.pending) >= self.max_batch or not self.scoring:
+            self.flush()
+        elif self.timer is None:
+            self.timer = loop.call_later(self.max_delay, self.flush)
+        return await future
+
+    def flush(self):
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+        batch, self.pending = self.pending, []
+        if batch:
+            self.scoring += 1
+            task = asyncio.ensure_future(self.score(batch))
+            self.tasks.add(task)
+            task.add_done_callback(self.scored)
+
+    def scored(self, task):
+        self.tasks.discard(task)
+        self.scoring -= 1
+        # what was requested meanwhile has waited long enough
+        if self.pending and not self.scoring:
+            self.flush()
+
+    async def score(self, batch):
+        requests = [(listing_id, values) for listing_id, values, _ in batch]
+        try:
+            version, scores = await asyncio.get_running_loop().run_in_executor(
+                self.executor, self.fivestar.predict_batch, requests)
+        except Exception as error:
+            if len(batch) > 1:
+                await asyncio.gather(*(self.score([request]) for request in batch))
+            elif not batch[0][2].done():
+                batch[0][2].set_exception(error)
+            return
+        self.batches += 1
+        self.predictions += len(batch)
+        for (_, _, future), score in zip(batch, scores):
+            if not future.done():
+                future.set_result((float(score), version))
+
+    def close(self):
+        self.executor.shutdown(wait=False)
+
+
+class PredictionService():
+    """The aiohttp application serving a FiveStar. The model is watched, so a newly
+    registered version is served without a restart (see Model.watch)."""
+
+    def __init__(self, fivestar=None, max_delay=MAX_DELAY, max_batch=MAX_BATCH, watch=True):
+        self.fivestar = fivestar or FiveStar()
+        self.batcher = PredictionBatcher(self.fivestar, max_delay, max_batch)
+        self.watch = watch
+        self.watching = None
+
+    def app(self):
+        app = web.Application()
+        app.add_routes([web.get('/health', self.health),
+                        web.get('/listings/{listing_id}', self.listing),
+                        web.get('/listings/{listing_id}/ranking', self.ranking),
+                        web.get('/clusters/{cluster_id}/averages', self.cluster_averages),
+                        web.post('/predict', self.predict)])
+        app.on_startup.append(self.start)
+        app.on_cleanup.append(self.stop)
+        return app
+
+    async def start(self, app):
+        if self.watch:
+            self.watching = self.fivestar.model.watch()
+
+    async def stop(self, app):
+        if self.watching is not None:
+            self.watching.set()
+        self.batcher.close()
+
+    def listing_id(self, value):
+        try:
+            listing_id = int(value)
+        except (TypeError, ValueError):
+            raise web.HTTPBadRequest(text=f'Invalid listing id {value!r}')
+        if listing_id not in self.fivestar.records:
+            raise web.HTTPNotFound(text=f'Unknown listing {listing_id}')
+        return listing_id
+
+    async def health(self, request):
+        return json_response(dict(model_version=self.fivestar.model.version,
+                                  batches=self.batcher.batches, predictions=self.batcher.predictions,
+                                  memo=predictions.info()))
+
+    async def listing(self, request):
+        listing_id = self.listing_id(request.match_info['listing_id'])
+        listing = self.fivestar.get_listing(listing_id)
+        clustered = listing_id in self.fivestar.cluster_index
+        return json_response(dict(listing, cluster=self.fivestar.get_cluster_id(listing_id) if clustered else None))
+
+    async def ranking(self, request):
+        listing_id = self.listing_id(request.match_info['listing_id'])
+        listing = self.fivestar.get_listing(listing_id)
+        query = request.query
+        try:
+            location = query.get('location', listing['neighbourhood_cleansed'])
+            price = float(query['price']) if 'price' in query else str_to_price(listing['price'])
+            ptype = query.get('ptype', listing['room_type'])
+            psize = float(query['psize']) if 'psize' in query else listing['bedrooms']
+            # the ranking reads the clusters and their scores: keep it off the event loop
+            rank, average, scores = await asyncio.get_running_loop().run_in_executor(
+                None, get_cluster_ranking, location, price, ptype, psize, listing_id)
+        except (KeyError, ValueError) as error:
+            raise web.HTTPBadRequest(text=f'Invalid ranking query: {error}')
+        return json_response(dict(listing_id=listing_id, rank=rank, cluster_average=average,
+                                  cluster_scores=scores))
+
+    async def cluster_averages(self, request):
+        cluster_id = request.match_info['cluster_id']
+        if cluster_id not in self.fivestar.cluster_info.index:
+            raise web.HTTPNotFound(text=f'Unknown cluster {cluster_id}')
+        return json_response(dict(cluster=cluster_id, **self.fivestar.get_cluster_averages(cluster_id)))
+
+    async def predict(self, request):
+        try:
+            body = await request.json()
+            listing_id, values = body['listing_id'], body.get('values') or {}
+        except (json.JSONDecodeError, KeyError, TypeError):
+            raise web.HTTPBadRequest(text='Expected {"listing_id": ..., "values": {...}}')
+        if not isinstance(values, dict):
+            raise web.HTTPBadRequest(text='values must be an object')
+        listing_id = self.listing_id(listing_id)
+        try:
+            score, version = await self.batcher.predict(listing_id, values)
+        except Exception as error:
+            # the listing exists: the values are what the pipeline could not take
+            raise web.HTTPBadRequest(text=f'Cannot score these values: {error!r}')
+        return json_response(dict(listing_id=listing_id, score=score, model_version=version))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Serve FiveStar lookups and predictions as JSON')
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--max-delay', type=float, default=MAX_DELAY, help='seconds a prediction waits for others')
+    parser.add_argument('--max-batch', type=int, default=MAX_BATCH)
+    args = parser.parse_args()
+    web.run_app(PredictionService(max_delay=args.max_delay, max_batch=args.max_batch).app(),
+                host=args.host, port=args.port)
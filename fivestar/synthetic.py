@@ -0,0 +1,179 @@
+"""
+Synthetic listings for tests and benchmarks
+"""
+
+import os
+import numpy as np
+import pandas as pd
+from fivestar.params import BOROUGHS, LISTINGS_COLUMNS, RECORD_COLUMNS
+
+
+def make_listings(n=400, seed=0):
+    '''Random listings with the columns the model and the app use'''
+    rng = np.random.default_rng(seed)
+    amenities = ['TV', 'Wifi', 'Breakfast', 'Kitchen', 'Free street parking', 'Hair dryer']
+    listings = pd.DataFrame({
+        'id': np.arange(n) + 1,
+        'name': [f'listing {i}' for i in range(n)],
+        'amenities': ['{' + ','.join(f'"{a}"' for a in rng.choice(amenities, rng.integers(0, 6), replace=False)) + '}'
+                      for _ in range(n)],
+        'instant_bookable': rng.choice(['t', 'f'], n),
+        'host_identity_verified': rng.choice(np.array(['t', 'f', np.nan], dtype=object), n),
+        'price': [f'${p:,.2f}' for p in rng.integers(20, 400, n)],
+        'neighbourhood_cleansed': rng.choice(BOROUGHS, n),
+        'host_listings_count': rng.choice([1, 2, 5, np.nan], n),
+        'cancellation_policy': rng.choice(['strict', 'moderate', 'flexible', 'super_strict_30'], n),
+        'host_response_rate': rng.choice(np.array(['100%', '90%', '50%', np.nan], dtype=object), n),
+        'accommodates': rng.integers(1, 8, n),
+        'bedrooms': rng.choice([0, 1, 2, 3, np.nan], n),
+        'room_type': rng.choice(['Entire home/apt', 'Private room'], n),
+    })
+    for column in RECORD_COLUMNS:
+        if column.startswith('review_scores'):
+            listings[column] = rng.integers(6, 11, n).astype(float)
+    listings['review_scores_rating'] = rng.integers(60, 101, n).astype(float)
+    return listings
+
+
+AMENITIES = ['Wifi', 'Heating', 'Kitchen', 'Essentials', 'Smoke detector', 'Washer', 'Hangers',
+             'Hair dryer', 'Iron', 'TV', 'Laptop friendly workspace', 'Shampoo', 'Hot water',
+             'Carbon monoxide detector', 'Dryer', 'Refrigerator', 'Dishes and silverware',
+             'Cooking basics', 'Oven', 'Stove', 'Microwave', 'Bed linens', 'First aid kit',
+             'Fire extinguisher', 'Private entrance', 'Dishwasher', 'Coffee maker', 'Cable TV',
+             'Free street parking', 'Paid parking off premises', 'Free parking on premises',
+             'Lock on bedroom door', 'Elevator', 'Family/kid friendly', 'Breakfast', 'Garden or backyard',
+             'Long term stays allowed', 'Host greets you', 'Extra pillows and blankets', 'Indoor fireplace',
+             'Patio or balcony', 'Luggage dropoff allowed', 'Self check-in', 'Lockbox', 'Gym',
+             'Pets allowed', 'translation missing: en.hosting_amenity_49']
+
+TEXTS = ['Bright and spacious flat a short walk from the tube.',
+         'Cosy double room in a quiet street, close to shops, pubs and the park.',
+         'Modern apartment with a balcony overlooking the river, ideal for couples and business travellers.',
+         'Lovely Victorian house with a garden. Buses and the overground are a few minutes away.',
+         'Please no parties. Quiet hours after 10pm. Check-in from 3pm.']
+
+
+def amenity_strings(rng, n, pool_size=2000):
+    '''Amenities strings in the snapshot's format ({TV,Wifi,"Hair dryer"}), with popular amenities
+    more frequent. n listings share a pool of distinct strings, so millions of rows stay cheap.'''
+    weights = np.linspace(0.95, 0.02, len(AMENITIES))
+    quoted = np.array([f'"{a}"' if ' ' in a else a for a in AMENITIES], dtype=object)
+    pool = np.array(['{' + ','.join(quoted[rng.random(len(AMENITIES)) < weights]) + '}'
+                     for _ in range(min(pool_size, n))], dtype=object)
+    return pool[rng.integers(len(pool), size=n)]
+
+
+def with_missing(rng, values, rate):
+    values = np.asarray(values, dtype=object)
+    values[rng.random(len(values)) < rate] = np.nan
+    return values
+
+
+def make_snapshot(n=10000, seed=0, boroughs=None):
+    '''Random listings with every column of LISTINGS_COLUMNS, formatted like the raw snapshot
+    (prices as "$1,234.00", rates as "95%", t/f flags), so they round-trip through
+    listings.csv and get_data. boroughs limits the listings to the first boroughs of BOROUGHS,
+    bounding the number of clusters (15 per borough at most).'''
+    rng = np.random.default_rng(seed)
+    neighbourhoods = np.array(BOROUGHS[:boroughs] if boroughs else BOROUGHS, dtype=object)
+    entire = rng.random(n) < 0.55
+    bedrooms = np.where(entire, rng.choice([0, 1, 1, 2, 2, 3, 4], n), 1).astype(float)
+    bedrooms[rng.random(n) < 0.01] = np.nan
+    accommodates = np.where(entire, 2 * np.nan_to_num(bedrooms, nan=1) + rng.integers(0, 3, n),
+                            rng.integers(1, 3, n)).astype(int)
+    prices = np.round(np.exp(rng.normal(np.where(entire, 4.6, 3.8), 0.5)))
+    days = np.datetime64('2021-01-15') - rng.integers(30, 3650, n).astype('timedelta64[D]')
+    first_review = days + rng.integers(0, 30, n).astype('timedelta64[D]')
+    number_of_reviews = rng.negative_binomial(1, 0.05, n)
+    rating = np.clip(np.round(rng.normal(93, 7, n)), 20, 100)
+    text = np.array(TEXTS, dtype=object)
+
+    listings = pd.DataFrame({
+        'id': rng.permutation(n) * 7 + 10000,
+        'name': np.array([f'Listing {i}' for i in range(n)], dtype=object),
+        'experiences_offered': 'none',
+        'host_since': days.astype(str),
+        'host_location': 'London, England, United Kingdom',
+        'host_response_time': with_missing(rng, rng.choice(['within an hour', 'within a day'], n), 0.3),
+        'host_response_rate': with_missing(rng, np.char.add(rng.integers(50, 101, n).astype(str), '%'), 0.3),
+        'host_listings_count': with_missing(rng, rng.choice([1, 1, 1, 2, 3, 10, 50], n), 0.01),
+        'host_total_listings_count': rng.choice([1, 1, 2, 4, 12], n),
+        'host_verifications': "['email', 'phone', 'reviews']",
+        'host_identity_verified': rng.choice(['t', 'f'], n),
+        'street': 'London, United Kingdom',
+        'neighbourhood_cleansed': rng.choice(neighbourhoods, n),
+        'zipcode': with_missing(rng, rng.choice(['N1', 'E2', 'SW3', 'W11', 'SE1'], n), 0.05),
+        'latitude': rng.normal(51.51, 0.05, n),
+        'longitude': rng.normal(-0.12, 0.09, n),
+        'is_location_exact': rng.choice(['t', 'f'], n),
+        'property_type': rng.choice(['Apartment', 'House', 'Condominium', 'Townhouse'], n),
+        'room_type': np.where(entire, 'Entire home/apt', rng.choice(['Private room', 'Shared room'], n)),
+        'accommodates': accommodates,
+        'bathrooms': rng.choice([1.0, 1.0, 1.5, 2.0], n),
+        'bedrooms': bedrooms,
+        'beds': np.nan_to_num(bedrooms, nan=1) + rng.integers(0, 2, n),
+        'bed_type': 'Real Bed',
+        'amenities': amenity_strings(rng, n),
+        'price': np.array([f'${p:,.2f}' for p in prices], dtype=object),
+        'weekly_price': np.nan,
+        'monthly_price': np.nan,
+        'security_deposit': with_missing(rng, np.full(n, '$150.00'), 0.5),
+        'cleaning_fee': with_missing(rng, np.full(n, '$30.00'), 0.4),
+        'guests_included': rng.integers(1, 4, n),
+        'extra_people': '$10.00',
+        'minimum_nights': rng.choice([1, 2, 3, 7, 30], n),
+        'maximum_nights': 1125,
+        'availability_30': rng.integers(0, 31, n),
+        'availability_60': rng.integers(0, 61, n),
+        'availability_90': rng.integers(0, 91, n),
+        'availability_365': rng.integers(0, 366, n),
+        'number_of_reviews': number_of_reviews,
+        'number_of_reviews_ltm': number_of_reviews // 3,
+        'first_review': first_review.astype(str),
+        'last_review': (first_review + rng.integers(0, 300, n).astype('timedelta64[D]')).astype(str),
+        'review_scores_rating': np.where(number_of_reviews > 0, rating, np.nan),
+        'instant_bookable': rng.choice(['t', 'f'], n),
+        'cancellation_policy': rng.choice(['flexible', 'moderate', 'strict_14_with_grace_period',
+                                           'super_strict_30'], n, p=[.35, .3, .33, .02]),
+        'require_guest_profile_picture': 'f',
+        'require_guest_phone_verification': 'f',
+        'reviews_per_month': np.round(number_of_reviews / 24, 2),
+    })
+    for column in ['summary', 'space', 'description', 'neighborhood_overview', 'notes', 'transit',
+                   'access', 'interaction', 'house_rules', 'host_about', 'host_neighbourhood']:
+        listings[column] = with_missing(rng, rng.choice(text, n), 0.2)
+    for column in LISTINGS_COLUMNS:
+        if column.startswith('review_scores_') and column != 'review_scores_rating':
+            scores = np.clip(np.round(rating / 10 + rng.normal(0, 0.6, n)), 2, 10)
+            listings[column] = np.where(number_of_reviews > 0, scores, np.nan)
+    return listings[LISTINGS_COLUMNS]
+
+
+def make_wordcounts(clusters, top=50, seed=0):
+    '''Review bigram counts shaped like word_counts2.csv (cluster, quotes, count) for every
+    cluster label plus All'''
+    rng = np.random.default_rng(seed)
+    bigrams = np.array([f'{first} {second}'
+                        for first in ['great', 'lovely', 'clean', 'quiet', 'central', 'comfortable',
+                                      'perfect', 'easy', 'friendly', 'walking']
+                        for second in ['location', 'host', 'flat', 'room', 'stay', 'area', 'access',
+                                       'bed', 'value', 'distance']], dtype=object)
+    labels = ['All'] + sorted(clusters['cluster'].dropna().unique())
+    return pd.DataFrame({
+        'cluster': np.repeat(labels, top),
+        'quotes': np.concatenate([rng.choice(bigrams, top, replace=False) for _ in labels]),
+        'count': rng.integers(5, 500, top * len(labels)),
+    })
+
+
+def write_snapshot(path, n=10000, seed=0, boroughs=None):
+    '''Writes listings.csv, clusters.csv and word_counts2.csv of a synthetic snapshot to the
+    directory path, laid out like the files get_data reads'''
+    from fivestar.clusters import build_clusters
+    os.makedirs(path, exist_ok=True)
+    listings = make_snapshot(n, seed, boroughs)
+    listings.to_csv(os.path.join(path, 'listings.csv'), index=False)
+    build_clusters(listings, os.path.join(path, ''))
+    clusters = pd.read_csv(os.path.join(path, 'clusters.csv'))
+    make_wordcounts(clusters, seed=seed).to_csv(os.path.join(path, 'word_counts2.csv'), index=False)
+    return listings
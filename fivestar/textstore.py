@@ -0,0 +1,82 @@
+"""
+Cold store of the listings' free-text columns, read one listing at a time
+"""
+
+import json
+import mmap
+import os
+
+import numpy as np
+from fivestar.params import TEXT_COLUMNS
+
+
+class TextStore():
+    """Free-text fields of every listing, kept on disk: one json record per listing in
+    {path}.jsonl, and the sorted ids with the offset and length of their record in
+    {path}.npz. Only the index stays in memory (24 bytes a listing), and a lookup is
+    a binary search plus one read from the memory-mapped records.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        index = np.load(f"{path}.npz")
+        self.ids, self.offsets, self.lengths = index['ids'], index['offsets'], index['lengths']
+        with open(f"{path}.jsonl", 'rb') as f:
+            self.records = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if self.lengths.sum() else b''
+
+    @staticmethod
+    def exists(path):
+        return os.path.isfile(f"{path}.npz") and os.path.isfile(f"{path}.jsonl")
+
+    @classmethod
+    def build(cls, chunks, path, columns=TEXT_COLUMNS):
+        """Writes the store of an iterable of listings dataframes (e.g. csv chunks), the
+        first record of a duplicated id winning, and returns it"""
+        ids, offsets, lengths = [], [], []
+        offset = 0
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(f"{tmp}.jsonl", 'wb') as f:
+            for chunk in chunks:
+                texts = chunk[columns].astype(object)
+                texts = texts.where(texts.notna(), None)
+                for record in texts.to_dict('records'):
+                    line = json.dumps(record, ensure_ascii=False).encode() + b'\n'
+                    f.write(line)
+                    offsets.append(offset)
+                    lengths.append(len(line))
+                    offset += len(line)
+                ids.append(chunk['id'].to_numpy(dtype=np.int64))
+        ids = np.concatenate(ids) if ids else np.empty(0, dtype=np.int64)
+        order = np.argsort(ids, kind='stable')
+        ids, first = np.unique(ids[order], return_index=True)
+        keep = order[first]
+        np.savez(f"{tmp}.npz", ids=ids, offsets=np.array(offsets, dtype=np.int64)[keep],
+                 lengths=np.array(lengths, dtype=np.int64)[keep])
+        os.replace(f"{tmp}.jsonl", f"{path}.jsonl")
+        os.replace(f"{tmp}.npz", f"{path}.npz")
+        return cls(path)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __contains__(self, listing_id):
+        position = np.searchsorted(self.ids, listing_id)
+        return position < len(self.ids) and self.ids[position] == listing_id
+
+    def get(self, listing_id):
+        """Free-text fields of a listing as a dict (None when missing), or None for an unknown id"""
+        position = np.searchsorted(self.ids, listing_id)
+        if position == len(self.ids) or self.ids[position] != listing_id:
+            return None
+        offset = self.offsets[position]
+        return json.loads(self.records[offset:offset + self.lengths[position]])
+
+    def close(self):
+        if isinstance(self.records, mmap.mmap):
+            self.records.close()
+
+
+def split_listings(listings, path):
+    """The listings without their free-text columns, and a TextStore of those columns at path"""
+    texts = TextStore.build([listings], path, [c for c in TEXT_COLUMNS if c in listings.columns])
+    return listings.drop(columns=TEXT_COLUMNS, errors='ignore'), texts
@@ -1,23 +1,26 @@
+import hashlib
 import multiprocessing
+import os
+import shutil
 import time
 import warnings
-from tempfile import mkdtemp
+from glob import glob
 
-import category_encoders as ce
-import joblib
-import mlflow
 import numpy as np
 import pandas as pd
 
+from fivestar.data import get_data
 from fivestar.encoders import *
-from fivestar.utils import simple_time_tracker
+from fivestar.params import CACHE_PATH
+from fivestar.registry import ModelRegistry
+from fivestar.timing import timed
 
+from joblib import Memory
 from memoized_property import memoized_property
-from mlflow.tracking import MlflowClient
-from psutil import virtual_memory
 from sklearn.compose import ColumnTransformer
 from sklearn.impute import SimpleImputer
 from sklearn.linear_model import Lasso, Ridge, LinearRegression
+from sklearn.linear_model import ElasticNetCV, LassoCV, RidgeCV
 from sklearn.model_selection import train_test_split, RandomizedSearchCV
 from sklearn.pipeline import Pipeline, make_pipeline
 from sklearn.preprocessing import OneHotEncoder, RobustScaler, StandardScaler
@@ -26,6 +29,32 @@ from termcolor import colored
 # Mlflow wagon server
 MLFLOW_URI = "https://mlflow.lewagon.co/"
 
+# Size the persistent feature fits cache (CACHE_PATH/pipeline) is pruned to after a fit
+PIPELINE_CACHE_BYTES = "1G"
+
+
+def feature_code_version():
+    '''Hash of the code fitted feature blocks depend on: the encoders, the parsing helpers
+    they use and the scikit-learn version. joblib keys fits on parameters and data only'''
+    import sklearn
+    import fivestar.encoders
+    import fivestar.utils
+    digest = hashlib.sha1(sklearn.__version__.encode())
+    for module in (fivestar.encoders, fivestar.utils):
+        with open(module.__file__, 'rb') as f:
+            digest.update(f.read())
+    return digest.hexdigest()[:16]
+
+
+def pipeline_cache_dir(cache_path=None):
+    '''Feature fits cache of the current feature code, the caches of older code removed'''
+    directory = f"{cache_path or CACHE_PATH}/pipeline/{feature_code_version()}"
+    if not os.path.isdir(directory):
+        for stale in glob(f"{os.path.dirname(directory)}/*"):
+            shutil.rmtree(stale, ignore_errors=True)
+        os.makedirs(directory, exist_ok=True)
+    return directory
+
 
 class Trainer(object):
     # Mlflow parameters identifying the experiment, you can add all the parameters you wish
@@ -48,11 +77,17 @@ class Trainer(object):
         self.pipeline = None
         self.kwargs = kwargs
         self.grid = kwargs.get("gridsearch", False)  # apply gridsearch if True
+        self.search = kwargs.get("search", "random")  # "random" (RandomizedSearchCV) or "path" (alpha path)
         self.local = kwargs.get("local", True)  # if True training is done locally
         self.optimize = kwargs.get("optimize", False)  # Optimizes size of Training Data if set to True
         self.mlflow = kwargs.get("mlflow", False)  # if True log info to nlflow
         self.experiment_name = kwargs.get("experiment_name", self.EXPERIMENT_NAME)  # cf doc above
         self.model_params = None  # for
+        self.pipeline_cache = None  # persistent feature fits cache in use, cf get_memory
+        self.validation_curve = None  # validation error of every alpha of a path search
+        self.metrics = {}  # train time and scores, recorded with the registered model
+        self.version = None  # registry version of the saved model
+        self.registry = ModelRegistry(kwargs.get("registry"))  # registry directory, cf fivestar.registry
         self.X_train = X
         self.y_train = y
         del X, y
@@ -77,16 +112,35 @@ class Trainer(object):
         print(colored(model.__class__.__name__, "red"))
         return model
 
-    def set_pipeline(self):
-        memory = self.kwargs.get("pipeline_memory", None)
+    def get_memory(self, gridsearch=False):
+        """Location of the fitted `features` cache, or None to disable it.
+
+        `pipeline_memory` may be a directory, True for the persistent default under
+        CACHE_PATH, or False. It defaults to on for grid searches, where every
+        candidate of a CV fold would otherwise re-fit the same feature blocks.
+        Entries are keyed on the ColumnTransformer's parameters and the training
+        data, so they are reused across candidates and training runs alike. The
+        default lives in a directory per version of the feature code, so a changed
+        encoder never reuses old fits, and is pruned to PIPELINE_CACHE_BYTES.
+        """
+        memory = self.kwargs.get("pipeline_memory", gridsearch and self.search != "path")
+        if memory is True:
+            memory = self.pipeline_cache = pipeline_cache_dir()
+        return memory or None
+
+    def prune_memory(self):
+        '''Keeps the persistent feature fits cache within PIPELINE_CACHE_BYTES'''
+        if self.pipeline_cache is not None:
+            Memory(self.pipeline_cache, verbose=0).reduce_size(bytes_limit=PIPELINE_CACHE_BYTES)
+
+    def set_pipeline(self, gridsearch=False):
+        memory = self.get_memory(gridsearch)
         dist = self.kwargs.get("distance_type", "euclidian")
         feateng_default = ['amenities', 'amenity_count', 'categoricals',
                             'price_ratio', 'listing_count', 'cancellation',
                             'response_rate', 'room_ratio', 'cleanliness_delta',
                             'room_type']
         feateng_steps = self.kwargs.get("feateng", feateng_default)
-        if memory:
-            memory = mkdtemp()
 
         # Define feature engineering pipeline blocks here
         pipe_categoricals = make_pipeline(CategoricalColumnEncoder())
@@ -132,7 +186,8 @@ class Trainer(object):
             if bloc[0] not in feateng_steps:
                 feateng_blocks.remove(bloc)
 
-        features_encoder = ColumnTransformer(feateng_blocks, n_jobs=None, remainder="drop")
+        features_encoder = ColumnTransformer(feateng_blocks, n_jobs=self.kwargs.get("feateng_n_jobs", None),
+                                             remainder="drop")
 
         self.pipeline = Pipeline(steps=[
             ('features', features_encoder),
@@ -142,8 +197,66 @@ class Trainer(object):
     def predict(self, X):
         return self.pipeline.predict(X)
 
-    def load_model(self):
-        self.pipeline = joblib.load('model.joblib')
+    def load_model(self, version=None):
+        self.pipeline = self.registry.load(version)
+
+    def get_path_estimator(self):
+        """Estimator evaluating a whole regularization path in one fit.
+
+        Ridge uses RidgeCV's efficient leave-one-out CV: a single decomposition of
+        the feature matrix scores every alpha. Lasso and ElasticNet use LassoCV /
+        ElasticNetCV, which walk the path with warm starts on each fold.
+        estimator_params are set on the path estimator, except the alpha it searches.
+        """
+        estimator = self.kwargs.get("estimator", self.ESTIMATOR)
+        alphas = self.kwargs.get("alphas", None)
+        if estimator == "Lasso":
+            model = LassoCV(alphas=alphas, n_alphas=200, cv=3, n_jobs=self.kwargs.get("n_jobs", None))
+        elif estimator == "ElasticNet":
+            model = ElasticNetCV(alphas=alphas, n_alphas=200, cv=3, n_jobs=self.kwargs.get("n_jobs", None),
+                                 l1_ratio=self.kwargs.get("l1_ratio", [.1, .5, .7, .9, .95, 1]))
+        else:
+            if alphas is None:
+                alphas = np.logspace(-2, 4, 300)
+            try:
+                model = RidgeCV(alphas=alphas, store_cv_results=True)
+            except TypeError:
+                # sklearn < 1.5
+                model = RidgeCV(alphas=alphas, store_cv_values=True)
+        estimator_params = self.kwargs.get("estimator_params", {})
+        if "alpha" in estimator_params:
+            raise ValueError("A path search chooses alpha: pass alphas instead of estimator_params['alpha']")
+        try:
+            model.set_params(**estimator_params)
+        except ValueError as error:
+            raise ValueError(f"estimator_params do not apply to {model.__class__.__name__}: {error}")
+        return model
+
+    def add_path_search(self):
+        self.pipeline.set_params(rgs=self.get_path_estimator())
+
+    def log_path_search(self):
+        """Stores the validation curve of a fitted path search and logs the chosen alpha"""
+        rgs = self.pipeline.named_steps['rgs']
+        if isinstance(rgs, RidgeCV):
+            cv_results = getattr(rgs, "cv_results_", None)
+            if cv_results is None:
+                cv_results = rgs.cv_values_
+            curve = pd.DataFrame({'alpha': rgs.alphas,
+                                  'mse': cv_results.reshape(-1, len(rgs.alphas)).mean(axis=0)})
+        elif isinstance(rgs, ElasticNetCV):
+            l1_ratios = np.ravel(rgs.l1_ratio)
+            curve = pd.DataFrame({'l1_ratio': np.repeat(l1_ratios, rgs.alphas_.shape[-1]),
+                                  'alpha': np.ravel(rgs.alphas_),
+                                  'mse': rgs.mse_path_.reshape(-1, rgs.mse_path_.shape[-1]).mean(axis=1)})
+            self.mlflow_log_param("l1_ratio", rgs.l1_ratio_)
+        else:
+            curve = pd.DataFrame({'alpha': rgs.alphas_, 'mse': rgs.mse_path_.mean(axis=1)})
+        self.validation_curve = curve
+        self.mlflow_log_param("alpha", rgs.alpha_)
+        self.mlflow_log_metric("cv_mse", curve['mse'].min())
+        print(colored("alpha: {} (cv mse {}, {} alphas evaluated)".format(
+            rgs.alpha_, round(curve['mse'].min(), 4), len(curve)), "blue"))
 
     def add_grid_search(self):
         """"
@@ -152,6 +265,9 @@ class Trainer(object):
           'rgs__max_features' : ['auto', 'sqrt'],
           'rgs__max_depth' : [int(x) for x in np.linspace(10, 110, num = 11)]}
         """
+        if self.search == "path":
+            self.add_path_search()
+            return
         # Here to apply ramdom search to pipeline, need to follow naming "rgs__paramname"
         params = {"rgs__" + k: v for k, v in self.model_params.items()}
         self.pipeline = RandomizedSearchCV(estimator=self.pipeline, param_distributions=params,
@@ -159,15 +275,18 @@ class Trainer(object):
                                            cv=3,
                                            verbose=1,
                                            random_state=42,
-                                           n_jobs=None)
+                                           n_jobs=self.kwargs.get("n_jobs", None))
 
-    # @simple_time_tracker
+    @timed('trainer.train')
     def train(self, gridsearch=False):
         tic = time.time()
-        self.set_pipeline()
+        self.set_pipeline(gridsearch)
         if gridsearch:
             self.add_grid_search()
         self.pipeline.fit(self.X_train, self.y_train)
+        self.prune_memory()
+        if gridsearch and self.search == "path":
+            self.log_path_search()
         # mlflow logs
         self.mlflow_log_metric("train_time", int(time.time() - tic))
 
@@ -187,22 +306,23 @@ class Trainer(object):
         r2 = self.pipeline.score(X_test, y_test)
         return round(r2, 4)
 
-    def save_model(self, upload=True, auto_remove=True):
-        """Save the model into a .joblib and upload it on Google Storage /models folder
-        HINTS : use sklearn.joblib (or jbolib) libraries and google-cloud-storage"""
-        joblib.dump(self.pipeline, 'model.joblib')
-        # print(colored("model.joblib saved locally", "green"))
-
-        # Add upload of model.joblib to storage here
-        # version = self.kwargs.get('version', None)
-        # if version:
-        #     storage_upload(model_version=version)
-        # else:
-        #     storage_upload()
+    def save_model(self):
+        """Register the model as a new version of the local model registry, with the
+        estimator, the trainer's params and the metrics recorded so far"""
+        # a random search registers its refitted best pipeline
+        pipeline = getattr(self.pipeline, 'best_estimator_', self.pipeline)
+        metadata = dict(estimator=pipeline.steps[-1][1].__class__.__name__,
+                        name=self.kwargs.get('version'), nrows=self.nrows,
+                        params=self.kwargs, metrics=self.metrics)
+        self.version = self.registry.register(pipeline, metadata)
+        print(colored(f"model registered as {self.version} in {self.registry.path}", "green"))
 
     ### MLFlow methods
     @memoized_property
     def mlflow_client(self):
+        # mlflow takes seconds to import, only pay for it when logging
+        import mlflow
+        from mlflow.tracking import MlflowClient
         mlflow.set_tracking_uri(MLFLOW_URI)
         return MlflowClient()
 
@@ -222,6 +342,7 @@ class Trainer(object):
             self.mlflow_client.log_param(self.mlflow_run.info.run_id, key, value)
 
     def mlflow_log_metric(self, key, value):
+        self.metrics[key] = value
         if self.mlflow:
             self.mlflow_client.log_metric(self.mlflow_run.info.run_id, key, value)
 
@@ -238,6 +359,9 @@ class Trainer(object):
                 self.mlflow_log_param(k, v)
 
     def log_machine_specs(self):
+        if not self.mlflow:
+            return
+        from psutil import virtual_memory
         cpus = multiprocessing.cpu_count()
         mem = virtual_memory()
         ram = int(mem.total / 1000000000)
@@ -250,12 +374,11 @@ if __name__ == "__main__":
     # Get and clean data
     experiment = "[GB] [London] [EdLandamore] FiveStar v1"
     params = dict(nrows=None,
-                  upload=False, # upload model.job lib to strage if set to True
                   local=True,  # set to False to get data from GCP Storage
                   gridsearch=False,
                   optimize=False,
                   estimator="Ridge",
-                  mlflow=True,  # set to True to log params to mlflow
+                  mlflow=False,  # set to True to log params to mlflow
                   experiment_name=experiment,
                   version='ridge_v1')
     print("############   Loading Data   ############")
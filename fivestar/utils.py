@@ -1,25 +1,49 @@
-import time
+import numpy as np
 import pandas as pd
 
-from fivestar.params import BOROUGHS, PRICES
+from fivestar.params import BOROUGHS, PRICES, STRICT_POLICIES
 
 def decode_amenities(df):
-    data = df.copy()
     def str_to_list(strn):
         row_items = strn[1:-1].split(',')
         for key,item in enumerate(row_items):
             row_items[key] = item.strip('"').casefold()
         return row_items
-    return data[['amenities']].applymap(str_to_list)
+    return df[['amenities']].applymap(str_to_list)
+
+def amenity_tokens(amenities):
+    '''Splits an amenities column into one casefolded token per entry, indexed by
+    the row position of the listing it came from'''
+    rows = [strn[1:-1].casefold().split(',') if isinstance(strn, str) else []
+            for strn in amenities.to_numpy()]
+    positions = np.repeat(np.arange(len(rows)), [len(row) for row in rows])
+    return pd.Series([item.strip('"') for row in rows for item in row], index=positions, dtype=object)
+
+def amenity_column_name(item):
+    '''Column name used for a key amenity (or the first alias of a list of aliases)'''
+    if isinstance(item, list):
+        item = item[0]
+    return ''.join([i for i in item if i.isalpha()])
+
+def amenity_index(amenities):
+    '''Builds an inverted index mapping each casefolded amenity to the sorted row
+    positions of the listings that offer it'''
+    tokens = amenity_tokens(amenities)
+    tokens = tokens[tokens != '']
+    codes, vocabulary = pd.factorize(tokens.to_numpy())
+    order = np.argsort(codes, kind='stable')
+    bounds = np.cumsum(np.bincount(codes, minlength=len(vocabulary)))[:-1]
+    postings = np.split(tokens.index.to_numpy()[order], bounds)
+    return {amenity: np.unique(rows) for amenity, rows in zip(vocabulary, postings)}
 
 def has_amenity(df, name, alias=None):
-    data = df
     if not alias:
         alias = name
-    amenities = decode_amenities(data)
+    tokens = amenity_tokens(df['amenities'])
     col_name = f'has_{alias}'
-    amenities[col_name] = amenities[['amenities']].applymap(lambda x: 1 if name.casefold() in x else 0)
-    return amenities[[col_name]]
+    flags = np.zeros(df.shape[0], dtype=np.int64)
+    flags[tokens.index[(tokens == name.casefold()).to_numpy()]] = 1
+    return pd.DataFrame({col_name: flags}, index=df.index)
 
 def count_amenity(df, name):
     data = has_amenity(df, name)
@@ -27,10 +51,8 @@ def count_amenity(df, name):
 
 def price_tonumerical(df, price_columns):
     '''This function takes as input a dataframe and a list of price column names and
-    converts the columnns to floats'''
-    for column in price_columns:
-        df[[column]] = df[[column]].applymap(str_to_price)
-    return df[price_columns]
+    returns the columns converted to floats'''
+    return df[price_columns].apply(parse_prices)
 
 def str_to_price(strn):
     '''The function converts a price entry from string to float and removes the $ character'''
@@ -38,10 +60,23 @@ def str_to_price(strn):
         return float(strn.strip('$').replace(',',''))
     return strn
 
+def parse_prices(prices):
+    '''Vectorized str_to_price for a whole column of prices (already parsed columns pass through)'''
+    if pd.api.types.is_numeric_dtype(prices):
+        return prices.astype(float)
+    return pd.to_numeric(prices.astype(str).str.strip('$').str.replace(',', '', regex=False),
+                         errors='coerce')
+
+def parse_rates(rates):
+    '''Converts a column of percentage strings ("95%") to floats (already parsed columns pass through)'''
+    if pd.api.types.is_numeric_dtype(rates):
+        return rates.astype(float)
+    return pd.to_numeric(rates.astype(str).str.strip('%'), errors='coerce')
+
 def house_prices(data):
     house_price_dict = {k: v for k, v in zip(BOROUGHS, PRICES)}
-    data['mean_house_prices']= data['neighbourhood_cleansed'].map(house_price_dict)
-    return data[['mean_house_prices']]
+    mean_house_prices = data['neighbourhood_cleansed'].map(house_price_dict).astype(float)
+    return pd.DataFrame({'mean_house_prices': mean_house_prices}, index=data.index)
 
 def cancel_policy(listing_data):
     if recode_cancel(listing_data['cancellation_policy']) == 'strict':
@@ -49,13 +84,20 @@ def cancel_policy(listing_data):
     return 'No'
 
 def get_ranking(series, value):
-    tmp = series.tolist()
-    tmp.append(value)
-    ranking = pd.Series(tmp).rank(method='min',ascending=False,pct=True).iloc[-1]
-    return ranking
-    
+    '''Percentile rank (highest score first) that value would get if it was added to series'''
+    scores = np.asarray(series, dtype=float)
+    scores = scores[~np.isnan(scores)]
+    return ranking_in_sorted(np.sort(scores), value)
+
+def ranking_in_sorted(sorted_scores, value):
+    '''Same as get_ranking, for scores already sorted in ascending order (binary search)'''
+    if np.isnan(value):
+        return np.nan
+    higher = len(sorted_scores) - np.searchsorted(sorted_scores, value, side='right')
+    return (higher + 1) / (len(sorted_scores) + 1)
+
 def recode_cancel(n):
-    if n in ('strict_14_with_grace_period','super_strict_30', 'super_strict_60', 'strict'):
+    if n in STRICT_POLICIES:
         recode = 'strict'
     elif n in ('moderate','flexible'):
         recode = n
@@ -80,23 +122,6 @@ def cancel_policy_is_strict(cancel_entry):
     return 0
 
 def is_instant_bookable(tf):
-    return 1 if tf == 't' else 0
-
-
-################
-#  DECORATORS  #
-################
-
-def simple_time_tracker(method):
-    def timed(*args, **kw):
-        ts = time.time()
-        result = method(*args, **kw)
-        te = time.time()
-        if 'log_time' in kw:
-            name = kw.get('log_name', method.__name__.upper())
-            kw['log_time'][name] = int((te - ts))
-        else:
-            print(method.__name__, round(te - ts, 2))
-        return result
-
-    return timed
+    # 't' in the raw snapshot, True once parsed by fivestar.schema
+    return 1 if tf is True or tf is np.True_ or (isinstance(tf, str) and tf == 't') else 0
+
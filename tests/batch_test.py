@@ -0,0 +1,30 @@
+# -*- coding: UTF-8 -*-
+
+# Import from standard library
+import joblib
+import numpy as np
+import pandas as pd
+# Import from our lib
+from fivestar.batch import score_file
+from fivestar.synthetic import make_listings
+from fivestar.trainer import Trainer
+
+
+def test_score_file(tmp_path):
+    listings = make_listings()
+    trainer = Trainer(X=listings.drop(columns='review_scores_rating'), y=listings['review_scores_rating'])
+    trainer.train()
+    joblib.dump(trainer.pipeline, tmp_path / 'model.joblib')
+
+    snapshot = make_listings(250, seed=3)
+    snapshot.to_csv(tmp_path / 'listings.csv', index=False)
+    expected = trainer.pipeline.predict(snapshot)
+
+    for n_jobs in [1, 2]:
+        output = str(tmp_path / f'predictions_{n_jobs}.parquet')
+        scored = score_file(str(tmp_path / 'listings.csv'), output, model_path=str(tmp_path / 'model.joblib'),
+                            chunksize=60, n_jobs=n_jobs)
+        predictions = pd.read_parquet(output)
+        assert scored == 250
+        assert predictions['id'].tolist() == snapshot['id'].tolist()
+        assert np.allclose(predictions['prediction'], expected)
@@ -0,0 +1,121 @@
+# -*- coding: UTF-8 -*-
+
+# Import from standard library
+import numpy as np
+import pandas as pd
+import pytest
+# Import from our lib
+from fivestar.clusters import ClusterIndex, user_ranking, top_rated, clustering, borough_percentiles
+from fivestar.clusters import build_clusters, get_cluster_ranking, price_categories, str_to_price
+from fivestar.data import clear_datasets, load_cluster_percentiles, load_dataset
+from fivestar.synthetic import make_snapshot
+from fivestar.utils import get_ranking
+
+
+def make_clusters():
+    rng = np.random.default_rng(0)
+    n = 300
+    return pd.DataFrame({
+        'location': rng.choice(['Camden', 'Hackney'], n),
+        'price-boroughwise': rng.choice(['cheap', 'average'], n),
+        'property_type': rng.choice(['room', 'small', 'large'], n),
+        'review_scores_rating': rng.integers(60, 101, n).astype(float),
+        'listing_id': np.arange(n) + 1000,
+    })
+
+
+def test_user_ranking_matches_rank():
+    clusters = make_clusters()
+    index = ClusterIndex(clusters)
+    percentiles = {'Camden': [0, 50, 60, 70, 80, 90, 100, 110, 120]}
+    for listing_id in clusters[(clusters['location'] == 'Camden') &
+                               (clusters['price-boroughwise'] == 'cheap') &
+                               (clusters['property_type'] == 'room')]['listing_id']:
+        rank, average, scores = user_ranking('Camden', 55, 'Private room', 1, listing_id, index, percentiles)
+        cluster = clusters[(clusters['location'] == 'Camden') &
+                           (clusters['price-boroughwise'] == 'cheap') &
+                           (clusters['property_type'] == 'room')].copy()
+        cluster['ranking'] = cluster['review_scores_rating'].rank(method='min', ascending=False, pct=True)
+        assert rank == float(cluster[cluster['listing_id'] == listing_id]['ranking'])
+        assert np.isclose(average, cluster['review_scores_rating'].mean())
+        for score in [50., 75., 88., 100., 120.]:
+            assert np.isclose(index.rank_with(('Camden', 'cheap', 'room'), score),
+                              get_ranking(cluster['review_scores_rating'], score))
+
+
+def test_rank_of_a_listing_outside_the_cluster():
+    clusters = pd.DataFrame({'location': ['Camden', 'Camden', 'Hackney'],
+                             'price-boroughwise': ['cheap', 'cheap', 'cheap'],
+                             'property_type': ['room', 'room', 'room'],
+                             'review_scores_rating': [60., 90., 95.],
+                             'listing_id': [1, 2, 3]})
+    index = ClusterIndex(clusters)
+    assert index.rank(('Camden', 'cheap', 'room'), 1) == 1
+    # the lowest score of Camden is not ranked in the single-listing cluster of Hackney
+    assert np.isnan(index.rank(('Hackney', 'cheap', 'room'), 1))
+    assert np.isnan(index.rank(('Hackney', 'cheap', 'room'), 4))
+    assert index.rank(('Hackney', 'cheap', 'room'), 3) == 1
+
+
+def test_top_rated():
+    clusters = make_clusters()
+    percentiles = {'Hackney': [0, 50, 60, 70, 80, 90, 100, 110, 120]}
+    top = top_rated('Hackney', 85, 'large', clusters, top=5, percentiles=percentiles)
+    cluster = clusters[(clusters['location'] == 'Hackney') &
+                       (clusters['price-boroughwise'] == 'average') &
+                       (clusters['property_type'] == 'large')]
+    assert len(top) == round(len(cluster) / 5)
+    top_scores = cluster.set_index('listing_id').loc[top, 'review_scores_rating']
+    assert top_scores.min() >= cluster['review_scores_rating'].nlargest(len(top)).min()
+
+
+def test_clustering():
+    listings = pd.DataFrame({
+        'id': [1, 2, 3, 4, 5],
+        'neighbourhood_cleansed': ['Camden'] * 4 + ['Hackney'],
+        'price': ['$10.00', '$1,200.00', '$50.00', np.nan, '$80.00'],
+        'bedrooms': [1, 3, 0, 2, np.nan],
+        'room_type': ['Entire home/apt', 'Entire home/apt', 'Private room', 'Entire home/apt', 'Private room'],
+        'review_scores_rating': [90., 80., 70., 60., 50.],
+        'latitude': [51.5] * 5,
+        'longitude': [-0.1] * 5,
+    })
+    percentiles = {'Camden': [0, 20, 0, 60, 0, 100, 0, 1000, 0], 'Hackney': [0] * 9}
+    clusters = clustering(listings, percentiles)
+    assert clusters['cluster'].tolist() == ['L:Camden_P:very_cheap_S:small',
+                                            'L:Camden_P:very_expensive_S:large',
+                                            'L:Camden_P:cheap_S:room',
+                                            'L:Camden_P:very_expensive_S:large',
+                                            'L:Hackney_P:very_expensive_S:room']
+    assert borough_percentiles(listings)['Hackney'] == [80.] * 9
+
+
+def test_unknown_neighbourhood_has_no_price_category():
+    prices = pd.Series([10., 200.])
+    percentiles = {'Camden': [0, 20, 0, 60, 0, 100, 0, 1000, 0]}
+    categories = price_categories(prices, pd.Series(['Camden', 'Paris 1er']), percentiles)
+    assert categories.tolist() == ['very_cheap', None]
+    with pytest.raises(ValueError):
+        top_rated('Paris 1er', 85, 'large', make_clusters(), percentiles={'Camden': [0] * 9})
+
+
+def test_rankings_use_the_percentiles_clusters_were_built_with(tmp_path, monkeypatch):
+    monkeypatch.setattr('fivestar.data.DATA_PATH', f'{tmp_path}/')
+    monkeypatch.setattr('fivestar.data.CACHE_PATH', str(tmp_path / 'cache'))
+    listings = make_snapshot(500, seed=0, boroughs=2)
+    listings['neighbourhood_cleansed'] = listings['neighbourhood_cleansed'].map(
+        dict(zip(listings['neighbourhood_cleansed'].unique(), ['Le Marais', 'Belleville'])))
+    listings.to_csv(tmp_path / 'listings.csv', index=False)
+    percentiles = build_clusters(listings, f'{tmp_path}/')
+    clear_datasets()
+    try:
+        assert load_cluster_percentiles() == percentiles
+        clusters = load_dataset('clusters').dropna(subset=['review_scores_rating'])
+        row = clusters.iloc[0]
+        listing = listings.set_index('id').loc[row['listing_id']]
+        rank, average, scores = get_cluster_ranking(row['location'], str_to_price(listing['price']),
+                                                    listing['room_type'], listing['bedrooms'], row['listing_id'])
+        members = clusters[clusters['cluster'] == row['cluster']]
+        assert len(scores) == len(members) and 0 < rank <= 1
+    finally:
+        clear_datasets()
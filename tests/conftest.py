@@ -0,0 +1,25 @@
+# -*- coding: UTF-8 -*-
+
+import pytest
+# Import from our lib
+from fivestar.data import clear_datasets, get_data
+from fivestar.lib import FiveStar
+from fivestar.registry import ModelRegistry
+from fivestar.synthetic import write_snapshot
+from fivestar.trainer import Trainer
+
+
+@pytest.fixture
+def fivestar(tmp_path, monkeypatch):
+    '''FiveStar of a synthetic snapshot, serving a Ridge model from a scratch registry'''
+    monkeypatch.setattr('fivestar.data.DATA_PATH', f'{tmp_path}/')
+    monkeypatch.setattr('fivestar.data.CACHE_PATH', str(tmp_path / 'cache'))
+    write_snapshot(str(tmp_path), 2000, seed=0)
+    clear_datasets()
+    listings = get_data()
+    trainer = Trainer(X=listings.drop(columns='review_scores_rating'), y=listings['review_scores_rating'],
+                      registry=str(tmp_path / 'models'))
+    trainer.train()
+    trainer.save_model()
+    yield FiveStar(ModelRegistry(tmp_path / 'models'))
+    clear_datasets()
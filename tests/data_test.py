@@ -0,0 +1,150 @@
+# -*- coding: UTF-8 -*-
+
+# Import from standard library
+import os
+import pandas as pd
+# Import from our lib
+from fivestar.data import get_data, read_csv_cached, load_dataset, load_id_index, clear_datasets
+from fivestar.fetch import fetch
+
+
+def test_read_csv_cached(tmp_path):
+    csv = tmp_path / 'clusters.csv'
+    cache = tmp_path / 'cache'
+    pd.DataFrame({'listing_id': [1, 2], 'cluster': ['a', None]}).to_csv(csv, index=False)
+
+    first = read_csv_cached(str(csv), {}, cache_path=str(cache))
+    assert len(os.listdir(cache)) == 1
+    second = read_csv_cached(str(csv), {}, cache_path=str(cache))
+    pd.testing.assert_frame_equal(first, second)
+    assert second['cluster'].isna().tolist() == [False, True]
+
+    pd.DataFrame({'listing_id': [3], 'cluster': ['b']}).to_csv(csv, index=False)
+    os.utime(csv, ns=(0, 0))
+    third = read_csv_cached(str(csv), {}, cache_path=str(cache))
+    assert third['listing_id'].tolist() == [3]
+    assert len(os.listdir(cache)) == 1
+
+
+def test_read_csv_cached_keeps_every_parse_variant(tmp_path):
+    csv = tmp_path / 'clusters.csv'
+    cache = tmp_path / 'cache'
+    pd.DataFrame({'listing_id': [1, 2], 'cluster': ['a', 'b']}).to_csv(csv, index=False)
+
+    read_csv_cached(str(csv), {}, cache_path=str(cache))
+    read_csv_cached(str(csv), {'nrows': 1}, cache_path=str(cache))
+    assert len(os.listdir(cache)) == 2
+    # both are served from their feather copy
+    mtimes = sorted(os.stat(cache / name).st_mtime_ns for name in os.listdir(cache))
+    assert read_csv_cached(str(csv), {}, cache_path=str(cache))['listing_id'].tolist() == [1, 2]
+    assert read_csv_cached(str(csv), {'nrows': 1}, cache_path=str(cache))['listing_id'].tolist() == [1]
+    assert sorted(os.stat(cache / name).st_mtime_ns for name in os.listdir(cache)) == mtimes
+
+
+def test_read_csv_cached_keeps_csvs_of_the_same_name(tmp_path):
+    cache = tmp_path / 'cache'
+    for directory, ids in [('a', [1, 2]), ('b', [3])]:
+        (tmp_path / directory).mkdir()
+        pd.DataFrame({'listing_id': ids}).to_csv(tmp_path / directory / 'listings.csv', index=False)
+
+    def ids(directory):
+        return read_csv_cached(str(tmp_path / directory / 'listings.csv'), {}, cache_path=str(cache))['listing_id']
+
+    for _ in range(2):
+        assert ids('a').tolist() == [1, 2] and ids('b').tolist() == [3]
+        # one feather copy per csv, neither removing the other's
+        assert len(os.listdir(cache)) == 2
+
+
+def test_read_csv_cached_without_a_writable_cache(tmp_path):
+    csv = tmp_path / 'clusters.csv'
+    pd.DataFrame({'listing_id': [1, 2]}).to_csv(csv, index=False)
+    # a file where the cache directory should be: nothing can be written under it
+    (tmp_path / 'cache').write_text('')
+    for _ in range(2):
+        assert read_csv_cached(str(csv), {}, cache_path=str(tmp_path / 'cache'))['listing_id'].tolist() == [1, 2]
+    assert sorted(os.listdir(tmp_path)) == ['cache', 'clusters.csv']
+
+
+def test_get_data_wordcount(tmp_path, monkeypatch):
+    monkeypatch.setattr('fivestar.data.CACHE_PATH', str(tmp_path / 'cache'))
+    pd.DataFrame({'quotes': ['great location'], 'count': [3], 'cluster': ['All']}).to_csv(
+        tmp_path / 'word_counts2.csv', index=False)
+    df = get_data('wordcount', path=f'{tmp_path}/')
+    assert df['count'].tolist() == [3]
+
+
+def test_load_dataset_reads_once(monkeypatch):
+    calls = []
+    def fake_get_data(file, **kwargs):
+        calls.append(file)
+        return pd.DataFrame({'listing_id': [1, 2], 'cluster': ['a', 'b']})
+    monkeypatch.setattr('fivestar.data.get_data', fake_get_data)
+    clear_datasets()
+
+    first = load_dataset('clusters')
+    first['extra'] = 1
+    second = load_dataset('clusters')
+    assert calls == ['clusters']
+    assert 'extra' not in second.columns
+    clear_datasets()
+
+
+def test_load_id_index(monkeypatch):
+    monkeypatch.setattr('fivestar.data.get_data',
+                        lambda file, **kwargs: pd.DataFrame({'listing_id': [7, 5, 7]}))
+    clear_datasets()
+    assert load_id_index('clusters', 'listing_id') == {7: 0, 5: 1}
+    clear_datasets()
+
+
+def test_get_data_fetches_bucket_files_once(tmp_path, monkeypatch):
+    bucket = tmp_path / 'bucket'
+    bucket.mkdir()
+    pd.DataFrame({'listing_id': [1, 2], 'cluster': ['a', 'b']}).to_csv(bucket / 'clusters.csv', index=False)
+    monkeypatch.setattr('fivestar.data.BUCKET_URL', f'file://{bucket}')
+    monkeypatch.setattr('fivestar.data.CACHE_PATH', str(tmp_path / 'cache'))
+    monkeypatch.setattr('fivestar.fetch.CACHE_PATH', str(tmp_path / 'cache'))
+    monkeypatch.setattr('fivestar.fetch._verified', set())
+
+    first = get_data('clusters', local=False)
+    # the bucket is not read again, within this process or another one
+    (bucket / 'clusters.csv').unlink()
+    assert get_data('clusters', local=False).equals(first)
+    monkeypatch.setattr('fivestar.fetch._verified', set())
+    assert get_data('clusters', local=False)['cluster'].tolist() == ['a', 'b']
+
+
+def test_fetch_verifies_and_refreshes(tmp_path, monkeypatch):
+    import fsspec
+    downloads = []
+
+    class Bucket(fsspec.implementations.local.LocalFileSystem):
+        def get_file(self, rpath, lpath, **kwargs):
+            downloads.append(rpath)
+            return super().get_file(rpath, lpath, **kwargs)
+
+    monkeypatch.setattr('fivestar.fetch._verified', set())
+    bucket, cache = tmp_path / 'bucket', str(tmp_path / 'cache')
+    bucket.mkdir()
+    url = str(bucket / 'word_counts2.csv')
+    (bucket / 'word_counts2.csv').write_text('quotes,count,cluster\ngreat location,3,All\n')
+
+    local = fetch(url, cache_path=cache, fs=Bucket())
+    assert fetch(url, cache_path=cache, fs=Bucket()) == local
+    assert fetch(url, cache_path=cache, fs=Bucket(), refresh=True) == local
+    assert len(downloads) == 1 and os.path.basename(local) == 'word_counts2.csv'
+
+    # a corrupted copy is downloaded again
+    monkeypatch.setattr('fivestar.fetch._verified', set())
+    with open(local, 'a') as f:
+        f.write('bad')
+    assert open(fetch(url, cache_path=cache, fs=Bucket())).read().endswith('All\n')
+    assert len(downloads) == 2
+
+    # a changed file is only picked up on refresh, into a new content address
+    (bucket / 'word_counts2.csv').write_text('quotes,count,cluster\nlovely host,5,All\n')
+    os.utime(bucket / 'word_counts2.csv', ns=(0, 0))
+    assert fetch(url, cache_path=cache, fs=Bucket()) == local
+    refreshed = fetch(url, cache_path=cache, fs=Bucket(), refresh=True)
+    assert refreshed != local and 'lovely host' in open(refreshed).read()
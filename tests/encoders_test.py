@@ -0,0 +1,27 @@
+# -*- coding: UTF-8 -*-
+
+# Import from standard library
+import pandas as pd
+# Import from our lib
+from fivestar.encoders import AmenitiesEncoder
+
+
+def test_amenities_encoder():
+    X = pd.DataFrame({'amenities': ['{TV,Wifi,"Free street parking"}',
+                                    '{Breakfast,"Paid parking off premises"}',
+                                    '{Kitchen,"Wifi - slow"}',
+                                    '{}']},
+                     index=[10, 20, 30, 40])
+    encoded = AmenitiesEncoder().transform(X)
+    assert list(encoded.columns) == ['Freeparkingonpremises', 'Wifi', 'Breakfast']
+    assert list(encoded.index) == [10, 20, 30, 40]
+    assert encoded.values.tolist() == [[1, 1, 0], [1, 0, 1], [0, 0, 0], [0, 0, 0]]
+
+
+def test_amenities_encoder_many_amenities():
+    key_amenities = [f'Amenity {i}' for i in range(250)] + [['Wifi', 'Pocket wifi']]
+    X = pd.DataFrame({'amenities': ['{"Amenity 3","Pocket wifi"}', '{"Amenity 249"}']})
+    encoded = AmenitiesEncoder(key_amenities).transform(X)
+    assert encoded.shape == (2, 251)
+    assert encoded.sum(axis=1).tolist() == [2, 1]
+    assert encoded['Wifi'].tolist() == [1, 0]
@@ -0,0 +1,53 @@
+# -*- coding: UTF-8 -*-
+
+# Import from standard library
+import os
+import pandas as pd
+# Import from our lib
+from fivestar.data import clear_datasets
+from fivestar.get_wordcloud import build_wordclouds, get_wordcloud_png, load_wordcloud_png, png_path, wordcloud_dir
+
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+
+
+def fake_wordcounts(monkeypatch, counts):
+    wordcounts = pd.DataFrame({'cluster': ['All', 'All', 'L:Camden_P:cheap_S:room'],
+                               'quotes': ['great location', 'lovely host', 'quiet area'],
+                               'count': counts})
+    monkeypatch.setattr('fivestar.data.get_data', lambda file, **kwargs: wordcounts)
+    clear_datasets()
+    load_wordcloud_png.cache_clear()
+
+
+def test_build_and_serve_wordclouds(tmp_path, monkeypatch):
+    fake_wordcounts(monkeypatch, [10, 5, 3])
+    directory = build_wordclouds(str(tmp_path))
+    assert sorted(os.listdir(directory)) == ['All.png', 'L%3ACamden_P%3Acheap_S%3Aroom.png']
+
+    png = get_wordcloud_png('L:Camden_P:cheap_S:room', str(tmp_path))
+    assert png.startswith(PNG_SIGNATURE)
+    # clusters without word counts share the All image
+    assert get_wordcloud_png('L:Sutton_P:cheap_S:room', str(tmp_path)) == get_wordcloud_png('All', str(tmp_path))
+    assert load_wordcloud_png.cache_info().hits == 1
+    clear_datasets()
+
+
+def test_cache_miss_renders_and_stores(tmp_path, monkeypatch):
+    fake_wordcounts(monkeypatch, [10, 5, 3])
+    png = get_wordcloud_png('All', str(tmp_path))
+    assert png.startswith(PNG_SIGNATURE)
+    assert os.listdir(wordcloud_dir(str(tmp_path))) == ['All.png']
+
+    # new counts get their own directory of images, replacing the old one
+    old = wordcloud_dir(str(tmp_path))
+    fake_wordcounts(monkeypatch, [1, 50, 3])
+    get_wordcloud_png('All', str(tmp_path))
+    assert os.listdir(tmp_path / 'wordclouds') == [os.path.basename(wordcloud_dir(str(tmp_path)))]
+    assert not os.path.exists(old)
+    clear_datasets()
+
+
+def test_png_paths_of_distinct_labels_differ():
+    labels = ['L:Camden_P:cheap_S:room', 'L_Camden_P_cheap_S_room', 'L:Camden P:cheap S:room', 'a/b', 'a_b']
+    assert len({png_path('wordclouds', label) for label in labels}) == len(labels)
+    assert all(os.path.dirname(png_path('wordclouds', label)) == 'wordclouds' for label in labels)
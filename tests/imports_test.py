@@ -0,0 +1,23 @@
+# -*- coding: UTF-8 -*-
+
+# Import from standard library
+import json
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+LAZY_MODULES = ['streamlit', 'mlflow', 'gcsfs', 'google.cloud', 'category_encoders', 'wordcloud', 'matplotlib']
+
+
+def loaded_modules(module):
+    code = f"import json, sys, {module}; print(json.dumps([m for m in {LAZY_MODULES!r} if m in sys.modules]))"
+    run = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True,
+                         env=dict(os.environ, PYTHONPATH=ROOT))
+    return json.loads(run.stdout.strip().splitlines()[-1])
+
+
+def test_heavy_dependencies_are_imported_lazily():
+    for module in ['fivestar.lib', 'fivestar.clusters', 'fivestar.encoders', 'fivestar.trainer',
+                   'fivestar.get_wordcloud', 'fivestar.batch']:
+        assert loaded_modules(module) == [], module
@@ -5,9 +5,35 @@ import os
 import fivestar
 import pandas as pd
 # Import from our lib
-from fivestar.lib import FiveStar
+from fivestar.lib import FiveStar, value_grid, apply_new_values, predictions
 import pytest
 
 
 def test_clean_data():
     pass
+
+
+def test_value_grid():
+    grid = value_grid(price=[10, 20], Wifi=['No', 'Yes'])
+    assert grid == [{'price': 10, 'Wifi': 'No'}, {'price': 10, 'Wifi': 'Yes'},
+                    {'price': 20, 'Wifi': 'No'}, {'price': 20, 'Wifi': 'Yes'}]
+
+
+def test_apply_new_values():
+    listing = {'amenities': '{TV,Wifi}', 'instant_bookable': 'f', 'price': '$50.00'}
+    new = apply_new_values(listing, {'Wifi': 'No', 'Breakfast': 'Yes', 'instant_bookable': 'Yes', 'price': 80})
+    assert new == {'amenities': '{TV,Breakfast}', 'instant_bookable': 't', 'price': 80}
+    assert listing['amenities'] == '{TV,Wifi}'
+
+
+def test_batch_predictions_do_not_depend_on_the_batch(fivestar):
+    listing_ids = [int(listing_id) for listing_id in fivestar.listings['id'].iloc[:6]]
+    for values in [{'price': 80}, {'price': '$0.00'}, {'price': 0}]:
+        alone = [(listing_ids[0], values)]
+        together = alone + [(listing_id, {'price': 40 + 30 * i}) for i, listing_id in enumerate(listing_ids[1:])]
+        predictions.clear()
+        score = fivestar.predict_batch(alone)[1][0]
+        predictions.clear()
+        assert fivestar.predict_batch(together)[1][0] == score
+        predictions.clear()
+        assert fivestar.predict_on_new_values(listing_ids[0], values) == pytest.approx(score)
@@ -0,0 +1,82 @@
+# -*- coding: UTF-8 -*-
+
+# Import from standard library
+import numpy as np
+# Import from our lib
+from fivestar.lib import FiveStar, predictions
+from fivestar.memo import MemoCache, freeze
+from fivestar.registry import ModelRegistry
+from fivestar.synthetic import make_listings
+from fivestar.trainer import Trainer
+
+
+def test_memo_cache_bounds_and_counters():
+    memo = MemoCache(2)
+    calls = []
+    def compute(value):
+        calls.append(value)
+        return value * 10
+
+    assert memo.get('a', lambda: compute(1)) == 10
+    assert memo.get('a', lambda: compute(2)) == 10
+    memo.get('b', lambda: compute(3))
+    memo.get('a', lambda: compute(4))
+    # b is the least recently used one
+    memo.get('c', lambda: compute(5))
+    assert memo.get('b', lambda: compute(6)) == 60
+    assert calls == [1, 3, 5, 6]
+    assert memo.info() == dict(hits=2, misses=4, hit_rate=2 / 6, size=2, maxsize=2, evictions=2,
+                               invalidations=0)
+
+    # a new generation starts empty, results of the previous one are not stored
+    assert memo.get('a', lambda: compute(7), generation='v2') == 70
+    assert memo.info()['size'] == 1 and memo.info()['invalidations'] == 1
+    memo.store('x', 0, generation='v1')
+    assert memo.lookup('x', generation='v2') == (False, None)
+
+
+def test_freeze():
+    assert freeze({'price': 80, 'Wifi': 'Yes'}) == freeze({'Wifi': 'Yes', 'price': np.int64(80)})
+    assert hash(freeze({'amenities': ['TV', 'Wifi'], 'nested': {'a': 1}}))
+
+
+def test_fivestar_predictions_are_memoized_per_model_version(fivestar, tmp_path):
+    listing_id = int(fivestar.listings['id'].iloc[0])
+    values_list = [{'price': 80}, {'price': 120, 'Wifi': 'Yes'}]
+    predictions.clear()
+    invalidations = predictions.info()['invalidations']
+    first = fivestar.predict_on_many_values(listing_id, values_list)
+    hits = predictions.info()['hits']
+    assert np.array_equal(fivestar.predict_on_many_values(listing_id, values_list[::-1]), first[::-1])
+    assert predictions.info()['hits'] == hits + 2
+    version, scores = fivestar.predict_batch([(listing_id, {'Wifi': 'Yes', 'price': 120})])
+    assert version == 'v0001' and scores[0] == first[1]
+
+    # a new model version is not served the previous version's scores
+    listings = make_listings()
+    trainer = Trainer(X=listings.drop(columns='review_scores_rating'), y=listings['review_scores_rating'],
+                      registry=str(tmp_path / 'models'), estimator_params={'alpha': 1})
+    trainer.train()
+    trainer.save_model()
+    assert fivestar.model.refresh()
+    X = fivestar.build_X_batch(listing_id, values_list)
+    assert np.allclose(fivestar.predict_on_many_values(listing_id, values_list), trainer.pipeline.predict(X))
+    # the previous version's scores stay until the LRU evicts them
+    assert predictions.info()['size'] == 4 and predictions.info()['invalidations'] == invalidations
+
+
+def test_fivestar_instances_share_the_memo(fivestar):
+    listing_id = int(fivestar.listings['id'].iloc[0])
+    values_list = [{'price': 80}, {'price': 120, 'Wifi': 'Yes'}]
+    other = FiveStar(ModelRegistry(fivestar.model.registry.path))
+    # another instance serving another version of the model
+    other.model.loaded = ('v0000', other.model.pipeline)
+    predictions.clear()
+    before = predictions.info()
+    for _ in range(3):
+        fivestar.predict_on_many_values(listing_id, values_list)
+        other.predict_on_many_values(listing_id, values_list)
+    after = predictions.info()
+    # each instance computed its scores once, and they did not flush each other's
+    assert after['misses'] - before['misses'] == 4 and after['hits'] - before['hits'] == 8
+    assert after['invalidations'] == before['invalidations'] and after['size'] == 4
@@ -0,0 +1,121 @@
+# -*- coding: UTF-8 -*-
+
+# Import from standard library
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+# Import from our lib
+from fivestar.lib import apply_new_values
+from fivestar.export import export_pipeline
+from fivestar.model import LinearFastPath
+from fivestar.params import RECORD_COLUMNS
+from fivestar.scorer import NumpyScorer
+from fivestar.synthetic import make_listings
+from fivestar.trainer import Trainer, feature_code_version
+
+
+def test_linear_fast_path_matches_pipeline():
+    listings = make_listings()
+    trainer = Trainer(X=listings.drop(columns='review_scores_rating'), y=listings['review_scores_rating'])
+    trainer.train()
+    pipeline = trainer.pipeline
+    assert LinearFastPath.supports(pipeline)
+
+    values_list = [{}, {'price': 120, 'Wifi': 'Yes', 'Breakfast': 'No'},
+                   {'review_scores_cleanliness': 3, 'instant_bookable': 'No', 'cancellation_policy': 'Yes'},
+                   {'price': 35, 'Wifi': 'No', 'Breakfast': 'Yes', 'instant_bookable': 'Yes'}]
+    for listing in make_listings(20, seed=1)[RECORD_COLUMNS].to_dict('records'):
+        fast_path = LinearFastPath(pipeline, listing)
+        for values in values_list:
+            attributes = apply_new_values(listing, values)
+            expected = pipeline.predict(pd.DataFrame([attributes]))[0]
+            assert np.isclose(fast_path.predict(attributes), expected)
+
+
+def test_numpy_scorer_matches_pipeline(tmp_path):
+    listings = make_listings()
+    trainer = Trainer(X=listings.drop(columns='review_scores_rating'), y=listings['review_scores_rating'])
+    trainer.train()
+    export_pipeline(trainer.pipeline, tmp_path / 'model.json')
+    scorer = NumpyScorer.load(tmp_path / 'model.json')
+
+    new_listings = make_listings(50, seed=2)[RECORD_COLUMNS]
+    # a price that can't be logged gets the training median, as in the pipeline
+    new_listings.iloc[0, new_listings.columns.get_loc('price')] = '$0.00'
+    expected = trainer.pipeline.predict(new_listings.copy())
+    assert np.allclose(scorer.predict(new_listings.to_dict('records')), expected)
+    assert np.allclose(scorer.predict({c: new_listings[c].tolist() for c in RECORD_COLUMNS}), expected)
+
+
+def test_grid_search_fits_features_once_per_fold(tmp_path):
+    listings = make_listings()
+    X, y = listings.drop(columns='review_scores_rating'), listings['review_scores_rating']
+    fits = tmp_path / 'joblib' / 'sklearn' / 'pipeline' / '_fit_transform_one'
+
+    trainer = Trainer(X=X, y=y, pipeline_memory=str(tmp_path))
+    trainer.model_params = {'alpha': [1, 5, 10, 50, 100]}
+    trainer.train(gridsearch=True)
+    # 3 CV folds plus the final refit, whatever the number of candidates
+    assert len([entry for entry in fits.iterdir() if entry.is_dir()]) == 4
+
+    trainer = Trainer(X=X, y=y, pipeline_memory=str(tmp_path))
+    trainer.model_params = {'alpha': [20, 200]}
+    trainer.train(gridsearch=True)
+    assert len([entry for entry in fits.iterdir() if entry.is_dir()]) == 4
+
+
+def test_persistent_feature_fits_follow_the_feature_code(tmp_path, monkeypatch):
+    listings = make_listings()
+    X, y = listings.drop(columns='review_scores_rating'), listings['review_scores_rating']
+    monkeypatch.setattr('fivestar.trainer.CACHE_PATH', str(tmp_path))
+    (tmp_path / 'pipeline' / 'fits-of-older-encoders').mkdir(parents=True)
+
+    trainer = Trainer(X=X, y=y)
+    trainer.model_params = {'alpha': [1, 10]}
+    trainer.train(gridsearch=True)
+    # the fits of another version of the encoders are dropped
+    assert os.listdir(tmp_path / 'pipeline') == [feature_code_version()]
+    fits = tmp_path / 'pipeline' / feature_code_version() / 'joblib' / 'sklearn' / 'pipeline'
+    fits = fits / '_fit_transform_one'
+    assert len(os.listdir(fits)) > 1
+
+    # and the cache is pruned to its size limit after every fit
+    monkeypatch.setattr('fivestar.trainer.PIPELINE_CACHE_BYTES', 1)
+    trainer.train(gridsearch=True)
+    assert [entry for entry in os.listdir(fits) if entry != 'func_code.py'] == []
+
+
+def test_path_search_reports_validation_curve():
+    listings = make_listings()
+    X, y = listings.drop(columns='review_scores_rating'), listings['review_scores_rating']
+
+    trainer = Trainer(X=X, y=y, search='path', alphas=np.logspace(-2, 4, 50))
+    trainer.train(gridsearch=True)
+    curve = trainer.validation_curve
+    rgs = trainer.pipeline.named_steps['rgs']
+    assert len(curve) == 50
+    assert rgs.alpha_ == curve.loc[curve['mse'].idxmin(), 'alpha']
+    assert LinearFastPath.supports(trainer.pipeline)
+
+    trainer = Trainer(X=X, y=y, search='path', estimator='ElasticNet', l1_ratio=[.5, 1])
+    trainer.train(gridsearch=True)
+    assert len(trainer.validation_curve) == 2 * 200
+    assert set(trainer.validation_curve['l1_ratio']) == {.5, 1}
+
+
+def test_path_search_takes_estimator_params():
+    listings = make_listings()
+    X, y = listings.drop(columns='review_scores_rating'), listings['review_scores_rating']
+
+    trainer = Trainer(X=X, y=y, search='path', estimator='Lasso', estimator_params={'fit_intercept': False})
+    trainer.train(gridsearch=True)
+    assert trainer.pipeline.named_steps['rgs'].intercept_ == 0
+
+    trainer = Trainer(X=X, y=y, search='path', estimator_params={'alpha': 10})
+    with pytest.raises(ValueError, match='alphas'):
+        trainer.train(gridsearch=True)
+    trainer = Trainer(X=X, y=y, search='path', estimator_params={'max_iter': 10})
+    with pytest.raises(ValueError, match='RidgeCV'):
+        trainer.train(gridsearch=True)
@@ -0,0 +1,22 @@
+# -*- coding: UTF-8 -*-
+
+# Import from standard library
+import pandas as pd
+# Import from our lib
+from fivestar.params import RECORD_COLUMNS
+from fivestar.records import ListingStore
+
+
+def test_listing_store():
+    listings = pd.DataFrame({column: [1, 2, 3] for column in RECORD_COLUMNS})
+    listings['id'] = [101, 102, 103]
+    listings['name'] = ['a', 'b', 'c']
+    listings['description'] = 'long free text'
+    store = ListingStore(listings, {101: 0, 102: 1, 103: 2})
+
+    record = store[102]
+    assert record['name'] == 'b'
+    assert record.get('description') is None
+    assert type(record['accommodates']) is int
+    assert set(record.to_dict()) == set(RECORD_COLUMNS)
+    assert 104 not in store
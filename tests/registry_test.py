@@ -0,0 +1,113 @@
+# -*- coding: UTF-8 -*-
+
+# Import from standard library
+import os
+import threading
+
+import numpy as np
+import pytest
+# Import from our lib
+from fivestar.model import Model
+from fivestar.params import RECORD_COLUMNS
+from fivestar.registry import ModelRegistry
+from fivestar.synthetic import make_listings
+from fivestar.trainer import Trainer
+
+
+def train(tmp_path, alpha, seed=0):
+    listings = make_listings(seed=seed)
+    trainer = Trainer(X=listings.drop(columns='review_scores_rating'), y=listings['review_scores_rating'],
+                      registry=str(tmp_path), estimator_params={'alpha': alpha})
+    trainer.train()
+    trainer.evaluate()
+    return trainer
+
+
+def test_register_and_load(tmp_path):
+    registry = ModelRegistry(tmp_path)
+    assert registry.latest() is None
+    # an empty registry says how to fill it
+    with pytest.raises(FileNotFoundError, match='python -m fivestar.trainer'):
+        registry.load()
+
+    trainer = train(tmp_path, 50)
+    trainer.save_model()
+    assert trainer.version == 'v0001' == registry.latest()
+    metadata = registry.metadata()
+    assert metadata['estimator'] == 'Ridge'
+    assert 'r2_train' in metadata['metrics']
+    assert registry.verify()
+
+    # loaded once per process, arrays memory-mapped
+    pipeline = registry.load()
+    assert registry.load('v0001') is pipeline
+    assert isinstance(pipeline.named_steps['rgs'].coef_, np.memmap)
+    X = make_listings(20, seed=1)[RECORD_COLUMNS]
+    assert np.allclose(pipeline.predict(X.copy()), trainer.pipeline.predict(X.copy()))
+
+    train(tmp_path, 5).save_model()
+    assert registry.versions() == ['v0001', 'v0002'] and registry.latest() == 'v0002'
+    registry.activate('v0001')
+    assert registry.latest() == 'v0001'
+    with pytest.raises(ValueError):
+        registry.activate('v0003')
+
+
+def test_register_path_search(tmp_path):
+    registry = ModelRegistry(tmp_path)
+    listings = make_listings()
+    alphas = np.logspace(-2, 4, 50)
+    trainer = Trainer(X=listings.drop(columns='review_scores_rating'), y=listings['review_scores_rating'],
+                      registry=str(tmp_path), search='path', alphas=alphas)
+    trainer.train(gridsearch=True)
+    trainer.save_model()
+    metadata = registry.metadata()
+    assert metadata['estimator'] == 'RidgeCV'
+    assert np.allclose(metadata['params']['alphas'], alphas)
+    assert isinstance(metadata['metrics']['cv_mse'], float)
+
+
+def test_failed_registration_leaves_nothing(tmp_path):
+    registry = ModelRegistry(tmp_path)
+    with pytest.raises(Exception):
+        registry.register(lambda X: X)
+    with pytest.raises(FileNotFoundError):
+        registry.register_file(tmp_path / 'missing.joblib')
+    assert os.listdir(tmp_path) == [] and registry.latest() is None
+
+
+def test_tampered_artifact_is_refused(tmp_path):
+    registry = ModelRegistry(tmp_path)
+    train(tmp_path, 50).save_model()
+    with open(registry.artifact(), 'ab') as f:
+        f.write(b'\0')
+    assert not registry.verify()
+    with pytest.raises(ValueError):
+        registry.load()
+
+
+def test_model_hot_swap(tmp_path):
+    registry = ModelRegistry(tmp_path)
+    train(tmp_path, 50).save_model()
+    model = Model(registry).load_model()
+    assert model.version == 'v0001' and not model.refresh()
+    X = make_listings(20, seed=1)[RECORD_COLUMNS]
+
+    # predictions keep running on their version while another one is registered and swapped in
+    scores, stop = [], threading.Event()
+    def predict():
+        while not stop.is_set():
+            version, pipeline = model.loaded
+            scores.append((version, pipeline.predict(X.copy())))
+    thread = threading.Thread(target=predict)
+    thread.start()
+    trainer = train(tmp_path, 1, seed=3)
+    trainer.save_model()
+    assert model.refresh() and model.version == 'v0002'
+    stop.set()
+    thread.join()
+
+    assert scores
+    assert np.allclose(model.predict(X.copy()), trainer.pipeline.predict(X.copy()))
+    listing = X.iloc[0].to_dict()
+    assert np.isclose(model.fast_path(listing).base_score, trainer.pipeline.predict(X.iloc[:1].copy())[0])
@@ -0,0 +1,43 @@
+# -*- coding: UTF-8 -*-
+
+# Import from standard library
+from collections import Counter
+import pandas as pd
+# Import from our lib
+from fivestar.reviews import count_reviews, merge_counts, review_bigrams
+
+
+def test_review_bigrams():
+    assert review_bigrams('Great location, and a VERY clean flat!') == ['great location', 'location clean',
+                                                                       'clean flat']
+
+
+def test_count_reviews(tmp_path):
+    clusters = pd.DataFrame({'listing_id': [1, 2, 3], 'cluster': ['a', 'a', 'b']})
+    pd.DataFrame({
+        'listing_id': [1, 2, 3, 3, 4, 1],
+        'id': range(6),
+        'comments': ['Great location', 'great location, lovely host', 'Lovely host', None,
+                     'great location', 'Quiet area'],
+    }).to_csv(tmp_path / 'reviews.csv', index=False)
+
+    counts = count_reviews(tmp_path / 'reviews.csv', clusters, chunksize=2, n_jobs=1)
+    table = {(c, q): n for c, q, n in counts.itertuples(index=False)}
+    assert table == {('All', 'great location'): 3, ('All', 'lovely host'): 2, ('All', 'location lovely'): 1,
+                     ('All', 'quiet area'): 1,
+                     ('a', 'great location'): 2, ('a', 'location lovely'): 1, ('a', 'lovely host'): 1,
+                     ('a', 'quiet area'): 1,
+                     ('b', 'lovely host'): 1}
+    parallel = count_reviews(tmp_path / 'reviews.csv', clusters, chunksize=2, n_jobs=2)
+    pd.testing.assert_frame_equal(parallel, counts)
+    assert count_reviews(tmp_path / 'reviews.csv', clusters, top=1, n_jobs=1).groupby('cluster').size().max() == 1
+
+
+def test_merge_counts_is_bounded():
+    totals = {}
+    for _ in range(10):
+        merge_counts(totals, {'a': Counter({'frequent one': 5, 'frequent two': 3,
+                                            **{f'rare {i}': 1 for i in range(_ * 10, _ * 10 + 10)}})},
+                     capacity=8)
+        assert len(totals['a']) <= 8
+    assert totals['a'].most_common(2) == [('frequent one', 50), ('frequent two', 30)]
@@ -0,0 +1,39 @@
+# -*- coding: UTF-8 -*-
+
+# Import from standard library
+import numpy as np
+import pandas as pd
+# Import from our lib
+from fivestar.clusters import clustering
+from fivestar.schema import parse_listings, downcast, memory_mb, memory_report
+from fivestar.synthetic import make_snapshot
+from fivestar.trainer import Trainer
+
+
+def test_parse_listings_types():
+    raw = make_snapshot(2000)
+    parsed = parse_listings(raw)
+    assert parsed['price'].dtype == np.float32
+    assert np.allclose(parsed['price'], raw['price'].str.strip('$').str.replace(',', '').astype(float))
+    assert parsed['host_response_rate'].dtype == np.float32
+    assert parsed['instant_bookable'].dtype == 'boolean'
+    assert parsed['instant_bookable'].tolist() == (raw['instant_bookable'] == 't').tolist()
+    assert parsed['amenities'].dtype == 'category'
+    assert parsed['amenities'].astype(object).equals(raw['amenities'])
+
+    optimized = downcast(parsed)
+    assert optimized['accommodates'].dtype == np.int8
+    assert optimized['review_scores_rating'].dtype == np.float32
+    assert memory_mb(optimized) < 0.6 * memory_mb(raw)
+    report = memory_report(raw, optimized)
+    assert report['saved_mb'].iloc[0] == report['saved_mb'].max() > 0
+
+
+def test_model_scores_parsed_and_raw_listings_alike():
+    raw = make_snapshot(3000)
+    raw = raw[raw['review_scores_rating'].notna()]
+    optimized = downcast(parse_listings(raw))
+    trainer = Trainer(X=raw.drop(columns='review_scores_rating'), y=raw['review_scores_rating'])
+    trainer.train()
+    assert np.allclose(trainer.pipeline.predict(optimized), trainer.pipeline.predict(raw))
+    pd.testing.assert_frame_equal(clustering(optimized), clustering(raw), check_dtype=False)
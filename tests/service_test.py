@@ -0,0 +1,89 @@
+# -*- coding: UTF-8 -*-
+
+# Import from standard library
+import asyncio
+import threading
+import time
+
+import numpy as np
+import pytest
+from aiohttp.test_utils import TestClient, TestServer
+# Import from our lib
+from fivestar.service import PredictionService
+
+
+def serve(fivestar, requests, **kwargs):
+    '''Runs requests(client, service) against a test server of the service'''
+    async def run():
+        service = PredictionService(fivestar, watch=False, **kwargs)
+        async with TestClient(TestServer(service.app())) as client:
+            return await requests(client, service)
+    return asyncio.run(run())
+
+
+def test_lookups(fivestar):
+    listing_id = int(fivestar.listings['id'].iloc[0])
+    cluster = fivestar.get_cluster_id(listing_id)
+
+    async def requests(client, service):
+        listing = await (await client.get(f'/listings/{listing_id}')).json()
+        assert listing['id'] == listing_id and listing['cluster'] == cluster
+        ranking = await (await client.get(f'/listings/{listing_id}/ranking')).json()
+        assert 0 < ranking['rank'] <= 1 and len(ranking['cluster_scores'])
+        averages = await (await client.get(f'/clusters/{cluster}/averages')).json()
+        assert averages['price'] == pytest.approx(fivestar.get_cluster_averages(cluster)['price'])
+        assert (await client.get('/listings/0')).status == 404
+        assert (await client.get('/clusters/nowhere/averages')).status == 404
+        assert (await (await client.get('/health')).json())['model_version'] == 'v0001'
+    serve(fivestar, requests)
+
+
+def test_concurrent_predictions_are_batched(fivestar):
+    listing_ids = [int(listing_id) for listing_id in fivestar.listings['id'].iloc[:40]]
+    values = [{'price': 50 + i, 'Wifi': 'Yes' if i % 2 else 'No'} for i in range(40)]
+
+    async def requests(client, service):
+        responses = await asyncio.gather(*(
+            client.post('/predict', json=dict(listing_id=listing_id, values=v))
+            for listing_id, v in zip(listing_ids, values)))
+        scores = [(await response.json())['score'] for response in responses]
+        # a bad request in a batch only fails itself
+        bad, good = await asyncio.gather(
+            client.post('/predict', json=dict(listing_id=listing_ids[0], values={'Wifi': 'Yes', 'amenities': 1})),
+            client.post('/predict', json=dict(listing_id=listing_ids[1], values={})))
+        assert bad.status == 400 and good.status == 200
+        assert (await client.post('/predict', json=dict(values={}))).status == 400
+        return scores, service.batcher.batches
+
+    scores, batches = serve(fivestar, requests, max_delay=0.05)
+    expected = [fivestar.predict_on_new_values(listing_id, v) for listing_id, v in zip(listing_ids, values)]
+    assert np.allclose(scores, expected)
+    assert batches < 10
+
+
+def test_lone_prediction_does_not_wait(fivestar):
+    listing_id = int(fivestar.listings['id'].iloc[0])
+
+    async def requests(client, service):
+        tic = time.perf_counter()
+        response = await client.post('/predict', json=dict(listing_id=listing_id, values={'price': 70}))
+        assert response.status == 200
+        return time.perf_counter() - tic
+
+    # nothing else is scoring: the prediction is not held for max_delay
+    assert serve(fivestar, requests, max_delay=5) < 1
+
+
+def test_ranking_runs_off_the_event_loop(fivestar, monkeypatch):
+    listing_id = int(fivestar.listings['id'].iloc[0])
+    threads = []
+
+    def ranking(*args):
+        threads.append(threading.current_thread())
+        return 0.5, 4.5, [4.0, 5.0]
+    monkeypatch.setattr('fivestar.service.get_cluster_ranking', ranking)
+
+    async def requests(client, service):
+        assert (await (await client.get(f'/listings/{listing_id}/ranking')).json())['rank'] == 0.5
+    serve(fivestar, requests)
+    assert threads and threads[0] is not threading.main_thread()
@@ -0,0 +1,30 @@
+# -*- coding: UTF-8 -*-
+
+# Import from our lib
+from fivestar.data import get_data
+from fivestar.params import LISTINGS_COLUMNS
+from fivestar.synthetic import make_snapshot, write_snapshot
+from fivestar.utils import parse_prices
+
+
+def test_make_snapshot_columns():
+    listings = make_snapshot(1000, boroughs=3)
+    assert list(listings.columns) == LISTINGS_COLUMNS
+    assert listings['id'].is_unique
+    assert listings['neighbourhood_cleansed'].nunique() == 3
+    assert parse_prices(listings['price']).notna().all()
+    assert listings['amenities'].str.match(r'^\{.*\}$').all()
+
+
+def test_write_snapshot_round_trips_through_get_data(tmp_path, monkeypatch):
+    # parsed copies go to the test's directory, not the user's cache
+    monkeypatch.setattr('fivestar.data.CACHE_PATH', str(tmp_path / 'cache'))
+    write_snapshot(tmp_path, 2000, boroughs=5)
+    path = f'{tmp_path}/'
+    listings = get_data(path=path, cache=False)
+    clusters = get_data('clusters', path=path)
+    wordcount = get_data('wordcount', path=path)
+    assert list(listings.columns) == LISTINGS_COLUMNS
+    assert 0 < len(listings) < 2000
+    assert len(clusters) == 2000
+    assert set(wordcount['cluster']) == set(clusters['cluster'].dropna()) | {'All'}
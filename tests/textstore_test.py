@@ -0,0 +1,68 @@
+# -*- coding: UTF-8 -*-
+
+# Import from standard library
+import os
+
+import pandas as pd
+# Import from our lib
+from fivestar.data import clear_datasets, get_data, load_text_store
+from fivestar.params import TEXT_COLUMNS
+from fivestar.synthetic import make_snapshot, write_snapshot
+from fivestar.textstore import TextStore, split_listings
+
+
+def test_text_store_lookups(tmp_path):
+    listings = make_snapshot(500)
+    hot, texts = split_listings(listings, str(tmp_path / 'texts'))
+    assert not set(TEXT_COLUMNS) & set(hot.columns)
+    assert len(texts) == 500
+
+    for row in listings.sample(20, random_state=0).itertuples(index=False):
+        record = texts.get(row.id)
+        for column in TEXT_COLUMNS:
+            value = getattr(row, column)
+            assert record[column] == (None if pd.isna(value) else value)
+    assert texts.get(-1) is None and -1 not in texts
+    assert TextStore(str(tmp_path / 'texts')).get(int(listings['id'].iloc[0])) == texts.get(listings['id'].iloc[0])
+
+
+def test_text_store_first_duplicate_wins(tmp_path):
+    chunks = [pd.DataFrame({'id': [3, 1], 'summary': ['three', None]}),
+              pd.DataFrame({'id': [3, 2], 'summary': ['again', 'two €']})]
+    texts = TextStore.build(chunks, str(tmp_path / 'texts'), ['summary'])
+    assert texts.ids.tolist() == [1, 2, 3]
+    assert [texts.get(i)['summary'] for i in [1, 2, 3]] == [None, 'two €', 'three']
+
+
+def test_load_text_store(tmp_path):
+    write_snapshot(tmp_path, 300)
+    path = f'{tmp_path}/'
+    clear_datasets()
+    texts = load_text_store(path, cache_path=str(tmp_path / 'cache'))
+    assert load_text_store(path, cache_path=str(tmp_path / 'cache')) is texts
+
+    hot = get_data(path=path, text=False, cache=False)
+    full = get_data(path=path, cache=False)
+    assert not set(TEXT_COLUMNS) & set(hot.columns)
+    row = full[full['summary'].notna()].iloc[0]
+    assert texts.get(row['id'])['summary'] == row['summary']
+    clear_datasets()
+
+
+def test_text_stores_of_other_snapshots_are_kept(tmp_path):
+    cache_path = str(tmp_path / 'cache')
+    write_snapshot(tmp_path / 'a', 300)
+    write_snapshot(tmp_path / 'b', 200, seed=1)
+    clear_datasets()
+    a = load_text_store(f'{tmp_path}/a/', cache_path=cache_path)
+    b = load_text_store(f'{tmp_path}/b/', cache_path=cache_path)
+    assert TextStore.exists(a.path) and TextStore.exists(b.path) and len(a) == 300
+
+    # a new version of a csv replaces its own store only
+    clear_datasets()
+    with open(tmp_path / 'a' / 'listings.csv', 'a') as f:
+        f.write('\n')
+    a2 = load_text_store(f'{tmp_path}/a/', cache_path=cache_path)
+    assert a2.path != a.path and not TextStore.exists(a.path) and TextStore.exists(b.path)
+    assert len(os.listdir(tmp_path / 'cache' / 'text')) == 4
+    clear_datasets()
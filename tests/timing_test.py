@@ -0,0 +1,56 @@
+# -*- coding: UTF-8 -*-
+
+# Import from standard library
+import json
+import numpy as np
+# Import from our lib
+from fivestar.timing import Histogram, TimingRegistry
+
+
+def test_histogram_quantiles():
+    histogram = Histogram()
+    samples = np.random.default_rng(0).lognormal(np.log(2e-4), 1, 10000)
+    for seconds in samples:
+        histogram.add(seconds)
+    assert histogram.count == 10000
+    assert np.isclose(histogram.total, samples.sum())
+    for q in [.5, .95, .99]:
+        # buckets are about 12% wide
+        assert abs(histogram.quantile(q) / np.quantile(samples, q) - 1) < .13
+    assert histogram.quantile(1) == samples.max()
+    assert np.isnan(Histogram().quantile(.5))
+
+
+def test_spans_and_timed_functions():
+    timings = TimingRegistry(enabled=True)
+
+    @timings.timed('double')
+    def double(x):
+        return 2 * x
+
+    assert [double(x) for x in range(5)] == [0, 2, 4, 6, 8]
+    with timings.span('block'):
+        pass
+    try:
+        with timings.span('failing'):
+            raise ValueError
+    except ValueError:
+        pass
+
+    snapshot = timings.snapshot()
+    assert sorted(snapshot) == ['block', 'double', 'failing']
+    assert snapshot['double']['count'] == 5
+    assert snapshot['double']['p50_ms'] <= snapshot['double']['p99_ms'] <= snapshot['double']['max_ms']
+    assert json.loads(timings.to_json()) == snapshot
+    assert timings.report().splitlines()[0].startswith('span')
+
+    timings.reset()
+    assert timings.snapshot() == {}
+
+
+def test_disabled_registry_records_nothing():
+    timings = TimingRegistry(enabled=False)
+    assert timings.timed()(abs)(-1) == 1
+    with timings.span('block'):
+        pass
+    assert timings.snapshot() == {}
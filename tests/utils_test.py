@@ -0,0 +1,22 @@
+# -*- coding: UTF-8 -*-
+
+# Import from standard library
+import pandas as pd
+# Import from our lib
+from fivestar.utils import amenity_index, has_amenity, count_amenity
+
+
+AMENITIES = pd.DataFrame({'amenities': ['{TV,Wifi,Sauna}', '{Wifi,"Hair dryer"}', '{}', '{Sauna,TV,TV}']},
+                         index=[5, 6, 7, 8])
+
+
+def test_amenity_index():
+    index = amenity_index(AMENITIES['amenities'])
+    assert sorted(index) == ['hair dryer', 'sauna', 'tv', 'wifi']
+    assert index['tv'].tolist() == [0, 3]
+    assert index['wifi'].tolist() == [0, 1]
+
+
+def test_has_amenity():
+    assert has_amenity(AMENITIES, 'Sauna')['has_Sauna'].tolist() == [1, 0, 0, 1]
+    assert count_amenity(AMENITIES, 'hair dryer') == 1